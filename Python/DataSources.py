@@ -0,0 +1,300 @@
+"""Sources of MS430 data for the graph viewer.
+
+This file defines classes which each read data from one source (a serial
+port, logged data files, or the Raspberry Pi I2C bus) in a background
+thread, and put the decoded data in a queue. The graph viewer takes all
+waiting data from the queue of each source at each update, so reading
+and decoding never delay the display, and several sources can be shown
+together (see "graph_viewer_multiple.py").
+
+This is designed to run with Python 3 on multiple operating systems.
+The I2C source is only available on a Raspberry Pi.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import time
+import queue
+import threading
+from datetime import datetime
+import numpy as np
+import serial
+from GraphViewer import dataNameIndex
+import Raspberry_Pi.sensor_package.sensor_constants as const
+from Raspberry_Pi.sensor_package.log_archive import LogArchive
+import Raspberry_Pi.sensor_package.sensor_functions as sensor
+from Raspberry_Pi.sensor_package.pipeline import Pipeline
+try:
+    # The hardware modules used by sensor.SensorHardwareSetup(), which
+    # are only available on a Raspberry Pi
+    import RPi.GPIO  # noqa: F401
+    import smbus  # noqa: F401
+    raspberry_pi = True
+except (ImportError, RuntimeError):
+    raspberry_pi = False
+
+
+class DataSource:
+    """Read data in a background thread and put them in a queue.
+
+    A derived class must implement read(), which runs in the thread, and
+    set data_required to (air_quality_data, particle_data, flag_data)
+    (see GraphViewer.setDataRequired()) before putting data in the queue.
+    Each set of values then contains the variables dataNameIndex(
+    *data_required), in that order.
+    """
+
+    def __init__(self, name):
+        """Create the queue and the thread, which is started by start()."""
+        self.name = name
+        self.data_required = None
+        # Each queue item is a (times, values) batch of data: an array of
+        # times, in seconds since the epoch, and an array with one row of
+        # values per time. The last item is an exception if reading fails.
+        self.queue = queue.SimpleQueue()
+        self.stopping = threading.Event()
+        self.finished = False
+        self.thread = threading.Thread(target=self.run, daemon=True,
+                                       name="source-" + name)
+
+    def start(self):
+        """Start reading data."""
+        self.thread.start()
+
+    def stop(self, timeout=1):
+        """Stop reading data, if started."""
+        self.stopping.set()
+        if self.thread.ident is not None:
+            self.thread.join(timeout)
+
+    def takeData(self):
+        """Get a list of the waiting (times, values) batches of data.
+
+        Raises the exception which stopped the reading, after any data
+        which were read before it.
+        """
+        batches = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return batches
+            if isinstance(item, Exception):
+                if batches:
+                    # Raise it at the next call
+                    self.queue.put(item)
+                    return batches
+                raise item
+            batches.append(item)
+
+    def putData(self, times, values):
+        """Add a batch of data to the queue."""
+        self.queue.put((np.asarray(times, dtype=float),
+                        np.asarray(values, dtype=float)))
+
+    def run(self):
+        """Read data until stopped, keeping any exception."""
+        try:
+            self.read()
+        except Exception as e:
+            if not self.stopping.is_set():
+                self.queue.put(e)
+        self.finished = True
+
+    def read(self):
+        """Read data until stopped: override this in a derived class."""
+        raise NotImplementedError("Override this method in a derived class")
+
+
+class SerialSource(DataSource):
+    """Read data printed as columns by a microcontroller, over serial.
+
+    The microcontroller runs cycle_readout.ino or on_demand_readout.ino,
+    with printDataAsColumns = true. The variables are found from the
+    number of columns.
+    """
+
+    # The number of columns for each setting of data_required
+    data_required_by_columns = {15: (False, False, True),
+                                18: (False, True, True),
+                                19: (True, False, True),
+                                22: (True, True, True)}
+
+    def __init__(self, port_name, name=None):
+        """Open the serial port, e.g. "COM1" or "/dev/ttyACM0"."""
+        super().__init__(port_name if name is None else name)
+        self.serial_port = serial.Serial(
+            port=port_name,
+            baudrate=9600,
+            parity=serial.PARITY_NONE,
+            stopbits=serial.STOPBITS_ONE,
+            bytesize=serial.EIGHTBITS,
+            timeout=0.5)
+        self.initial_discard_lines = 2
+
+    def read(self):
+        """Read lines from the serial port, until stopped."""
+        discard_lines = self.initial_discard_lines
+        partial_line = b''
+        while not self.stopping.is_set():
+            # Wait for a line (up to the port timeout), then also take any
+            # other lines which are already waiting
+            lines = [self.serial_port.readline()]
+            while self.serial_port.in_waiting:
+                lines.append(self.serial_port.readline())
+            read_time = datetime.now().timestamp()
+            rows = []
+            for line in lines:
+                line = partial_line + line
+                if not line.endswith(b'\n'):
+                    # The port timed out: wait for the rest of the line
+                    partial_line = line
+                    continue
+                partial_line = b''
+                if discard_lines > 0:
+                    discard_lines -= 1
+                    continue
+                try:
+                    values = [float(s) for s in line.decode('utf-8').split()]
+                except (UnicodeDecodeError, ValueError):
+                    continue
+                if not values:
+                    continue
+                if self.data_required is None:
+                    if len(values) not in self.data_required_by_columns:
+                        # e.g. a partial line: the first complete line
+                        # sets the variables
+                        continue
+                    self.data_required = self.data_required_by_columns[
+                        len(values)]
+                    self.column_count = len(values)
+                if len(values) == self.column_count:
+                    rows.append(values)
+            if rows:
+                self.putData([read_time] * len(rows), rows)
+
+    def stop(self, timeout=1):
+        """Stop reading data and close the serial port."""
+        super().stop(timeout)
+        self.serial_port.close()
+
+
+class LogPlaybackSource(DataSource):
+    """Replay data from the files written by log_data_to_file.py.
+
+    The data are replayed from the start time to the end time, as if they
+    were being measured, at a chosen speed. Gaps in the data (e.g. when
+    logging was stopped) which are longer than max_gap_seconds are
+    skipped.
+    """
+
+    def __init__(self, directory, start=None, end=None, speed=1,
+                 name=None, max_gap_seconds=3600):
+        """Open the data files (see log_archive.py).
+
+        start, end: the date and time at which to start and end, as text
+                    like "2023-06-01 12:00", or None for the first/last
+                    data
+        speed: the number of seconds of data to replay per second
+        """
+        super().__init__(directory if name is None else name)
+        self.archive = LogArchive(directory)
+        if len(self.archive) == 0:
+            raise RuntimeError("No data files found in " + directory)
+        self.speed = speed
+        self.max_gap_seconds = max_gap_seconds
+        (first_time, last_time) = self.archive.time_range()
+        self.start_time = (first_time if start is None
+                           else datetime.fromisoformat(start).timestamp())
+        self.end_time = (last_time if end is None
+                         else datetime.fromisoformat(end).timestamp())
+        particle_column = self.archive.column_index('concentration')
+        particle_data = not np.all(np.isnan(
+            self.archive.rows(0, len(self.archive))[:, particle_column]))
+        self.data_required = (True, particle_data, True)
+        # The data file columns are in the same order as the variable
+        # names, so the archive column of each variable is:
+        self.columns = [1 + i for i in dataNameIndex(*self.data_required)]
+        # The time of the newest data replayed
+        self.playback_time = self.start_time
+
+    def read(self):
+        """Replay the data in time steps, until finished or stopped."""
+        (next_row, end_row) = self.archive.find(self.start_time,
+                                                self.end_time)
+        clock_time = time.monotonic()
+        while (next_row < end_row) and not self.stopping.wait(0.02):
+            now = time.monotonic()
+            self.playback_time += self.speed * (now - clock_time)
+            clock_time = now
+            next_time = self.archive.times[next_row]
+            if (next_time - self.playback_time) > self.max_gap_seconds:
+                self.playback_time = next_time
+            row = min(end_row, self.archive.find(self.playback_time,
+                                                 self.playback_time)[1])
+            if row > next_row:
+                rows = self.archive.rows(next_row, row)
+                self.putData(rows[:, 0], rows[:, self.columns])
+                next_row = row
+
+
+class I2CSource(DataSource):
+    """Read data from an MS430 connected to the Raspberry Pi I2C bus.
+
+    The MS430 is used in cycle mode, with the settings (including the
+    particle sensor) in Raspberry_Pi/sensor_package/sensor_functions.py.
+    """
+
+    def __init__(self, name="Raspberry Pi",
+                 cycle_period=const.CYCLE_PERIOD_3_S):
+        """Check that the I2C bus can be used."""
+        if not raspberry_pi:
+            raise RuntimeError("The I2C source needs a Raspberry Pi")
+        super().__init__(name)
+        self.cycle_period = cycle_period
+        self.particle_data = (sensor.PARTICLE_SENSOR
+                              != const.PARTICLE_SENSOR_OFF)
+        self.data_required = (True, self.particle_data, True)
+        self.pipeline = Pipeline()
+        self.pipeline.add_sink(name, self.putSnapshot)
+
+    def read(self):
+        """Set up the MS430, then read its data until stopped."""
+        (GPIO, I2C_bus) = sensor.SensorHardwareSetup()
+        I2C_bus.write_i2c_block_data(
+            sensor.i2c_7bit_address,
+            const.PARTICLE_SENSOR_SELECT_REG, [sensor.PARTICLE_SENSOR])
+        I2C_bus.write_i2c_block_data(
+            sensor.i2c_7bit_address, const.CYCLE_TIME_PERIOD_REG,
+            [self.cycle_period])
+        I2C_bus.write_byte(sensor.i2c_7bit_address, const.CYCLE_MODE_CMD)
+        self.pipeline.run(GPIO, I2C_bus)
+
+    def putSnapshot(self, snapshot):
+        """Put the data read by the pipeline in the queue."""
+        air_data = snapshot['air_data']
+        air_quality_data = snapshot['air_quality_data']
+        sound_data = snapshot['sound_data']
+        values = ([air_data['T'], air_data['P_Pa'], air_data['H_pc'],
+                   air_data['G_ohm'], air_quality_data['AQI'],
+                   air_quality_data['CO2e'], air_quality_data['bVOC'],
+                   air_quality_data['AQI_accuracy'],
+                   snapshot['light_data']['illum_lux'],
+                   snapshot['light_data']['white'], sound_data['SPL_dBA']]
+                  + list(sound_data['SPL_bands_dB'])
+                  + [sound_data['peak_amp_mPa'], sound_data['stable']])
+        if self.particle_data:
+            particle_data = snapshot['particle_data']
+            values += [particle_data['duty_cycle_pc'],
+                       particle_data['concentration'],
+                       particle_data['valid']]
+        self.putData([snapshot['time']], [values])
+
+    def stop(self, timeout=1):
+        """Stop reading data."""
+        self.pipeline.stop(timeout)
+        super().stop(timeout)
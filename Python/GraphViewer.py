@@ -22,31 +22,119 @@ packages (pyqtgraph and PyQt5).
 
 from PyQt5 import QtCore
 from PyQt5.QtWidgets import QMainWindow, QWidget, QGridLayout
+import numpy as np
 import pyqtgraph as pg
-from collections import deque
 import Raspberry_Pi.sensor_package.sensor_constants as const
 
 
+class RingBuffer:
+    """Store the most recent rows of values in a preallocated numpy array.
+
+    Each variable has a row of twice the buffer length, and each new
+    value is written at two positions, one buffer length apart. The
+    stored values of each variable are therefore always a contiguous
+    array slice, in time order, which is used for plotting without
+    copying. A slice is only valid until the next append.
+    """
+
+    def __init__(self, length, variable_count=1):
+        """Create an empty buffer.
+
+        length: the maximum number of values of each variable
+        variable_count: the number of values in each appended set
+        """
+        self.length = length
+        self.data = np.zeros((variable_count, 2 * length))
+        self.next_index = 0
+        self.count = 0
+        # The total number of sets of values appended
+        self.appended = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, values):
+        """Add one value of each variable, replacing the oldest if full."""
+        self.data[:, self.next_index] = values
+        self.data[:, self.next_index + self.length] = values
+        self.next_index = (self.next_index + 1) % self.length
+        self.count = min(self.count + 1, self.length)
+        self.appended += 1
+
+    def extend(self, values):
+        """Add several sets of values, replacing the oldest if full.
+
+        values: an array with one row per variable and one column per set
+        """
+        values = np.reshape(values, (self.data.shape[0], -1))
+        self.appended += values.shape[1]
+        values = values[:, -self.length:]
+        indices = (self.next_index + np.arange(values.shape[1])) % self.length
+        self.data[:, indices] = values
+        self.data[:, indices + self.length] = values
+        self.next_index = (self.next_index + values.shape[1]) % self.length
+        self.count = min(self.count + values.shape[1], self.length)
+
+    def view(self, variable=0):
+        """Get the stored values of one variable, oldest first."""
+        end = self.next_index + self.length
+        return self.data[variable, (end - self.count):end]
+
+    def latest(self):
+        """Get an array of the newest value of each variable."""
+        return self.data[:, self.next_index + self.length - 1]
+
+
+def dataNameIndex(air_quality_data, particle_data, flag_data):
+    """Get the list of the variables which are available.
+
+    The variables are given as indices of GraphViewer.data_names_units,
+    in the order in which their values are printed or logged.
+    """
+    data_name_index = list(range(0, 4))
+    if air_quality_data:
+        data_name_index += list(range(4, 8))
+    data_name_index += list(range(8, 18))
+    if flag_data:
+        data_name_index.append(18)
+    if particle_data:
+        data_name_index += list(range(19, 21))
+        if flag_data:
+            data_name_index.append(21)
+    return data_name_index
+
+
 class GraphViewer(QMainWindow):
     """Real-time graphical display of MS430 data."""
 
     def __init__(self, data_buffer_length,
-                 particle_sensor_type, use_fahrenheit):
+                 particle_sensor_type, use_fahrenheit, graphs_vertical=2,
+                 graphs_horizontal=2, series_names=None):
         """Set up a grid layout of data graphs.
 
         data_buffer_length: number of data points stored/displayed
+        graphs_vertical, graphs_horizontal: grid size
+        series_names: None to show data from one source, or a list of
+                      names of data sources to show on the same graphs
+                      (e.g. several sensor boards)
         """
         super().__init__()
 
         self.buffer_samples = data_buffer_length
+        self.graphs_vertical = graphs_vertical
+        self.graphs_horizontal = graphs_horizontal
+        self.series_names = series_names
 
-        # graphs_vertical, graphs_horizontal: grid size
-        self.graphs_vertical = 2
-        self.graphs_horizontal = 2
-
-        # Time delay (milliseconds) between graph updates
+        # Time delay (milliseconds) between graph updates. The updates
+        # are started at this interval, whatever time each one takes.
         self.update_time_period_ms = 20
 
+        # Only draw the data inside the visible range, and reduce the
+        # number of points drawn (keeping the peaks) when there are many
+        # more points than pixels
+        self.clip_to_view = True
+        self.auto_downsample = True
+
         # Appearance settings:
         self.pen_style = pg.mkPen(color="y", width=2,
                                   style=QtCore.Qt.PenStyle.SolidLine)
@@ -56,6 +144,8 @@ class GraphViewer(QMainWindow):
         self.axis_label_style = {'color': 'w', 'font-size': '11pt'}
         self.x_grid = False
         self.y_grid = False
+        # Make all line graphs show the same time range
+        self.link_x_axes = series_names is not None
         self.data_names_units = {'Temperature': '',
                                  'Pressure': 'Pa', 'Humidity': '%',
                                  'Gas sensor resistance': "\u03A9",
@@ -87,7 +177,18 @@ class GraphViewer(QMainWindow):
         #                        selected by each combobox menu.
         self.displayed_combo_index = []
         self.selected_combo_index = []
-        self.time_data = deque(maxlen=self.buffer_samples)
+        # Each data source (series) has its own buffers of times and data.
+        # time_data and data_buffer are those of the first series.
+        self.series_count = 1 if series_names is None else len(series_names)
+        if self.series_count == 1:
+            self.series_pens = [self.pen_style]
+        else:
+            self.series_pens = [
+                pg.mkPen(color=pg.intColor(i, hues=self.series_count),
+                         width=2) for i in range(self.series_count)]
+        self.time_buffers = [RingBuffer(self.buffer_samples)
+                             for i in range(self.series_count)]
+        self.time_data = self.time_buffers[0]
         self.setWindowTitle('Waiting for data...')
         self.createUI()
 
@@ -100,6 +201,8 @@ class GraphViewer(QMainWindow):
         self.plot_handles = []
         self.combos = []
         self.is_bar_chart = []
+        # The dataCount() value when each graph was last drawn
+        self.drawn_data_count = []
         for nv in range(self.graphs_vertical):
             for nh in range(self.graphs_horizontal):
                 GLW = pg.GraphicsLayoutWidget()
@@ -109,35 +212,40 @@ class GraphViewer(QMainWindow):
                 self.widget.layout().addWidget(GLW, (2*nv)+1, nh)
                 new_plot = GLW.addPlot()
                 self.plot_items.append(new_plot)
+                if self.series_count > 1:
+                    new_plot.addLegend(offset=(1, 1))
+                # One line (or set of bars) for each series
                 self.plot_handles.append(
-                    new_plot.plot(pen=self.pen_style, symbol=None,
-                                  axisItems={'bottom': pg.DateAxisItem()}))
+                    [new_plot.plot(pen=pen, symbol=None,
+                                   name=self.seriesName(i))
+                     for (i, pen) in enumerate(self.series_pens)])
                 self.formatPlotItem(new_plot)
                 self.is_bar_chart.append(False)
+                self.drawn_data_count.append(None)
 
     def setDataRequired(self, air_quality_data, particle_data, flag_data):
         """Indicate which variables from the name list will be available."""
-        self.data_name_index = list(range(0, 4))
-        if air_quality_data:
-            self.data_name_index += list(range(4, 8))
-            self.band1_index = 11
-        else:
-            self.band1_index = 7
-        self.data_name_index += list(range(8, 18))
-        if flag_data:
-            self.data_name_index.append(18)
-        if particle_data:
-            self.data_name_index += list(range(19, 21))
-        if flag_data:
-            self.data_name_index.append(21)
+        self.data_name_index = dataNameIndex(air_quality_data,
+                                             particle_data, flag_data)
+        # The data buffer position of the first sound frequency band
+        self.band1_index = self.data_name_index.index(11)
         self.createDataBuffer()
         self.initializeComboBoxes()
 
     def start(self):
         """Begin the periodic updating of the GUI."""
+        self.update_timer = QtCore.QTimer()
+        self.update_timer.timeout.connect(self.updateLoop)
+        self.update_timer.start(self.update_time_period_ms)
         self.updateLoop()
         self.show()
 
+    def seriesName(self, series):
+        """Get the name of a series, or None if there is only one."""
+        if self.series_names is None:
+            return None
+        return self.series_names[series]
+
     def setParticleUnits(self, particle_sensor_type):
         """Set the particulate unit, depending on hardware (if any)."""
         if particle_sensor_type == const.PARTICLE_SENSOR_SDS011:
@@ -157,6 +265,8 @@ class GraphViewer(QMainWindow):
     def formatPlotItem(self, item):
         """Adjust plot appearance."""
         item.setMenuEnabled(False)
+        item.setClipToView(self.clip_to_view)
+        item.setDownsampling(auto=self.auto_downsample, mode='peak')
         item.showGrid(x=self.x_grid, y=self.y_grid)
         item.getAxis("left").setPen(pg.mkPen(self.axis_color))
         item.getAxis("bottom").setPen(pg.mkPen(self.axis_color))
@@ -176,7 +286,6 @@ class GraphViewer(QMainWindow):
         need_update = need_update or self.getDataFunction()
         if (need_update):
             self.updateGraphs()
-        QtCore.QTimer.singleShot(self.update_time_period_ms, self.updateLoop)
 
     def getDataFunction(self):
         """Obtain new data (hardware-dependent) and put in data_buffer.
@@ -186,9 +295,21 @@ class GraphViewer(QMainWindow):
         raise NotImplementedError("Override this method in a derived class")
 
     def createDataBuffer(self):
-        """Store data for each graph in a deque."""
-        self.data_buffer = [deque(maxlen=self.buffer_samples)
-                            for i in range(len(self.data_name_index))]
+        """Store data for all graphs in a ring buffer for each series.
+
+        Each set of data is added with self.data_buffer.append(values),
+        followed by self.time_data.append(timestamp), or with
+        self.data_buffers[series] and self.time_buffers[series] if there
+        is more than one series.
+        """
+        self.data_buffers = [RingBuffer(self.buffer_samples,
+                                        len(self.data_name_index))
+                             for i in range(self.series_count)]
+        self.data_buffer = self.data_buffers[0]
+
+    def dataCount(self):
+        """Get a tuple of the number of sets of data added to each series."""
+        return tuple(buffer.appended for buffer in self.time_buffers)
 
     def initializeComboBoxes(self):
         """Fill the ComboBoxes and set the initial selected values."""
@@ -198,17 +319,29 @@ class GraphViewer(QMainWindow):
         combo_items[self.sound_band_name] = len(combo_items)
         for n, combo in enumerate(self.combos):
             combo.setItems(combo_items)
-            start_index = n
+            start_index = n % len(combo_items)
             if (n == 0):  # Set first plot to be a bar chart
                 start_index = combo_items[self.sound_band_name]
             self.selected_combo_index.append(start_index)
             combo.setValue(start_index)
             combo.currentIndexChanged.connect(self.funcCreator(n, combo))
         self.displayed_combo_index = self.selected_combo_index.copy()
+        self.linkXAxes()
 
     def updateGraphs(self):
-        """Draw new data on the graphs and update the text label titles."""
+        """Draw new data on the graphs and update the text label titles.
+
+        Graphs which already show the newest data are not redrawn.
+        """
+        data_count = self.dataCount()
+        if not any(data_count):
+            return
         for n in range(len(self.plot_handles)):
+            if ((self.displayed_combo_index[n]
+                 == self.selected_combo_index[n])
+                    and (self.drawn_data_count[n] == data_count)):
+                continue
+            self.drawn_data_count[n] = data_count
             self.displayed_combo_index[n] = self.selected_combo_index[n]
             bar_chart = (self.displayed_combo_index[n]
                          >= len(self.data_name_index))
@@ -216,40 +349,76 @@ class GraphViewer(QMainWindow):
                 # Chart type has just changed: initialize new type:
                 self.changeChartType(n, bar_chart)
             if bar_chart:
-                new_data = [self.data_buffer[i][-1] for i in range(
-                            self.band1_index,
-                            self.band1_index + self.sound_band_number)]
-                self.plot_handles[n].setOpts(height=new_data)
+                for (i, handle) in enumerate(self.plot_handles[n]):
+                    if len(self.time_buffers[i]) > 0:
+                        new_data = self.data_buffers[i].latest()[
+                            self.band1_index:(self.band1_index
+                                              + self.sound_band_number)]
+                        handle.setOpts(height=new_data)
             else:  # Line graph of single variable
                 ind = self.data_name_index[self.displayed_combo_index[n]]
-                self.plot_items[n].setTitle(
-                    list(self.data_names_units.keys())[ind]
-                    + " = {:.{dps}f} ".format(
-                        self.data_buffer[self.displayed_combo_index[n]][-1],
-                        dps=self.decimal_places[ind])
-                    + list(self.data_names_units.values())[ind],
-                    color=self.title_color, size=self.title_size)
-                self.plot_handles[n].setData(
-                    self.time_data,
-                    self.data_buffer[self.displayed_combo_index[n]])
+                title = list(self.data_names_units.keys())[ind]
+                unit = list(self.data_names_units.values())[ind]
+                for (i, handle) in enumerate(self.plot_handles[n]):
+                    (x, y) = self.lineData(n, self.displayed_combo_index[n],
+                                           i)
+                    handle.setData(x, y, skipFiniteCheck=True)
+                    if (self.series_count == 1) and (len(y) > 0):
+                        # Show the last value drawn
+                        title += " = {:.{dps}f} ".format(
+                            y[-1], dps=self.decimal_places[ind]) + unit
+                if (self.series_count > 1) and unit:
+                    title += " / " + unit
+                self.plot_items[n].setTitle(title, color=self.title_color,
+                                            size=self.title_size)
+
+    def lineData(self, plot_index, variable_index, series=0):
+        """Get the (time, value) arrays to draw on a line graph."""
+        return (self.time_buffers[series].view(),
+                self.data_buffers[series].view(variable_index))
 
     def changeChartType(self, plot_index, is_bar_chart):
         """Switch between bar chart (for sound frequencies) and line graph."""
-        self.plot_items[plot_index].removeItem(self.plot_handles[plot_index])
-        self.plot_handles[plot_index].deleteLater()
+        for handle in self.plot_handles[plot_index]:
+            self.plot_items[plot_index].removeItem(handle)
+            handle.deleteLater()
         self.is_bar_chart[plot_index] = is_bar_chart
+        self.linkXAxes()
         if is_bar_chart:
-            self.plot_handles[plot_index] = pg.BarGraphItem(
-                x=list(range(self.sound_band_number)),
-                height=[0]*self.sound_band_number,
-                width=0.9, brush="r")
-            self.plot_items[plot_index].addItem(self.plot_handles[plot_index])
+            # The bars of each series are side by side
+            width = 0.9 / self.series_count
+            self.plot_handles[plot_index] = []
+            for i in range(self.series_count):
+                offset = width * (i - ((self.series_count - 1) / 2))
+                bars = pg.BarGraphItem(
+                    x=[n + offset for n in range(self.sound_band_number)],
+                    height=[0]*self.sound_band_number, width=width,
+                    brush=("r" if self.series_count == 1
+                           else self.series_pens[i].color()),
+                    name=self.seriesName(i))
+                self.plot_items[plot_index].addItem(bars)
+                self.plot_handles[plot_index].append(bars)
             self.formatBarChart(self.plot_items[plot_index])
         else:  # Line graph of single variable
-            self.plot_handles[plot_index] = self.plot_items[plot_index].plot(
-                pen=self.pen_style, symbol=None)
+            self.plot_handles[plot_index] = [
+                self.plot_items[plot_index].plot(
+                    pen=pen, symbol=None, name=self.seriesName(i))
+                for (i, pen) in enumerate(self.series_pens)]
             self.adjustAxes(self.plot_items[plot_index])
 
+    def linkXAxes(self):
+        """Link the time axes of the line graphs, if chosen."""
+        if not self.link_x_axes:
+            return
+        line_graphs = [item for (item, bar_chart) in
+                       zip(self.plot_items, self.is_bar_chart)
+                       if not bar_chart]
+        for (item, bar_chart) in zip(self.plot_items, self.is_bar_chart):
+            if bar_chart or (item is line_graphs[0]):
+                item.setXLink(None)
+            else:
+                item.setXLink(line_graphs[0])
+
     def adjustAxes(self, item):
         """Format the line graph axis settings."""
         item.getAxis("bottom").setTicks(None)
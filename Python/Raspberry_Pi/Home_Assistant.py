@@ -8,6 +8,13 @@ Data are sent at regular intervals over your local network, can be
 viewed on the Home Assistant dashboard, and can be used to control
 home automation tasks. More setup information is provided in the
 Readme and User Guide.
+
+The data can be sent using either HTTP requests to Home Assistant, or
+an MQTT broker (which requires the paho-mqtt package). MQTT is better
+when many sensor boards send data to one Home Assistant installation.
+
+To reduce network traffic, each value is only sent when it has changed
+by a chosen amount, or when it has not been sent for a chosen time.
 """
 
 #  Copyright 2020-2023 Metriful Ltd.
@@ -16,10 +23,13 @@ Readme and User Guide.
 #  For code examples, datasheet and user guide, visit
 #  https://github.com/metriful/sensor
 
-import requests
 import time
 import sensor_package.sensor_functions as sensor
 import sensor_package.sensor_constants as const
+from sensor_package.home_assistant import (HomeAssistantPublisher,
+                                           HomeAssistantMQTTPublisher,
+                                           sensor_entities, sensor_values)
+from sensor_package.report_filter import ReportFilter
 
 #########################################################
 # USER-EDITABLE SETTINGS
@@ -43,6 +53,42 @@ HOME_ASSISTANT_IP = "192.168.43.144"
 # Security access token: the Readme and User Guide explain how to get this
 LONG_LIVED_ACCESS_TOKEN = "PASTE YOUR TOKEN HERE WITHIN QUOTES"
 
+# Choose whether to send data by MQTT instead of HTTP requests. The MQTT
+# integration must be set up in Home Assistant: the access token above
+# is then not used, and the sensor entities are created automatically.
+use_MQTT = False
+
+if use_MQTT:
+    # The IP address of the MQTT broker (often the Home Assistant
+    # computer), and a broker user name and password (or None)
+    MQTT_BROKER_IP = "192.168.43.144"
+    MQTT_USERNAME = None
+    MQTT_PASSWORD = None
+    # The MQTT quality of service: 0 (fastest, but messages may be lost),
+    # 1 (messages arrive at least once) or 2 (exactly once)
+    MQTT_QOS = 1
+
+# Choose whether to send only the values which have changed by more than
+# a "deadband" amount since they were last sent. Each value is still sent
+# at least once every max_silence_seconds, and not more often than once
+# every min_interval_seconds. Set this False to send all values in every
+# cycle.
+send_changes_only = True
+max_silence_seconds = 600
+min_interval_seconds = 0
+
+# The deadband of each value, as an absolute change, or as a fraction of
+# the last sent value ("relative"). Values which are not listed here are
+# sent whenever their displayed value changes.
+deadbands = {'Pressure': dict(absolute=10),
+             'Humidity': dict(absolute=1),
+             'Temperature': dict(absolute=0.2),
+             'Illuminance': dict(relative=0.1),
+             'Sound level': dict(absolute=2),
+             'Sound peak': dict(relative=0.25),
+             'Air Quality Index': dict(absolute=5),
+             'Particle concentration': dict(relative=0.1)}
+
 # END OF USER-EDITABLE SETTINGS
 #########################################################
 
@@ -58,6 +104,33 @@ I2C_bus.write_i2c_block_data(sensor.i2c_7bit_address,
 
 #########################################################
 
+# The names, units, icons and decimal places of the Home Assistant
+# entities (see sensor_package/home_assistant.py)
+entities = sensor_entities()
+
+if use_MQTT:
+    # The publisher keeps its connection to the broker open, and sends
+    # each set of data as one message. Data are buffered if the
+    # connection is lost, and sent when it returns.
+    publisher = HomeAssistantMQTTPublisher(MQTT_BROKER_IP, SENSOR_NAME,
+                                           entities, username=MQTT_USERNAME,
+                                           password=MQTT_PASSWORD,
+                                           qos=MQTT_QOS)
+else:
+    # The publisher keeps its connections to Home Assistant open, and
+    # sends the data of all entities at the same time
+    publisher = HomeAssistantPublisher(HOME_ASSISTANT_IP,
+                                       LONG_LIVED_ACCESS_TOKEN, SENSOR_NAME,
+                                       entities, max_workers=len(entities))
+
+if send_changes_only:
+    report_filter = ReportFilter(
+        {e['name']: dict(deadbands.get(e['name'], {}),
+                         decimals=e['decimals']) for e in entities},
+        max_silence_seconds, min_interval_seconds)
+else:
+    report_filter = None
+
 print("Reporting data to Home Assistant. Press ctrl-c to exit.")
 
 # Enter cycle mode
@@ -76,56 +149,22 @@ while (True):
     sound_data = sensor.get_sound_data(I2C_bus)
     particle_data = sensor.get_particle_data(I2C_bus, sensor.PARTICLE_SENSOR)
 
-    # Specify information needed by Home Assistant.
-    # Icons are chosen from https://cdn.materialdesignicons.com/5.3.45/
-    # (remove the "mdi-" part from the icon name).
-    pressure = dict(name='Pressure', data=air_data['P_Pa'], unit='Pa',
-                    icon='weather-cloudy', decimals=0)
-    humidity = dict(name='Humidity', data=air_data['H_pc'], unit='%',
-                    icon='water-percent', decimals=1)
-    temperature = dict(name='Temperature', data=air_data['T'],
-                       unit=air_data['T_unit'], icon='thermometer', decimals=1)
-    illuminance = dict(name='Illuminance', data=light_data['illum_lux'],
-                       unit='lx', icon='white-balance-sunny', decimals=2)
-    sound_level = dict(name='Sound level', data=sound_data['SPL_dBA'],
-                       unit='dBA', icon='microphone', decimals=1)
-    sound_peak = dict(name='Sound peak', data=sound_data['peak_amp_mPa'],
-                      unit='mPa', icon='waveform', decimals=2)
-    AQI = dict(name='Air Quality Index', data=air_quality_data['AQI'],
-               unit=' ', icon='thought-bubble-outline', decimals=1)
-    AQI_interpret = dict(name='Air quality assessment',
-                         data=sensor.interpret_AQI_value(
-                             air_quality_data['AQI']),
-                         unit='', icon='flower-tulip', decimals=0)
-    particle = dict(name='Particle concentration',
-                    data=particle_data['concentration'],
-                    unit=particle_data['conc_unit'], icon='chart-bubble',
-                    decimals=2)
-
-    # Send data to Home Assistant using HTTP POST requests
-    variables = [pressure, humidity, temperature, illuminance,
-                 sound_level, sound_peak, AQI, AQI_interpret]
-    if sensor.PARTICLE_SENSOR != const.PARTICLE_SENSOR_OFF:
-        variables.append(particle)
-    try:
-        for v in variables:
-            url = ("http://" + HOME_ASSISTANT_IP + ":8123/api/states/" +
-                   SENSOR_NAME + "." + v['name'].replace(' ', '_'))
-            head = {"Content-type": "application/json",
-                    "Authorization": "Bearer " + LONG_LIVED_ACCESS_TOKEN}
-            try:
-                valueStr = "{:.{dps}f}".format(v['data'], dps=v['decimals'])
-            except Exception:
-                valueStr = v['data']
-            payload = {"state": valueStr, "attributes": {
-                "unit_of_measurement": v['unit'], "friendly_name": v['name'],
-                "icon": "mdi:" + v['icon']}}
-            requests.post(url, json=payload, headers=head, timeout=2)
-    except Exception as e:
+    # Send data to Home Assistant
+    values = sensor_values(air_data, air_quality_data, light_data,
+                           sound_data, particle_data)
+    if report_filter is not None:
+        values = report_filter.filter(values)
+    failures = publisher.publish(values)
+    if failures:
+        if report_filter is not None:
+            # Send these values again with the next data
+            report_filter.forget(failures)
         # An error has occurred, likely due to a lost network connection,
-        # and the post has failed.
+        # and the posts have failed. Each entity is sent separately, so
+        # the others are not affected.
         # The program will retry with the next data release and will succeed
         # if the network reconnects.
-        print("HTTP POST failed with the following error:")
-        print(repr(e))
+        print("HTTP POST failed with the following errors:")
+        for (name, error) in failures.items():
+            print(f"   {name}: {error!r}")
         print("The program will continue and retry on the next data output.")
@@ -16,10 +16,11 @@ More setup information is provided in the readme and User Guide.
 #  For code examples, datasheet and user guide, visit
 #  https://github.com/metriful/sensor
 
-import requests
 import time
 import sensor_package.sensor_functions as sensor
 import sensor_package.sensor_constants as const
+from sensor_package.alert_rules import RuleEngine
+from sensor_package.http_client import HTTPClient
 
 #########################################################
 # USER-EDITABLE SETTINGS
@@ -35,39 +36,42 @@ IFTTT_EVENT_NAME = "PASTE YOUR EVENT NAME HERE WITHIN QUOTES"
 
 # An inactive period follows each alert, during which the same alert
 # will not be generated again - this prevents too many emails/alerts.
-# Choose the period as a number of readout cycles (each 5 minutes)
-# e.g. for a 1 hour period, choose inactive_wait_cycles = 12
-inactive_wait_cycles = 12
-
-# Define the details of the variables for monitoring:
-humidity = {'name': 'humidity',
-            'unit': '%',
-            'decimal_places': 1,
-            'high_threshold': 60,
-            'low_threshold': 30,
-            'inactive_count': 2,
-            'high_advice': 'Reduce moisture sources.',
-            'low_advice': 'Start the humidifier.'}
-
-air_quality_index = {'name': 'air quality index',
-                     'unit': '',
-                     'decimal_places': 1,
-                     'high_threshold': 250,
-                     'low_threshold': -1,
-                     'inactive_count': 2,
-                     'high_advice': 'Improve ventilation.',
-                     'low_advice': ''}
-
-# Change the following values if Fahrenheit output
-# temperature is selected in sensor_functions.py
-temperature = {'name': 'temperature',
-               'unit': const.CELSIUS_SYMBOL,
-               'decimal_places': 1,
-               'high_threshold': 23,
-               'low_threshold': 18,
-               'inactive_count': 2,
-               'high_advice': 'Turn on the fan.',
-               'low_advice': 'Turn on the heating.'}
+cooldown_seconds = 3600
+
+# Define the alerts. Each alert is sent when all of its conditions ("when")
+# are true, for at least "for_cycles" readout cycles (each 5 minutes).
+# Each condition compares a variable (temperature, humidity or
+# air_quality_index) with a threshold ("above" or "below"). After an alert,
+# the variable must go back past the threshold by the "hysteresis" amount
+# before the condition is false again.
+# Other types of condition are described in sensor_package/alert_rules.py
+# Change the temperature values if Fahrenheit output temperature is
+# selected in sensor_functions.py
+rules = [
+    dict(name='humidity high',
+         when=[dict(field='humidity', above=60, hysteresis=2)],
+         message='The humidity is too high.',
+         advice='Reduce moisture sources.'),
+    dict(name='humidity low',
+         when=[dict(field='humidity', below=30, hysteresis=2)],
+         message='The humidity is too low.',
+         advice='Start the humidifier.'),
+    dict(name='air quality index high',
+         when=[dict(field='air_quality_index', above=250, hysteresis=10)],
+         message='The air quality index is too high.',
+         advice='Improve ventilation.'),
+    dict(name='temperature high',
+         when=[dict(field='temperature', above=23, hysteresis=0.5)],
+         message='The temperature is too high.',
+         advice='Turn on the fan.'),
+    dict(name='temperature low',
+         when=[dict(field='temperature', below=18, hysteresis=0.5)],
+         message='The temperature is too low.',
+         advice='Turn on the heating.')]
+
+# The last alert times are saved in this file, so that restarting this
+# program does not send the same alerts again within the cooldown time.
+alert_times_file = "IFTTT_alert_times.json"
 
 # END OF USER-EDITABLE SETTINGS
 #########################################################
@@ -80,6 +84,18 @@ cycle_period = const.CYCLE_PERIOD_300_S
 IFTTT_url = ("http://maker.ifttt.com/trigger/" + IFTTT_EVENT_NAME
              + "/with/key/" + WEBHOOKS_KEY)
 IFTTT_header = {"Content-type": "application/json"}
+# Requests fail immediately while the IFTTT server is not responding
+http_client = HTTPClient(max_timeout=2)
+
+# The variables used in the rules, with their decimal places
+fields = {'temperature': 1, 'humidity': 1, 'air_quality_index': 1}
+
+# Each rule must be true for two cycles, so that no alerts are sent
+# before the data have settled
+for rule in rules:
+    rule.setdefault('for_cycles', 2)
+    rule.setdefault('cooldown_seconds', cooldown_seconds)
+rule_engine = RuleEngine(rules, list(fields), state_file=alert_times_file)
 
 # Set up the GPIO and I2C communications bus
 (GPIO, I2C_bus) = sensor.SensorHardwareSetup()
@@ -100,54 +116,38 @@ while True:
         time.sleep(0.05)
 
     # Read the air data and air quality data
+    readout_time = time.time()
     air_data = sensor.get_air_data(I2C_bus)
     air_quality_data = sensor.get_air_quality_data(I2C_bus)
-    temperature['data'] = air_data['T']
-    humidity['data'] = air_data['H_pc']
-    air_quality_index['data'] = air_quality_data['AQI']
-
-    # Check the new values and send an alert to IFTTT if a variable is
-    # outside its allowed range.
-    for v in [temperature, humidity, air_quality_index]:
-
-        if v['inactive_count'] > 0:
-            # Count down to when the monitoring is active again
-            v['inactive_count'] -= 1
-
-        send_alert = False
-        if (v['data'] > v['high_threshold']) and (v['inactive_count'] == 0):
-            # The variable is above the high threshold: send an alert then
-            # ignore this variable for the next inactive_wait_cycles
-            v['inactive_count'] = inactive_wait_cycles
-            send_alert = True
-            threshold_description = 'high.'
-            advice_text = v['high_advice']
-        elif (v['data'] < v['low_threshold']) and (v['inactive_count'] == 0):
-            # The variable is below the low threshold: send an alert then
-            # ignore this variable for the next inactive_wait_cycles
-            v['inactive_count'] = inactive_wait_cycles
-            send_alert = True
-            threshold_description = 'low.'
-            advice_text = v['low_advice']
-
-        if send_alert:
-            # Send data using an HTTP POST request
-            try:
-                warning_txt = f"The {v['name']} is too {threshold_description}"
-                print("Sending new alert to IFTTT: " + warning_txt)
-                payload = {"value1": warning_txt,
-                           "value2": ("The measurement was "
-                                      "{:.{dps}f} ".format(
-                                          v['data'], dps=v['decimal_places'])
-                                      + v['unit']),
-                           "value3": advice_text}
-                requests.post(IFTTT_url, json=payload,
-                              headers=IFTTT_header, timeout=2)
-            except Exception as e:
-                # An error has occurred, likely due to a lost internet
-                # connection, and the post has failed. The program will
-                # continue and new alerts will succeed if the internet
-                # reconnects.
-                print("HTTP POST failed with the following error:")
-                print(repr(e))
-                print("The program will attempt to continue.")
+    values = {'temperature': air_data['T'], 'humidity': air_data['H_pc'],
+              'air_quality_index': air_quality_data['AQI']}
+    units = {'temperature': air_data['T_unit'], 'humidity': '%',
+             'air_quality_index': ''}
+
+    # Check the new values and send an alert to IFTTT for each rule which
+    # has become true (or is still true after its cooldown time).
+    alerts = rule_engine.evaluate([[values[name] for name in fields]],
+                                  readout_time)
+    for (board, r) in alerts:
+        rule = rules[r]
+        # Report the value of the variable in the first condition
+        name = rule['when'][0]['field']
+        # Send data using an HTTP POST request
+        try:
+            print("Sending new alert to IFTTT: " + rule['message'])
+            payload = {"value1": rule['message'],
+                       "value2": ("The measurement was "
+                                  f"{values[name]:.{fields[name]}f} "
+                                  + units[name]),
+                       "value3": rule['advice']}
+            response = http_client.post(IFTTT_url, json=payload,
+                                        headers=IFTTT_header)
+            response.raise_for_status()
+        except Exception as e:
+            # An error has occurred, likely due to a lost internet
+            # connection, and the post has failed. The program will
+            # continue and new alerts will succeed if the internet
+            # reconnects.
+            print("HTTP POST failed with the following error:")
+            print(repr(e))
+            print("The program will attempt to continue.")
@@ -6,6 +6,14 @@ Environmental data values are measured and logged to an internet
 cloud account every 100 seconds. The example gives the choice of
 using either the Tago.io or Thingspeak.com cloud - both of these
 offer a free account for low data rates.
+
+The data are first saved in a queue file, then uploaded by a background
+thread. If the internet connection is lost, the data wait in the queue
+and are uploaded (with their original times) when it returns.
+
+To save network use and cloud data allowance, each value is only sent
+when it has changed by a chosen amount, or when it has not been sent
+for a chosen time.
 """
 
 #  Copyright 2020-2023 Metriful Ltd.
@@ -14,10 +22,13 @@ offer a free account for low data rates.
 #  For code examples, datasheet and user guide, visit
 #  https://github.com/metriful/sensor
 
-import requests
 import time
+from datetime import datetime, timezone
 import sensor_package.sensor_functions as sensor
 import sensor_package.sensor_constants as const
+from sensor_package.upload_queue import UploadQueue, BackgroundUploader
+from sensor_package.report_filter import ReportFilter
+from sensor_package.http_client import HTTPClient
 
 #########################################################
 # USER-EDITABLE SETTINGS
@@ -45,6 +56,35 @@ if use_Tago_cloud:
 else:
     # settings for ThingSpeak.com cloud
     THINGSPEAK_API_KEY_STRING = "PASTE YOUR API KEY HERE WITHIN QUOTES"
+    THINGSPEAK_CHANNEL_ID_STRING = "PASTE YOUR CHANNEL ID HERE WITHIN QUOTES"
+
+# Data waiting to be uploaded are saved in this file, so they are not
+# lost if the internet connection fails or this program is restarted.
+queue_file = "IoT_upload_queue.db"
+# The maximum number of sets of data to keep in the queue: the oldest
+# data are removed when it is full. 100000 is 115 days of data with
+# the 100 second cycle period.
+max_queued_data = 100000
+
+# Choose whether to send only the values which have changed by more than
+# a "deadband" amount since they were last sent. Each value is still sent
+# at least once every max_silence_seconds. Set this False to send all
+# values in every cycle.
+send_changes_only = True
+max_silence_seconds = 3600
+
+# The deadband of each value, as an absolute change, or as a fraction of
+# the last sent value ("relative"). Values which are not listed here are
+# sent whenever their displayed value (see value_decimals) changes.
+deadbands = {"temperature": dict(absolute=0.2),
+             "pressure": dict(absolute=10),
+             "humidity": dict(absolute=1),
+             "aqi": dict(absolute=5),
+             "bvoc": dict(relative=0.1),
+             "spl": dict(absolute=2),
+             "peak_amp": dict(relative=0.25),
+             "illuminance": dict(relative=0.1),
+             "particulates": dict(relative=0.1)}
 
 # END OF USER-EDITABLE SETTINGS
 #########################################################
@@ -67,10 +107,90 @@ if use_Tago_cloud:
     tago_url = "http://api.tago.io/data"
     tago_header = {"Content-type": "application/json",
                    "Device-Token": TAGO_DEVICE_TOKEN_STRING}
+    # Tago accepts many data in each request
+    (batch_size, min_batch_interval) = (50, 0)
 else:
-    # settings for ThingSpeak.com cloud
-    thingspeak_url = "http://api.thingspeak.com/update"
-    thingspeak_header = {"Content-type": "application/x-www-form-urlencoded"}
+    # settings for ThingSpeak.com cloud: several sets of data can be sent
+    # in one "bulk update" request, but only once every 15 seconds with a
+    # free account
+    thingspeak_url = ("http://api.thingspeak.com/channels/"
+                      + THINGSPEAK_CHANNEL_ID_STRING + "/bulk_update.json")
+    (batch_size, min_batch_interval) = (100, 15)
+
+# Requests fail immediately while the cloud server is not responding, and
+# wait for at most 10 seconds otherwise
+http_client = HTTPClient(max_timeout=10)
+
+# The number of decimal places with which each value is sent
+value_decimals = {"temperature": 1, "pressure": 0, "humidity": 1, "aqi": 1,
+                  "bvoc": 2, "spl": 1, "peak_amp": 2, "illuminance": 2,
+                  "particulates": 2}
+
+
+def send_batch(batch):
+    """Send a list of (timestamp, data) to the cloud as an HTTP POST request.
+
+    For both example cloud providers, the following quantities are sent:
+    1 Temperature (measurement unit is selected in sensor_functions.py)
+    2 Pressure/Pa
+    3 Humidity/%
+    4 Air quality index
+    5 bVOC/ppm
+    6 SPL/dBA
+    7 Illuminance/lux
+    8 Particle concentration
+
+    Additionally, for Tago, the following are sent:
+    9  Air Quality Assessment summary (Good, Bad, etc.)
+    10 Peak sound amplitude / mPa
+
+    Each set of data contains only the quantities which have changed.
+    """
+    if use_Tago_cloud:
+        payload = []
+        for (timestamp, data) in batch:
+            time_string = datetime.fromtimestamp(
+                timestamp, timezone.utc).isoformat()
+            payload.extend({"variable": name, "value": value,
+                            "time": time_string}
+                           for (name, value) in data.items())
+        response = http_client.post(tago_url, json=payload,
+                                    headers=tago_header)
+    else:
+        # Use ThingSpeak.com cloud
+        updates = []
+        for (timestamp, data) in batch:
+            update = {"created_at": datetime.fromtimestamp(
+                timestamp, timezone.utc).isoformat()}
+            for (n, name) in enumerate(['temperature', 'pressure',
+                                        'humidity', 'aqi', 'bvoc', 'spl',
+                                        'illuminance', 'particulates']):
+                if name in data:
+                    update["field" + str(n + 1)] = data[name]
+            if len(update) > 1:
+                updates.append(update)
+        if not updates:
+            return
+        response = http_client.post(
+            thingspeak_url, json={"write_api_key": THINGSPEAK_API_KEY_STRING,
+                                  "updates": updates})
+    # Raise an exception if the post has failed, so it will be retried
+    response.raise_for_status()
+
+
+# Uploads are done in the background, so that waiting for the cloud
+# server never delays reading the data.
+uploader = BackgroundUploader(UploadQueue(queue_file, max_queued_data),
+                              send_batch, batch_size,
+                              min_batch_interval=min_batch_interval)
+
+if send_changes_only:
+    report_filter = ReportFilter(
+        {name: dict(deadbands.get(name, {}), decimals=decimals)
+         for (name, decimals) in value_decimals.items()},
+        max_silence_seconds)
+else:
+    report_filter = None
 
 print("Logging data. Press ctrl-c to exit.")
 
@@ -82,6 +202,7 @@ while (True):
     # Wait for the next new data release, indicated by a falling edge on READY
     while (not GPIO.event_detected(sensor.READY_pin)):
         time.sleep(0.05)
+    readout_time = time.time()
 
     # Now read all data from the MS430
 
@@ -110,67 +231,23 @@ while (True):
     # period of approximately one minute.
     particle_data = sensor.get_particle_data(I2C_bus, sensor.PARTICLE_SENSOR)
 
-    # Assemble the data into the required format, then send it to the cloud
-    # as an HTTP POST request.
-
-    # For both example cloud providers, the following quantities will be sent:
-    # 1 Temperature (measurement unit is selected in sensor_functions.py)
-    # 2 Pressure/Pa
-    # 3 Humidity/%
-    # 4 Air quality index
-    # 5 bVOC/ppm
-    # 6 SPL/dBA
-    # 7 Illuminance/lux
-    # 8 Particle concentration
-
-    # Additionally, for Tago, the following are sent:
-    # 9  Air Quality Assessment summary (Good, Bad, etc.)
-    # 10 Peak sound amplitude / mPa
-
-    try:
-        if use_Tago_cloud:
-            payload = []
-            payload.append({"variable": "temperature",
-                            "value": f"{air_data['T']:.1f}"})
-            payload.append({"variable": "pressure", "value": air_data['P_Pa']})
-            payload.append({"variable": "humidity",
-                            "value": f"{air_data['H_pc']:.1f}"})
-            payload.append({"variable": "aqi",
-                            "value": f"{air_quality_data['AQI']:.1f}"})
-            payload.append(
-                {"variable": "aqi_string",
-                 "value": sensor.interpret_AQI_value(air_quality_data['AQI'])})
-            payload.append({"variable": "bvoc",
-                            "value": f"{air_quality_data['bVOC']:.2f}"})
-            payload.append({"variable": "spl",
-                            "value": f"{sound_data['SPL_dBA']:.1f}"})
-            payload.append({"variable": "peak_amp",
-                            "value": f"{sound_data['peak_amp_mPa']:.2f}"})
-            payload.append({"variable": "illuminance",
-                            "value": f"{light_data['illum_lux']:.2f}"})
-            payload.append({"variable": "particulates",
-                            "value": f"{particle_data['concentration']:.2f}"})
-            requests.post(tago_url, json=payload,
-                          headers=tago_header, timeout=2)
-        else:
-            # Use ThingSpeak.com cloud
-            payload = "api_key=" + THINGSPEAK_API_KEY_STRING
-            payload += "&field1=" + f"{air_data['T']:.1f}"
-            payload += "&field2=" + str(air_data['P_Pa'])
-            payload += "&field3=" + f"{air_data['H_pc']:.1f}"
-            payload += "&field4=" + f"{air_quality_data['AQI']:.1f}"
-            payload += "&field5=" + f"{air_quality_data['bVOC']:.2f}"
-            payload += "&field6=" + f"{sound_data['SPL_dBA']:.1f}"
-            payload += "&field7=" + f"{light_data['illum_lux']:.2f}"
-            payload += "&field8=" + f"{particle_data['concentration']:.2f}"
-            requests.post(thingspeak_url, data=payload,
-                          headers=thingspeak_header, timeout=2)
-
-    except Exception as e:
-        # An error has occurred, likely due to a lost internet connection,
-        # and the post has failed.
-        # The program will retry with the next data release and will succeed
-        # if the internet reconnects.
-        print("HTTP POST failed with the following error:")
-        print(repr(e))
-        print("The program will continue and retry on the next data output.")
+    values = {
+        "temperature": air_data['T'],
+        "pressure": air_data['P_Pa'],
+        "humidity": air_data['H_pc'],
+        "aqi": air_quality_data['AQI'],
+        "aqi_string": sensor.interpret_AQI_value(air_quality_data['AQI']),
+        "bvoc": air_quality_data['bVOC'],
+        "spl": sound_data['SPL_dBA'],
+        "peak_amp": sound_data['peak_amp_mPa'],
+        "illuminance": light_data['illum_lux'],
+        "particulates": particle_data['concentration']}
+    if report_filter is not None:
+        values = report_filter.filter(values, readout_time)
+
+    # Put the changed data in the upload queue: they are sent to the cloud
+    # by the background uploader (see send_batch).
+    if values:
+        uploader.put({name: (f"{value:.{value_decimals[name]}f}"
+                             if name in value_decimals else value)
+                      for (name, value) in values.items()}, readout_time)
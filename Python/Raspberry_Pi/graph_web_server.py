@@ -40,11 +40,28 @@ import sensor_package.sensor_constants as const
 cycle_period = const.CYCLE_PERIOD_3_S
 
 # The BUFFER_LENGTH parameter is the number of data points of each
-# variable to store on the host. It is limited by the available host RAM.
+# variable to store on the host. It is limited by the available host RAM
+# (each data point uses 36 bytes) and must not exceed 65535.
 buffer_length = 200
 # Examples:
 # For 16 hour graphs, choose 100 second cycle period and 576 buffer length
 # For 24 hour graphs, choose 300 second cycle period and 288 buffer length
+# Long buffers are downsampled by the server to suit the width of the
+# graphs (keeping the minimum and maximum of each group of data points), so
+# the web page remains fast. For 2 day graphs with a 3 second cycle period,
+# choose 57600 buffer length.
+
+# The stored data are kept in this file, so that they are not lost when
+# this program is restarted. The file is replaced if the buffer length is
+# changed. Use None to keep the data in memory only.
+history_file = "graph_history.dat"
+
+# Data can be downloaded from the web page as a CSV file. The server can
+# also provide data from the files saved by log_data_to_file.py: to enable
+# this, give their directory here (e.g. "/home/pi/Desktop"), then use a
+# web address like: http://172.24.1.1:8080/export?source=logs
+# See the send_export() function in sensor_package/servers.py for options.
+log_file_directory = None
 
 # The web page address will be:
 # http://<your Raspberry Pi IP address>:8080   e.g. http://172.24.1.1:8080
@@ -80,9 +97,13 @@ elif (cycle_period == const.CYCLE_PERIOD_100_S):
     server.GraphWebpageHandler.data_period_seconds = 100
 else:  # CYCLE_PERIOD_300_S
     server.GraphWebpageHandler.data_period_seconds = 300
+server.GraphWebpageHandler.metrics.cycle_period_seconds = (
+    server.GraphWebpageHandler.data_period_seconds)
 
 # Set the number of each variable to be retained
-server.GraphWebpageHandler.set_buffer_length(buffer_length)
+server.GraphWebpageHandler.set_buffer_length(buffer_length,
+                                              history_file)
+server.GraphWebpageHandler.log_file_directory = log_file_directory
 
 # Choose the TCP port number for the web page.
 port = 8080
@@ -104,7 +125,11 @@ else:
           "run the command ifconfig in a terminal.")
 print("Press ctrl-c to exit at any time.")
 
-the_server = socketserver.TCPServer(("", port), server.GraphWebpageHandler)
+# Each client connection is handled in its own thread, so that browsers
+# can keep their connections open between requests.
+the_server = socketserver.ThreadingTCPServer(
+    ("", port), server.GraphWebpageHandler)
+the_server.daemon_threads = True
 the_server.timeout = 0.1
 
 # Enter cycle mode to start periodic data output
@@ -116,33 +141,46 @@ while True:
     while not GPIO.event_detected(sensor.READY_pin):
         the_server.handle_request()
         time.sleep(0.05)
-
-    # Now read all data from the MS430 and pass to the web page
-
-    # Air data
-    server.GraphWebpageHandler.update_air_data(sensor.get_air_data(I2C_bus))
-
-    # Air quality data
-    # The initial self-calibration of the air quality data may take several
-    # minutes to complete. During this time the accuracy parameter is zero
-    # and the data values are not valid.
-    server.GraphWebpageHandler.update_air_quality_data(
-        sensor.get_air_quality_data(I2C_bus))
-
-    # Light data
-    server.GraphWebpageHandler.update_light_data(
-        sensor.get_light_data(I2C_bus))
-
-    # Sound data
-    server.GraphWebpageHandler.update_sound_data(
-        sensor.get_sound_data(I2C_bus))
-
-    # Particle data
-    # This requires the connection of a particulate sensor (invalid
-    # values will be obtained if this sensor is not present).
-    # Also note that, due to the low pass filtering used, the
-    # particle data become valid after an initial initialization
-    # period of approximately one minute.
-    if (sensor.PARTICLE_SENSOR != const.PARTICLE_SENSOR_OFF):
-        server.GraphWebpageHandler.update_particle_data(
-            sensor.get_particle_data(I2C_bus, sensor.PARTICLE_SENSOR))
+    readout_time = time.time()
+
+    # Now read all data from the MS430 and pass to the web page.
+    # The read time and any I2C bus errors are recorded for the
+    # /metrics page.
+    read_start = time.monotonic()
+    try:
+        # Air data
+        server.GraphWebpageHandler.update_air_data(
+            sensor.get_air_data(I2C_bus))
+
+        # Air quality data
+        # The initial self-calibration of the air quality data may take
+        # several minutes to complete. During this time the accuracy
+        # parameter is zero and the data values are not valid.
+        server.GraphWebpageHandler.update_air_quality_data(
+            sensor.get_air_quality_data(I2C_bus))
+
+        # Light data
+        server.GraphWebpageHandler.update_light_data(
+            sensor.get_light_data(I2C_bus))
+
+        # Sound data
+        server.GraphWebpageHandler.update_sound_data(
+            sensor.get_sound_data(I2C_bus))
+
+        # Particle data
+        # This requires the connection of a particulate sensor (invalid
+        # values will be obtained if this sensor is not present).
+        # Also note that, due to the low pass filtering used, the
+        # particle data become valid after an initial initialization
+        # period of approximately one minute.
+        if (sensor.PARTICLE_SENSOR != const.PARTICLE_SENSOR_OFF):
+            server.GraphWebpageHandler.update_particle_data(
+                sensor.get_particle_data(I2C_bus, sensor.PARTICLE_SENSOR))
+    except OSError:
+        server.GraphWebpageHandler.metrics.record_bus_error()
+        continue
+    server.GraphWebpageHandler.metrics.record_read_duration(
+        time.monotonic() - read_start)
+
+    # Push the new data to the web pages which are currently open
+    server.GraphWebpageHandler.data_update_complete(readout_time)
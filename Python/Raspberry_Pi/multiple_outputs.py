@@ -0,0 +1,210 @@
+"""Example of sending the Metriful MS430 data to several outputs at once.
+
+This example is designed to run with Python 3 on a Raspberry Pi.
+
+The data are read once after each data release, then passed to each of
+the chosen outputs: a log file, the screen, the graph web page server,
+and Home Assistant. This combines the log_data_to_file.py,
+graph_web_server.py and Home_Assistant.py examples, which cannot run at
+the same time because each one resets the MS430.
+
+Each output runs in its own thread and has its own queue of data, so a
+slow output (e.g. a lost network connection) does not delay the reading
+of the sensor or the other outputs. Statistics for each output, such as
+the delay and the number of dropped sets of data, can be printed.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import json
+import threading
+import socketserver
+from datetime import datetime
+import sensor_package.servers as server
+import sensor_package.sensor_functions as sensor
+import sensor_package.sensor_constants as const
+from sensor_package.pipeline import Pipeline
+from sensor_package.home_assistant import (HomeAssistantPublisher,
+                                           sensor_entities, sensor_values)
+from sensor_package.report_filter import ReportFilter
+
+#########################################################
+# USER-EDITABLE SETTINGS
+
+# How often to read data (every 3, 100, or 300 seconds)
+cycle_period = const.CYCLE_PERIOD_3_S
+
+# Choose any combination of outputs:
+log_to_file = True
+print_to_screen = False
+serve_graph_web_page = True
+send_to_home_assistant = False
+
+# Log file settings (see log_data_to_file.py)
+lines_per_file = 300
+data_file_directory = "/home/pi/Desktop"
+
+# Graph web page settings (see graph_web_server.py). The web page address
+# will be: http://<your Raspberry Pi IP address>:8080. The buffer length
+# must not exceed 65535.
+web_server_port = 8080
+buffer_length = 200
+history_file = "graph_history.dat"
+
+# Home Assistant settings (see Home_Assistant.py). Only values which have
+# changed by more than one step of their last decimal place are sent, or
+# every value at least once every max_silence_seconds.
+SENSOR_NAME = "kitchen3"
+HOME_ASSISTANT_IP = "192.168.43.144"
+LONG_LIVED_ACCESS_TOKEN = "PASTE YOUR TOKEN HERE WITHIN QUOTES"
+max_silence_seconds = 600
+
+# Print the statistics of each output after this many cycles (or None)
+statistics_cycles = 100
+
+# END OF USER-EDITABLE SETTINGS
+#########################################################
+
+# Set up the GPIO and I2C communications bus
+(GPIO, I2C_bus) = sensor.SensorHardwareSetup()
+
+# Apply the chosen settings to the MS430
+I2C_bus.write_i2c_block_data(
+    sensor.i2c_7bit_address,
+    const.PARTICLE_SENSOR_SELECT_REG, [sensor.PARTICLE_SENSOR])
+I2C_bus.write_i2c_block_data(
+    sensor.i2c_7bit_address, const.CYCLE_TIME_PERIOD_REG, [cycle_period])
+
+#########################################################
+
+pipeline = Pipeline()
+
+# Each output is a "sink" function, which is called with a dictionary
+# of data (a "snapshot": see read_snapshot() in sensor_package/pipeline.py)
+
+if log_to_file:
+    datafile = sensor.startNewDataFile(data_file_directory)
+    data_file_lines = 0
+
+    def write_to_file(snapshot):
+        """Write the data as columns in a text file."""
+        global datafile, data_file_lines
+        datafile.write(datetime.fromtimestamp(
+            snapshot['time']).strftime('%Y %m %d %H %M %S '))
+        sensor.writeAirData(datafile, snapshot['air_data'], True)
+        sensor.writeAirQualityData(datafile, snapshot['air_quality_data'],
+                                   True)
+        sensor.writeLightData(datafile, snapshot['light_data'], True)
+        sensor.writeSoundData(datafile, snapshot['sound_data'], True)
+        if snapshot['particle_data'] is not None:
+            sensor.writeParticleData(datafile, snapshot['particle_data'],
+                                     True)
+        datafile.write("\n")
+        datafile.flush()
+        data_file_lines += 1
+        if data_file_lines >= lines_per_file:
+            # Start a new log file to prevent very large files
+            datafile.close()
+            datafile = sensor.startNewDataFile(data_file_directory)
+            data_file_lines = 0
+
+    # A long queue, so that no data are dropped from the log file unless
+    # it is very slow (e.g. 5 minutes behind, with a 3 second cycle)
+    pipeline.add_sink("file", write_to_file, queue_size=100)
+
+if print_to_screen:
+
+    def print_data(snapshot):
+        """Display all data on screen as named quantities with units."""
+        print("")
+        print("------------------")
+        sensor.writeAirData(None, snapshot['air_data'], False)
+        sensor.writeAirQualityData(None, snapshot['air_quality_data'], False)
+        sensor.writeLightData(None, snapshot['light_data'], False)
+        sensor.writeSoundData(None, snapshot['sound_data'], False)
+        if snapshot['particle_data'] is not None:
+            sensor.writeParticleData(None, snapshot['particle_data'], False)
+
+    pipeline.add_sink("screen", print_data)
+
+if serve_graph_web_page:
+    handler = server.GraphWebpageHandler
+    handler.data_period_seconds = {const.CYCLE_PERIOD_3_S: 3,
+                                   const.CYCLE_PERIOD_100_S: 100,
+                                   const.CYCLE_PERIOD_300_S: 300}[cycle_period]
+    handler.metrics.cycle_period_seconds = handler.data_period_seconds
+    handler.set_buffer_length(buffer_length, history_file)
+
+    def update_graph_data(snapshot):
+        """Add the data to the graph web page buffer."""
+        handler.update_air_data(snapshot['air_data'])
+        handler.update_air_quality_data(snapshot['air_quality_data'])
+        handler.update_light_data(snapshot['light_data'])
+        handler.update_sound_data(snapshot['sound_data'])
+        if snapshot['particle_data'] is not None:
+            handler.update_particle_data(snapshot['particle_data'])
+        handler.data_update_complete(snapshot['time'])
+
+    pipeline.add_sink("graphs", update_graph_data)
+
+    # Serve the web pages from a background thread
+    the_server = socketserver.ThreadingTCPServer(("", web_server_port),
+                                                 handler)
+    the_server.daemon_threads = True
+    threading.Thread(target=the_server.serve_forever, daemon=True).start()
+    for ip in server.get_IP_addresses():
+        print(f"The graph web page is available at: http://{ip}:"
+              f"{web_server_port}")
+
+if send_to_home_assistant:
+    entities = sensor_entities()
+    publisher = HomeAssistantPublisher(HOME_ASSISTANT_IP,
+                                       LONG_LIVED_ACCESS_TOKEN, SENSOR_NAME,
+                                       entities, max_workers=len(entities))
+    report_filter = ReportFilter({e['name']: dict(decimals=e['decimals'])
+                                  for e in entities}, max_silence_seconds)
+
+    def send_to_HA(snapshot):
+        """Send the changed values to Home Assistant."""
+        values = report_filter.filter(
+            sensor_values(snapshot['air_data'],
+                          snapshot['air_quality_data'],
+                          snapshot['light_data'], snapshot['sound_data'],
+                          snapshot['particle_data']), snapshot['acquired'])
+        failures = publisher.publish(values)
+        if failures:
+            # Send these values again with the next data. The error is
+            # recorded in the statistics of this output.
+            report_filter.forget(failures)
+            raise ConnectionError(f"Failed to send: {', '.join(failures)}")
+
+    # Only the newest data are useful if Home Assistant cannot keep up
+    pipeline.add_sink("home_assistant", send_to_HA, queue_size=2)
+
+if statistics_cycles is not None:
+
+    def print_statistics(snapshot):
+        """Print the statistics of each output, periodically."""
+        if (pipeline.cycles % statistics_cycles) == 0:
+            statistics = pipeline.statistics()
+            if send_to_home_assistant:
+                # The state of the connection to Home Assistant
+                statistics['servers'] = publisher.client.health()
+            print(json.dumps(statistics, indent=2))
+
+    pipeline.add_sink("statistics", print_statistics, queue_size=1)
+
+print("Entering cycle mode and waiting for data. Press ctrl-c to exit.")
+
+# Enter cycle mode
+I2C_bus.write_byte(sensor.i2c_7bit_address, const.CYCLE_MODE_CMD)
+
+try:
+    pipeline.run(GPIO, I2C_bus)
+except KeyboardInterrupt:
+    # Finish writing the data which are waiting (with a time limit)
+    pipeline.stop(5)
@@ -0,0 +1,190 @@
+"""Check environment data against a set of alert rules.
+
+This file contains a class which compares each new set of data with a
+list of rules, for one or many sensor boards, and reports which alerts
+need to be sent. The rules are converted into numpy arrays when the
+class is created, so that each set of data is checked with a few array
+operations, however many rules and boards there are.
+
+Each rule is a dictionary with the keys:
+  name: a unique name, e.g. "temperature high"
+  when: a list of conditions, which must all be true. Each condition is a
+        dictionary with the keys:
+          field: the name of the variable, e.g. "temperature"
+          above or below: the threshold value
+          hysteresis: (optional) once the condition is true, it stays true
+                      until the value has gone back past the threshold by
+                      this amount, so a value close to the threshold does
+                      not cause repeated alerts
+          minus: (optional) the name of a variable which is subtracted
+                 from the value of "field" before comparing, e.g. to
+                 compare indoor and outdoor temperature
+          rate: (optional) if True, the rate of change of the value, in
+                units per minute, is compared instead of the value
+  for_cycles: (optional) the number of consecutive sets of data for which
+              the conditions must be true before the alert is sent
+  cooldown_seconds: (optional) the minimum time between alerts from this
+                    rule, for each board, while the conditions stay true
+Other keys (e.g. the alert message text) are kept but not used here.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import os
+import json
+import numpy as np
+
+
+class RuleEngine:
+    """Find the alerts to send, from the data of a group of boards.
+
+    The last alert time of each rule and board can be saved in a file,
+    so that a program restart does not cause repeated alerts.
+    """
+
+    def __init__(self, rules, fields, boards=("MS430",), state_file=None):
+        """Convert the rules into arrays.
+
+        rules: a list of rule dictionaries (see the top of this file)
+        fields: a list of the variable names, in the order in which their
+                values are given to evaluate()
+        boards: a list of names of the boards
+        state_file: a JSON file in which the last alert times are saved,
+                    or None
+        """
+        self.rules = list(rules)
+        self.fields = list(fields)
+        self.boards = list(boards)
+        self.state_file = state_file
+        # Each rule is given the same number of conditions, by adding
+        # conditions which are always true to the shorter rules. The first
+        # conditions of all rules come first, then the second conditions,
+        # and so on. Index len(fields) is a column of zeros, used when
+        # there is no "minus" variable.
+        field_index = {name: n for (n, name) in enumerate(self.fields)}
+        zero_column = len(self.fields)
+        always_true = {'field': None, 'above': -np.inf}
+        field_index[None] = zero_column
+        for rule in self.rules:
+            if not rule['when']:
+                raise ValueError(f"Rule '{rule['name']}' has no conditions")
+        self.conditions_per_rule = max(len(rule['when'])
+                                       for rule in self.rules)
+        (fields_1, fields_2, sign, threshold, hysteresis, rate) = (
+            [], [], [], [], [], [])
+        for n in range(self.conditions_per_rule):
+            for rule in self.rules:
+                if n < len(rule['when']):
+                    condition = rule['when'][n]
+                else:
+                    condition = always_true
+                fields_1.append(field_index[condition['field']])
+                fields_2.append(field_index[condition['minus']]
+                                if 'minus' in condition else zero_column)
+                if 'above' in condition:
+                    sign.append(1.0)
+                    threshold.append(condition['above'])
+                else:
+                    sign.append(-1.0)
+                    threshold.append(condition['below'])
+                hysteresis.append(condition.get('hysteresis', 0))
+                rate.append(bool(condition.get('rate', False)))
+        self.fields_1 = np.array(fields_1, dtype=np.intp)
+        self.fields_2 = np.array(fields_2, dtype=np.intp)
+        self.sign = np.array(sign)
+        # Comparisons are done as sign * (quantity - threshold) > 0
+        self.scaled_threshold = self.sign * np.array(threshold, dtype=float)
+        self.hysteresis = np.array(hysteresis, dtype=float)
+        self.rate_columns = np.nonzero(rate)[0]
+        self.for_cycles = np.array([rule.get('for_cycles', 1)
+                                    for rule in self.rules])
+        self.cooldown = np.array([rule.get('cooldown_seconds', 0)
+                                  for rule in self.rules], dtype=float)
+
+        shape = (len(self.boards), len(fields_1))
+        self.latched = np.zeros(shape, dtype=bool)
+        self.true_cycles = np.zeros((len(self.boards), len(self.rules)),
+                                    dtype=np.int64)
+        self.last_alert = np.full((len(self.boards), len(self.rules)),
+                                  -np.inf)
+        self.previous_values = None
+        self.previous_time = None
+        if state_file is not None:
+            self._load_state()
+
+    def evaluate(self, values, timestamp):
+        """Check a new set of data and return the alerts to send.
+
+        values: an array (or list of lists) of the data values, with one
+                row per board and one column per field. Missing values can
+                be given as NaN: conditions using them are false.
+        timestamp: the time of the data, in seconds since the epoch
+        Returns a list of (board index, rule index) pairs.
+        """
+        values = np.asarray(values, dtype=float)
+        # Add the column of zeros
+        values = np.concatenate(
+            (values, np.zeros((values.shape[0], 1))), axis=1)
+        quantities = values[:, self.fields_1]
+        quantities -= values[:, self.fields_2]
+        if self.rate_columns.size > 0:
+            rate_values = quantities[:, self.rate_columns]
+            minutes = (None if self.previous_time is None
+                       else (timestamp - self.previous_time) / 60)
+            if (minutes is None) or (minutes <= 0):
+                quantities[:, self.rate_columns] = np.nan
+            else:
+                quantities[:, self.rate_columns] = (
+                    (rate_values - self.previous_values) / minutes)
+            self.previous_values = rate_values
+            self.previous_time = timestamp
+
+        # Apply the thresholds with hysteresis (NaN compares as false)
+        difference = quantities * self.sign
+        difference -= self.scaled_threshold
+        self.latched &= (difference > -self.hysteresis)
+        self.latched |= (difference > 0)
+
+        # A rule is true when all of its conditions are true
+        rule_count = len(self.rules)
+        rule_true = self.latched[:, :rule_count].copy()
+        for n in range(1, self.conditions_per_rule):
+            rule_true &= self.latched[:, (n * rule_count):
+                                      ((n + 1) * rule_count)]
+        self.true_cycles = np.where(rule_true, self.true_cycles + 1, 0)
+        send = ((self.true_cycles >= self.for_cycles)
+                & ((timestamp - self.last_alert) >= self.cooldown))
+        (boards, rules) = np.nonzero(send)
+        if boards.size > 0:
+            self.last_alert[boards, rules] = timestamp
+            if self.state_file is not None:
+                self._save_state()
+        return list(zip(boards.tolist(), rules.tolist()))
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        board_index = {name: n for (n, name) in enumerate(self.boards)}
+        for (r, rule) in enumerate(self.rules):
+            for (board, last_time) in state.get(rule['name'], {}).items():
+                if board in board_index:
+                    self.last_alert[board_index[board], r] = last_time
+
+    def _save_state(self):
+        # Write to a new file then replace the old one, so that a file
+        # which is only partly written is never used
+        state = {}
+        for (b, r) in zip(*np.nonzero(np.isfinite(self.last_alert))):
+            state.setdefault(self.rules[r]['name'], {})[self.boards[b]] = (
+                float(self.last_alert[b, r]))
+        temporary_file = self.state_file + ".new"
+        with open(temporary_file, 'w') as f:
+            json.dump(state, f)
+        os.replace(temporary_file, self.state_file)
@@ -0,0 +1,344 @@
+"""Acquisition daemon: read the MS430 and send the data to other programs.
+
+Run this from the Raspberry_Pi directory with:
+
+    python3 -m sensor_package.daemon
+
+The daemon is the only program which uses the sensor hardware. It reads
+all data after each data release (see pipeline.py) and sends them, in a
+compact fixed-size binary form (see snapshot_format.py), to every
+program connected to its Unix domain socket. Any number of programs
+(e.g. a data logger, a web server and a display) can therefore use the
+data at the same time: see daemon_client.py for the client class.
+
+Each set of data is converted to bytes once, and is sent to each client
+with a single non-blocking write, so each client costs very little
+processor time. A client which is too slow to receive the data does not
+delay the others: its data wait in a limited queue, and the oldest are
+discarded when the queue is full.
+
+The newest data are also written to shared memory (see
+shared_reading.py), for programs which only need the current values.
+
+Choose the settings below, and the particle sensor and temperature unit
+in sensor_functions.py.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import os
+import sys
+import json
+import signal
+import socket
+import selectors
+import threading
+from collections import deque
+from . import sensor_functions as sensor
+from . import sensor_constants as const
+from .pipeline import Pipeline, read_snapshot
+from .snapshot_format import pack_snapshot
+from .daemon_client import DEFAULT_SOCKET_PATH
+from .shared_reading import SharedReadingWriter, DEFAULT_SEGMENT_NAME
+
+#########################################################
+# USER-EDITABLE SETTINGS
+
+# How often to read data (every 3, 100, or 300 seconds)
+cycle_period = const.CYCLE_PERIOD_3_S
+
+# The socket file which clients connect to
+socket_path = DEFAULT_SOCKET_PATH
+
+# The maximum number of sets of data waiting to be sent to each client,
+# in addition to those held by the operating system
+client_queue_length = 100
+
+# Also write the newest data to this shared memory segment, which
+# programs can read with SharedReadingReader (see shared_reading.py), or
+# None
+shared_memory_name = DEFAULT_SEGMENT_NAME
+
+# Use a simulated MS430 (see simulator.py) instead of the sensor
+# hardware, with a new set of data at this interval in seconds, or None
+simulated_cycle_seconds = None
+
+# Print the statistics after this many cycles (or None)
+statistics_cycles = None
+
+# END OF USER-EDITABLE SETTINGS
+#########################################################
+
+
+class ClientConnection:
+    """A connected client, with the data waiting to be sent to it."""
+
+    def __init__(self, connection, queue_length):
+        self.connection = connection
+        self.waiting = deque()
+        # The number of bytes of the first waiting record already sent
+        self.sent_bytes = 0
+        self.queue_length = queue_length
+        self.dropped = 0
+
+    def add(self, record):
+        """Add a record to the queue, dropping the oldest if it is full.
+
+        A record which has been partly sent is never dropped.
+        """
+        self.waiting.append(record)
+        if len(self.waiting) > self.queue_length:
+            del self.waiting[1 if self.sent_bytes else 0]
+            self.dropped += 1
+
+    def send(self):
+        """Send as many waiting records as possible, without waiting.
+
+        Returns True if all were sent. Raises OSError if the client has
+        disconnected.
+        """
+        while self.waiting:
+            record = self.waiting[0]
+            try:
+                self.sent_bytes += self.connection.send(
+                    record[self.sent_bytes:])
+            except BlockingIOError:
+                return False
+            if self.sent_bytes < len(record):
+                return False
+            self.waiting.popleft()
+            self.sent_bytes = 0
+        return True
+
+
+class SnapshotPublisher:
+    """Send snapshots to all clients of a Unix domain socket.
+
+    The sockets are handled by one background thread. publish() can be
+    used as a pipeline sink function.
+    """
+
+    def __init__(self, path, client_queue_length=100):
+        """Create the socket and start the background thread.
+
+        Raises RuntimeError if another daemon is using the socket.
+        """
+        self.path = path
+        self.client_queue_length = client_queue_length
+        self._remove_old_socket()
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen()
+        self.server.setblocking(False)
+        # Records are passed to the thread through this queue, and the
+        # thread is woken by a byte written to the wake-up socket
+        self.records = deque()
+        (self.wake_reader, self.wake_writer) = socket.socketpair()
+        self.wake_reader.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server, selectors.EVENT_READ)
+        self.selector.register(self.wake_reader, selectors.EVENT_READ)
+        self.clients = {}
+        self.sequence = 0
+        self.latest_record = None
+        self.stopping = False
+        self.lock = threading.Lock()
+        self.published = 0
+        self.connections = 0
+        self.disconnections = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, daemon=True,
+                                       name="snapshot-publisher")
+        self.thread.start()
+
+    def publish(self, snapshot):
+        """Send a snapshot to all clients."""
+        self.sequence += 1
+        self.records.append(pack_snapshot(self.sequence, snapshot))
+        self.wake_writer.send(b'\0')
+
+    def stop(self, timeout=None):
+        """Disconnect all clients and remove the socket file."""
+        self.stopping = True
+        self.wake_writer.send(b'\0')
+        self.thread.join(timeout)
+
+    def statistics(self):
+        """Get a dictionary of the client and delivery counts."""
+        with self.lock:
+            return {'clients': len(self.clients),
+                    'published': self.published,
+                    'connections': self.connections,
+                    'disconnections': self.disconnections,
+                    'dropped': self.dropped + sum(
+                        c.dropped for c in self.clients.values())}
+
+    def _remove_old_socket(self):
+        # Remove a socket file left by a daemon which did not stop
+        # normally, but not one which is in use
+        if not os.path.exists(self.path):
+            return
+        test = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            test.connect(self.path)
+        except ConnectionRefusedError:
+            os.remove(self.path)
+            return
+        finally:
+            test.close()
+        raise RuntimeError(f"Another daemon is using {self.path}")
+
+    def _run(self):
+        while not self.stopping:
+            for (key, events) in self.selector.select():
+                if key.fileobj is self.server:
+                    self._accept()
+                elif key.fileobj is self.wake_reader:
+                    self._send_new_records()
+                else:
+                    # A client may have been disconnected by an earlier
+                    # event in this loop
+                    if ((events & selectors.EVENT_WRITE)
+                            and (key.fileobj in self.clients)):
+                        self._send(self.clients[key.fileobj])
+                    if ((events & selectors.EVENT_READ)
+                            and (key.fileobj in self.clients)):
+                        self._receive(key.fileobj)
+        for connection in list(self.clients):
+            self._disconnect(connection)
+        self.selector.close()
+        self.server.close()
+        os.remove(self.path)
+        self.wake_reader.close()
+        self.wake_writer.close()
+
+    def _accept(self):
+        try:
+            (connection, _) = self.server.accept()
+        except BlockingIOError:
+            return
+        connection.setblocking(False)
+        client = ClientConnection(connection, self.client_queue_length)
+        with self.lock:
+            self.clients[connection] = client
+            self.connections += 1
+        self.selector.register(connection, selectors.EVENT_READ)
+        if self.latest_record is not None:
+            # Send the newest data immediately
+            client.add(self.latest_record)
+            self._send(client)
+
+    def _send_new_records(self):
+        try:
+            while self.wake_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self.records:
+            record = self.records.popleft()
+            self.latest_record = record
+            with self.lock:
+                self.published += 1
+            for client in list(self.clients.values()):
+                was_waiting = bool(client.waiting)
+                client.add(record)
+                if not was_waiting:
+                    self._send(client)
+
+    def _send(self, client):
+        # Send the waiting records, and ask the selector to report when
+        # more can be sent if they were not all sent
+        try:
+            finished = client.send()
+        except OSError:
+            self._disconnect(client.connection)
+            return
+        events = selectors.EVENT_READ
+        if not finished:
+            events |= selectors.EVENT_WRITE
+        if self.selector.get_key(client.connection).events != events:
+            self.selector.modify(client.connection, events)
+
+    def _receive(self, connection):
+        # Clients do not send anything: an empty read means that the
+        # client has disconnected
+        try:
+            if connection.recv(4096):
+                return
+        except BlockingIOError:
+            return
+        except OSError:
+            pass
+        self._disconnect(connection)
+
+    def _disconnect(self, connection):
+        self.selector.unregister(connection)
+        connection.close()
+        with self.lock:
+            client = self.clients.pop(connection)
+            self.dropped += client.dropped
+            self.disconnections += 1
+
+
+def simulate(pipeline, cycle_seconds):
+    """Emit data from a simulated MS430 periodically, until stopped."""
+    from .simulator import SimulatedI2CBus
+    I2C_bus = SimulatedI2CBus()
+    while not pipeline.stopping.wait(cycle_seconds):
+        pipeline.cycles += 1
+        pipeline.emit(read_snapshot(I2C_bus))
+
+
+def main():
+    publisher = SnapshotPublisher(socket_path, client_queue_length)
+    pipeline = Pipeline()
+    pipeline.add_sink("socket", publisher.publish)
+    if shared_memory_name is not None:
+        shared_writer = SharedReadingWriter(shared_memory_name)
+        # Only the newest data are useful
+        pipeline.add_sink("shared_memory", shared_writer.write, queue_size=1)
+    if statistics_cycles is not None:
+
+        def print_statistics(snapshot):
+            """Print the statistics, periodically."""
+            if (pipeline.cycles % statistics_cycles) == 0:
+                statistics = pipeline.statistics()
+                statistics['clients'] = publisher.statistics()
+                print(json.dumps(statistics, indent=2))
+
+        pipeline.add_sink("statistics", print_statistics, queue_size=1)
+
+    # Stop normally (removing the socket file) when asked to terminate
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    print(f"Sending data to the clients of {socket_path}. "
+          "Press ctrl-c to exit.")
+    try:
+        if simulated_cycle_seconds is not None:
+            simulate(pipeline, simulated_cycle_seconds)
+        else:
+            # Set up the hardware and apply the chosen settings
+            (GPIO, I2C_bus) = sensor.SensorHardwareSetup()
+            I2C_bus.write_i2c_block_data(
+                sensor.i2c_7bit_address,
+                const.PARTICLE_SENSOR_SELECT_REG, [sensor.PARTICLE_SENSOR])
+            I2C_bus.write_i2c_block_data(
+                sensor.i2c_7bit_address, const.CYCLE_TIME_PERIOD_REG,
+                [cycle_period])
+            I2C_bus.write_byte(sensor.i2c_7bit_address,
+                               const.CYCLE_MODE_CMD)
+            pipeline.run(GPIO, I2C_bus)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop(1)
+        publisher.stop(1)
+        if shared_memory_name is not None:
+            shared_writer.close()
+
+
+if __name__ == '__main__':
+    main()
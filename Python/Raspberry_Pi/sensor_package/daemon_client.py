@@ -0,0 +1,121 @@
+"""Receive the MS430 data from the acquisition daemon.
+
+This file contains a class which connects to the daemon (see daemon.py)
+through its Unix domain socket, and receives each new set of data as a
+dictionary (see unpack_snapshot() in snapshot_format.py). Any number of
+programs can receive the data at the same time, while the daemon is the
+only program which uses the sensor hardware.
+
+The daemon sends the newest data as soon as a program connects, then
+each new set of data. If a program is too slow to receive them, the
+oldest waiting data are discarded by the daemon: this is shown by a gap
+in the sequence numbers, and counted by the "missed" attribute.
+
+This file does not use the sensor hardware, so it can be used on any
+computer (which has Unix domain sockets).
+
+Example:
+
+    with DaemonClient() as client:
+        for data in client:
+            print(data['time'], data['values']['T'])
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import socket
+from .snapshot_format import RECORD, unpack_snapshot
+
+# The socket file used if no other is chosen
+DEFAULT_SOCKET_PATH = "/tmp/ms430_daemon.sock"
+
+
+class DaemonClient:
+    """Receive each new set of data from the acquisition daemon."""
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH):
+        """Connect to the daemon.
+
+        Raises OSError (e.g. FileNotFoundError) if the daemon is not
+        running.
+        """
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.socket.connect(socket_path)
+        except OSError:
+            self.socket.close()
+            raise
+        # Received bytes which do not yet form a whole record
+        self.buffer = bytearray()
+        self.last_sequence = None
+        self.missed = 0
+
+    def read(self, timeout=None, newest=False):
+        """Wait for the next set of data and return it.
+
+        timeout: the longest time to wait, in seconds, or None to wait
+                 until data are received
+        newest: if True, skip any data which are already waiting and
+                return the newest
+        Returns None if the timeout expires. Raises ConnectionError if the
+        daemon has stopped.
+        """
+        if newest:
+            self._receive_waiting()
+        if len(self.buffer) < RECORD.size:
+            self.socket.settimeout(timeout)
+            try:
+                while len(self.buffer) < RECORD.size:
+                    self._receive()
+            except socket.timeout:
+                return None
+        offset = 0
+        if newest:
+            offset = RECORD.size * ((len(self.buffer) // RECORD.size) - 1)
+        data = unpack_snapshot(self.buffer, offset)
+        del self.buffer[0:(offset + RECORD.size)]
+        if self.last_sequence is not None:
+            self.missed += data['sequence'] - self.last_sequence - 1
+        self.last_sequence = data['sequence']
+        return data
+
+    def __iter__(self):
+        """Yield each new set of data, until the daemon stops."""
+        while True:
+            try:
+                yield self.read()
+            except ConnectionError:
+                return
+
+    def fileno(self):
+        """Get the socket file descriptor, e.g. for use with selectors."""
+        return self.socket.fileno()
+
+    def close(self):
+        """Disconnect from the daemon."""
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def _receive(self):
+        received = self.socket.recv(65536)
+        if not received:
+            raise ConnectionError("The daemon closed the connection")
+        self.buffer += received
+
+    def _receive_waiting(self):
+        # Add all data which are already waiting to the buffer
+        self.socket.setblocking(False)
+        try:
+            while True:
+                self._receive()
+        except BlockingIOError:
+            pass
@@ -0,0 +1,334 @@
+"""Fixed-length buffer for storing a history of environment data.
+
+This file contains a FIFO data buffer class which is used by the
+graph web server to store the most recent values of each variable, and
+a class which keeps a downsampled copy of the buffer for plotting long
+histories. The buffer can be kept in a memory-mapped file, so that the
+data are not lost when the program is restarted.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+# The header of a buffer file: identifier, file format version,
+# little-endian flag, variable count, buffer length, time resolution,
+# time base (NaN if not yet set), and the begin and end sequence numbers
+# which guard against partly-written data (see DataBuffer).
+FILE_HEADER_FORMAT = '<4sBBHIHdQQ'
+FILE_IDENTIFIER = b'MSDB'
+FILE_FORMAT_VERSION = 1
+# The data start at a fixed offset, after the header
+FILE_HEADER_SIZE = 64
+TIME_BASE_OFFSET = struct.calcsize('<4sBBHIH')
+BEGIN_SEQUENCE_OFFSET = TIME_BASE_OFFSET + 8
+END_SEQUENCE_OFFSET = BEGIN_SEQUENCE_OFFSET + 8
+
+
+class DataBuffer:
+    """Store the most recent values of several variables as 32-bit floats.
+
+    All values are held in one preallocated array, which contains a
+    circular buffer for each variable, one after the other. Each set of
+    values appended gets the next sequence number and a timestamp. The
+    timestamps are stored in a second array, as 32-bit unsigned integer
+    numbers of time_resolution_ms since time_base (which is a whole number
+    of seconds since the epoch). The stored data can be read without
+    copying, as memoryview slices of the arrays, and are in the byte
+    order of the host (little-endian on Raspberry Pi).
+
+    If a file path is given, the arrays are kept in a memory-mapped file
+    which is updated in place, so the data survive a restart or crash of
+    the program and are available again immediately. Before each set of
+    data is written, the file header "begin" sequence number is set to
+    its sequence number, and the "end" sequence number is set to match
+    once writing is complete. If these differ when the file is opened,
+    the newest set of data was only partly written (overwriting the
+    oldest set), and neither is used. A file which does not match the
+    buffer settings is replaced by an empty buffer.
+    """
+
+    def __init__(self, variable_count, length, time_resolution_ms=100,
+                 file_path=None):
+        """Create a buffer, which is empty unless a file is used.
+
+        variable_count: the number of values in each set of data
+        length: the maximum number of values of each variable
+        time_resolution_ms: the timestamp unit; the default allows data
+                            to be stored for up to 13 years
+        file_path: a file in which to keep the data, or None to keep
+                   them in memory only
+        """
+        if length < 1:
+            raise ValueError("Buffer length must be at least 1")
+        self.variable_count = variable_count
+        self.length = length
+        self.time_resolution_ms = time_resolution_ms
+        self.time_base = None
+        self.last_sequence = 0
+        self.mapped_file = None
+        data_size = 4 * (variable_count + 1) * length
+        if file_path is None:
+            data = memoryview(bytearray(data_size))
+            partly_written = False
+        else:
+            partly_written = self._open_file(file_path, data_size)
+            data = memoryview(self.mapped_file)[FILE_HEADER_SIZE:]
+        self.value_bytes = data[0:(4 * variable_count * length)]
+        self.values = self.value_bytes.cast('f')
+        self.time_bytes = data[(4 * variable_count * length):]
+        self.times = self.time_bytes.cast('I')
+        self.next_index = self.last_sequence % length
+        self.count = min(self.last_sequence, length - int(partly_written))
+        # BucketSummary objects, by bucket size, which are updated with
+        # each new set of data
+        self.summaries = {}
+
+    def append(self, values, timestamp):
+        """Add one value of each variable, replacing the oldest if full.
+
+        timestamp: the time of the data, in seconds since the epoch
+        """
+        if self.time_base is None:
+            self.time_base = math.floor(timestamp)
+            if self.mapped_file is not None:
+                struct.pack_into('<d', self.mapped_file, TIME_BASE_OFFSET,
+                                 self.time_base)
+        time_value = min(max(0, round(
+            (timestamp - self.time_base) * 1000 / self.time_resolution_ms)),
+            0xFFFFFFFF)
+        self._store(values, time_value)
+        for summary in self.summaries.values():
+            summary.add(self.last_sequence, time_value, values)
+
+    def summary(self, bucket_size):
+        """Get a BucketSummary of the data, creating it if necessary."""
+        if bucket_size not in self.summaries:
+            self.summaries[bucket_size] = BucketSummary(self, bucket_size)
+        return self.summaries[bucket_size]
+
+    def _store(self, values, time_value):
+        if self.mapped_file is not None:
+            struct.pack_into('<Q', self.mapped_file, BEGIN_SEQUENCE_OFFSET,
+                             self.last_sequence + 1)
+        self.times[self.next_index] = time_value
+        for i, value in enumerate(values):
+            self.values[(i * self.length) + self.next_index] = value
+        self.next_index = (self.next_index + 1) % self.length
+        self.count = min(self.count + 1, self.length)
+        self.last_sequence += 1
+        if self.mapped_file is not None:
+            struct.pack_into('<Q', self.mapped_file, END_SEQUENCE_OFFSET,
+                             self.last_sequence)
+
+    def _open_file(self, file_path, data_size):
+        # Map the buffer file, replacing it if it cannot be used, and
+        # read the header. Returns True if the newest data were only
+        # partly written.
+        with open(file_path, 'a+b') as f:
+            f.seek(0)
+            header = f.read(struct.calcsize(FILE_HEADER_FORMAT))
+            expected = (FILE_IDENTIFIER, FILE_FORMAT_VERSION,
+                        int(sys.byteorder == 'little'), self.variable_count,
+                        self.length, self.time_resolution_ms)
+            valid = ((os.fstat(f.fileno()).st_size
+                      == (FILE_HEADER_SIZE + data_size))
+                     and (struct.unpack(FILE_HEADER_FORMAT,
+                                        header)[0:6] == expected))
+            if valid:
+                (time_base, begin, end) = struct.unpack(
+                    FILE_HEADER_FORMAT, header)[6:]
+                valid = ((begin - end) in (0, 1)
+                         and ((end == 0) or not math.isnan(time_base)))
+            if not valid:
+                (time_base, begin, end) = (math.nan, 0, 0)
+                f.truncate(0)
+                f.write(struct.pack(FILE_HEADER_FORMAT, *expected,
+                                    time_base, begin, end))
+                f.truncate(FILE_HEADER_SIZE + data_size)
+            self.mapped_file = mmap.mmap(f.fileno(), 0)
+        if not math.isnan(time_base):
+            self.time_base = time_base
+        self.last_sequence = end
+        return begin != end
+
+    def first_sequence(self):
+        """Get the sequence number of the oldest stored values."""
+        return self.last_sequence - self.count + 1
+
+    def latest(self):
+        """Get a list of the newest value of each variable."""
+        if self.count == 0:
+            return []
+        return self.row(self.last_sequence)[1]
+
+    def row(self, sequence):
+        """Get the data which have the given sequence number.
+
+        Returns (timestamp, list of values), or None if these data are
+        not in the buffer.
+        """
+        if ((sequence < self.first_sequence())
+                or (sequence > self.last_sequence)):
+            return None
+        (time_value, values) = self._raw_row(sequence)
+        return (self.timestamp(time_value), values)
+
+    def _raw_row(self, sequence):
+        # Get the stored time value and values of a sequence number
+        index = ((self.next_index - 1 - (self.last_sequence - sequence))
+                 % self.length)
+        return (self.times[index],
+                [self.values[(i * self.length) + index]
+                 for i in range(self.variable_count)])
+
+    def timestamp(self, time_value):
+        """Convert a stored time value to seconds since the epoch."""
+        return self.time_base + (time_value * self.time_resolution_ms / 1000)
+
+    def slices(self, variable, count):
+        """Get the newest "count" values of one variable, as bytes.
+
+        Returns a list of one or two memoryview slices which together
+        contain the values in order, oldest first.
+        """
+        return self._ring_slices(self.value_bytes,
+                                 variable * self.length, count)
+
+    def time_slices(self, count):
+        """Get the newest "count" stored time values, as bytes.
+
+        Returns a list of one or two memoryview slices which together
+        contain the time values in order, oldest first.
+        """
+        return self._ring_slices(self.time_bytes, 0, count)
+
+    def _ring_slices(self, view, offset, count):
+        # Each stored item has 4 bytes. The circular buffer starts at
+        # item number "offset" of the view.
+        count = min(count, self.count)
+        if count <= 0:
+            return []
+        start = (self.next_index - count) % self.length
+        first = 4 * (offset + start)
+        if (start + count) <= self.length:
+            return [view[first:(first + (4 * count))]]
+        first_count = self.length - start
+        return [view[first:(first + (4 * first_count))],
+                view[(4 * offset):(4 * (offset + count - first_count))]]
+
+
+class BucketSummary:
+    """Store a downsampled copy of the data in a DataBuffer.
+
+    The data are divided into buckets of "bucket_size" sets of data,
+    aligned to the sequence numbers, and each bucket is reduced to two
+    sets of data: the minimum and maximum of each variable, in the order
+    in which they occurred, with the times of the first and last data in
+    the bucket. Peaks are therefore kept however much the data are
+    reduced. Completed buckets are calculated once and stored in a
+    DataBuffer which shares the time base of the source buffer. The
+    newest bucket is updated as each set of data arrives and is included
+    in the output before it is complete. A bucket which has lost some of
+    its oldest data from the source buffer is omitted.
+    """
+
+    def __init__(self, source, bucket_size):
+        """Summarize the data which are already in the source buffer."""
+        self.source = source
+        self.bucket_size = bucket_size
+        self.buckets = DataBuffer(source.variable_count,
+                                  2 * ((source.length // bucket_size) + 1),
+                                  source.time_resolution_ms)
+        self._start_bucket()
+        # Data before the start of the first complete bucket are ignored
+        self.first_sequence = (self._first_complete_bucket()
+                               * bucket_size) + 1
+        for sequence in range(self.first_sequence, source.last_sequence + 1):
+            self.add(sequence, *source._raw_row(sequence))
+
+    def add(self, sequence, time_value, values):
+        """Add the data with the given sequence number to the newest bucket."""
+        if sequence < self.first_sequence:
+            return
+        if self.open_count == 0:
+            self.open_times[0] = time_value
+        self.open_times[1] = time_value
+        for i, value in enumerate(values):
+            if math.isnan(value):
+                continue
+            if math.isnan(self.minima[i]) or (value < self.minima[i]):
+                self.minima[i] = value
+                self.minimum_positions[i] = self.open_count
+            if math.isnan(self.maxima[i]) or (value > self.maxima[i]):
+                self.maxima[i] = value
+                self.maximum_positions[i] = self.open_count
+        self.open_count += 1
+        if (sequence % self.bucket_size) == 0:
+            if self.buckets.time_base is None:
+                self.buckets.time_base = self.source.time_base
+            (first, second) = self._extremes()
+            self.buckets._store(first, self.open_times[0])
+            self.buckets._store(second, self.open_times[1])
+            self._start_bucket()
+
+    def count(self):
+        """Get the number of sets of data in the summary."""
+        complete = min((self.source.last_sequence // self.bucket_size)
+                       - self._first_complete_bucket(),
+                       self.buckets.count // 2)
+        return (2 * max(0, complete)) + self._open_points()
+
+    def time_slices(self, count):
+        """Get the stored time values, as for DataBuffer.time_slices()."""
+        parts = self.buckets.time_slices(count - self._open_points())
+        if self._open_points():
+            parts.append(memoryview(self.open_times).cast('B'))
+        return parts
+
+    def slices(self, variable, count):
+        """Get the values of one variable, as for DataBuffer.slices()."""
+        parts = self.buckets.slices(variable, count - self._open_points())
+        if self._open_points():
+            open_values = array('f', [e[variable] for e in self._extremes()])
+            parts.append(memoryview(open_values).cast('B'))
+        return parts
+
+    def _open_points(self):
+        # The newest bucket gives two points if it has data, all of which
+        # are still in the source buffer
+        return 2 if (0 < self.open_count <= self.source.count) else 0
+
+    def _first_complete_bucket(self):
+        # The number of the oldest bucket whose data are all in the source
+        return -((1 - self.source.first_sequence()) // self.bucket_size)
+
+    def _extremes(self):
+        # Get the two sets of values of the newest bucket, in time order
+        first = []
+        second = []
+        for i in range(self.source.variable_count):
+            if self.minimum_positions[i] <= self.maximum_positions[i]:
+                first.append(self.minima[i])
+                second.append(self.maxima[i])
+            else:
+                first.append(self.maxima[i])
+                second.append(self.minima[i])
+        return (first, second)
+
+    def _start_bucket(self):
+        self.open_count = 0
+        self.open_times = array('I', [0, 0])
+        self.minima = [math.nan] * self.source.variable_count
+        self.maxima = [math.nan] * self.source.variable_count
+        self.minimum_positions = [0] * self.source.variable_count
+        self.maximum_positions = [0] * self.source.variable_count
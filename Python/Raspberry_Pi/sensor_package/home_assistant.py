@@ -0,0 +1,328 @@
+"""Send environment data to Home Assistant.
+
+This file contains two classes with the same interface. The first posts
+the state of each Home Assistant entity (one per variable) using the
+REST API, over a pool of persistent connections. The posts for each set
+of data are made concurrently, so that a slow or failed post does not
+delay the others, and they fail immediately while Home Assistant is not
+responding (see http_client.py).
+
+The second publishes the data to an MQTT broker which is used by Home
+Assistant: the entities are created automatically by MQTT discovery,
+and each set of data is sent as one message. This needs the paho-mqtt
+package (pip3 install paho-mqtt).
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import json
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from . import sensor_functions as sensor
+from . import sensor_constants as const
+from .http_client import HTTPClient
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:
+    mqtt = None
+
+
+def sensor_entities():
+    """Get the list of entity descriptions for the MS430 data.
+
+    The particle concentration is included only if a particle sensor is
+    selected in sensor_functions.py. Icons are chosen from
+    https://cdn.materialdesignicons.com/5.3.45/ (remove the "mdi-" part
+    from the icon name).
+    """
+    if sensor.USE_FAHRENHEIT:
+        temperature_unit = const.FAHRENHEIT_SYMBOL
+    else:
+        temperature_unit = const.CELSIUS_SYMBOL
+    entities = [
+        dict(name='Pressure', unit='Pa', icon='weather-cloudy', decimals=0),
+        dict(name='Humidity', unit='%', icon='water-percent', decimals=1),
+        dict(name='Temperature', unit=temperature_unit, icon='thermometer',
+             decimals=1),
+        dict(name='Illuminance', unit='lx', icon='white-balance-sunny',
+             decimals=2),
+        dict(name='Sound level', unit='dBA', icon='microphone', decimals=1),
+        dict(name='Sound peak', unit='mPa', icon='waveform', decimals=2),
+        dict(name='Air Quality Index', unit=' ',
+             icon='thought-bubble-outline', decimals=1),
+        dict(name='Air quality assessment', unit='', icon='flower-tulip',
+             decimals=0)]
+    if sensor.PARTICLE_SENSOR != const.PARTICLE_SENSOR_OFF:
+        if sensor.PARTICLE_SENSOR == const.PARTICLE_SENSOR_PPD42:
+            particle_unit = "ppL"
+        else:
+            particle_unit = const.SDS011_CONC_SYMBOL
+        entities.append(dict(name='Particle concentration',
+                             unit=particle_unit, icon='chart-bubble',
+                             decimals=2))
+    return entities
+
+
+def sensor_values(air_data, air_quality_data, light_data, sound_data,
+                  particle_data):
+    """Get a dictionary of the values of the sensor_entities(), by name.
+
+    particle_data is not used (and can be None) if there is no particle
+    sensor.
+    """
+    values = {
+        'Pressure': air_data['P_Pa'],
+        'Humidity': air_data['H_pc'],
+        'Temperature': air_data['T'],
+        'Illuminance': light_data['illum_lux'],
+        'Sound level': sound_data['SPL_dBA'],
+        'Sound peak': sound_data['peak_amp_mPa'],
+        'Air Quality Index': air_quality_data['AQI'],
+        'Air quality assessment': sensor.interpret_AQI_value(
+            air_quality_data['AQI'])}
+    if sensor.PARTICLE_SENSOR != const.PARTICLE_SENSOR_OFF:
+        values['Particle concentration'] = particle_data['concentration']
+    return values
+
+
+class HomeAssistantPublisher:
+    """Post entity states to Home Assistant.
+
+    Each entity is described by a dictionary with keys: name, unit, icon
+    (from https://cdn.materialdesignicons.com/5.3.45/ without the "mdi-"
+    part) and decimals (the number of decimal places for numeric data).
+    The URL and the JSON body of each entity, apart from the state value,
+    are made once when the publisher is created.
+    """
+
+    def __init__(self, host, access_token, sensor_name, entities,
+                 port=8123, max_workers=4, timeout=2):
+        """Create the connection pool and the entity requests.
+
+        host: the IP address or host name of the Home Assistant computer
+        access_token: a Home Assistant long-lived access token
+        sensor_name: the first part of each entity ID, e.g. "kitchen3"
+        entities: a list of entity description dictionaries
+        max_workers: the maximum number of simultaneous posts
+        timeout: the maximum time to wait for each post, in seconds (the
+                 timeout is shorter if Home Assistant responds quickly)
+        """
+        self.timeout = timeout
+        self.client = HTTPClient(pool_size=max_workers, max_timeout=timeout)
+        self.headers = {"Content-type": "application/json",
+                        "Authorization": "Bearer " + access_token}
+        self.executor = ThreadPoolExecutor(max_workers)
+        self.entities = {}
+        for entity in entities:
+            url = (f"http://{host}:{port}/api/states/{sensor_name}."
+                   + entity['name'].replace(' ', '_'))
+            attributes = json.dumps({
+                "unit_of_measurement": entity['unit'],
+                "friendly_name": entity['name'],
+                "icon": "mdi:" + entity['icon']})
+            # The body is made by adding the state value, as JSON, to this
+            body_end = ', "attributes": ' + attributes + '}'
+            self.entities[entity['name']] = (url, body_end,
+                                             entity['decimals'])
+
+    def publish(self, values):
+        """Post the states of the entities, then wait for completion.
+
+        values: a dictionary of the data values, by entity name. Entities
+                which are not included are not posted.
+        Returns a dictionary of the exceptions raised by the failed posts,
+        by entity name (empty if all succeeded).
+        """
+        futures = {self.executor.submit(self._post, name, value): name
+                   for (name, value) in values.items()}
+        (done, not_done) = wait(futures, self.timeout * 2)
+        failures = {futures[f]: TimeoutError("No response")
+                    for f in not_done}
+        for future in done:
+            if future.exception() is not None:
+                failures[futures[future]] = future.exception()
+        return failures
+
+    def close(self):
+        """Close the connections and stop the worker threads."""
+        self.executor.shutdown()
+        self.client.close()
+
+    def _post(self, name, value):
+        (url, body_end, decimals) = self.entities[name]
+        try:
+            state = f"{value:.{decimals}f}"
+        except (TypeError, ValueError):
+            state = str(value)
+        response = self.client.post(
+            url, data=('{"state": ' + json.dumps(state)
+                       + body_end).encode('utf-8'), headers=self.headers)
+        response.raise_for_status()
+
+
+class HomeAssistantMQTTPublisher:
+    """Publish entity states to Home Assistant through an MQTT broker.
+
+    The entities are described in the same way as for
+    HomeAssistantPublisher, and are grouped as one Home Assistant device.
+    Their discovery configurations are published (retained) when the
+    connection is made, and again if Home Assistant restarts. Each set
+    of data is then sent as a single JSON message on the state topic.
+
+    The connection is kept open, and is remade automatically if it is
+    lost. Data published while there is no connection are kept in a
+    buffer (the oldest are dropped when it is full) and are sent, in
+    order, when the connection returns.
+    """
+
+    def __init__(self, host, sensor_name, entities, port=1883,
+                 username=None, password=None, qos=1,
+                 discovery_prefix="homeassistant", max_buffered=1000):
+        """Start connecting to the broker, in the background.
+
+        host: the IP address or host name of the MQTT broker
+        sensor_name: the device name, which is also the first part of
+                     each entity ID, e.g. "kitchen3"
+        entities: a list of entity description dictionaries
+        qos: the MQTT quality of service of the state messages (0, 1 or 2)
+        max_buffered: the maximum number of sets of data to keep while
+                      there is no connection
+        """
+        if mqtt is None:
+            raise ImportError("The MQTT publisher needs the paho-mqtt "
+                              "package: pip3 install paho-mqtt")
+        self.qos = qos
+        self.discovery_prefix = discovery_prefix
+        self.state_topic = f"metriful/{sensor_name}/state"
+        self.availability_topic = f"metriful/{sensor_name}/availability"
+        self.status_topic = discovery_prefix + "/status"
+        self.buffer = deque(maxlen=max_buffered)
+        self.lock = threading.Lock()
+        self.connected = False
+        self.state = {}
+        self.last_payload = None
+        self.entities = {}
+        self.configs = []
+        device = {"identifiers": ["metriful_" + sensor_name],
+                  "name": sensor_name, "manufacturer": "Metriful",
+                  "model": "MS430"}
+        for entity in entities:
+            key = entity['name'].lower().replace(' ', '_')
+            self.entities[entity['name']] = (key, entity['decimals'])
+            config = {
+                "name": entity['name'],
+                "object_id": f"{sensor_name}_{key}",
+                "unique_id": f"metriful_{sensor_name}_{key}",
+                "state_topic": self.state_topic,
+                "value_template": "{{ value_json." + key + " }}",
+                "availability_topic": self.availability_topic,
+                "icon": "mdi:" + entity['icon'],
+                "device": device}
+            if entity['unit'].strip() != '':
+                config["unit_of_measurement"] = entity['unit']
+            self.configs.append(
+                (f"{discovery_prefix}/sensor/{sensor_name}/{key}/config",
+                 json.dumps(config)))
+
+        if hasattr(mqtt, 'CallbackAPIVersion'):
+            # paho-mqtt version 2 or later
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2,
+                                      client_id="metriful_" + sensor_name)
+        else:
+            self.client = mqtt.Client(client_id="metriful_" + sensor_name)
+        if username is not None:
+            self.client.username_pw_set(username, password)
+        # The broker publishes "offline" if the connection is lost
+        self.client.will_set(self.availability_topic, "offline", 1, True)
+        self.client.reconnect_delay_set(1, 60)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.connect_async(host, port, keepalive=60)
+        self.client.loop_start()
+
+    def publish(self, values):
+        """Publish a set of data, or buffer it if there is no connection.
+
+        values: a dictionary of the data values, by entity name. Entities
+                which are not included keep their previous values, and
+                nothing is sent if it is empty.
+        Returns an empty dictionary, like HomeAssistantPublisher when
+        there are no failures: data which cannot be sent now are sent
+        later.
+        """
+        if not values:
+            return {}
+        # Each message contains all entities, because Home Assistant
+        # reads each entity state from every message
+        for (name, value) in values.items():
+            (key, decimals) = self.entities[name]
+            try:
+                self.state[key] = f"{value:.{decimals}f}"
+            except (TypeError, ValueError):
+                self.state[key] = str(value)
+        payload = json.dumps(dict(self.state, time=round(time.time())))
+        with self.lock:
+            self.last_payload = payload
+            if self.connected and not self.buffer:
+                if self._send(payload):
+                    return {}
+            self.buffer.append(payload)
+        return {}
+
+    def close(self):
+        """Mark the sensor as offline and close the connection."""
+        with self.lock:
+            if self.connected:
+                self.client.publish(self.availability_topic, "offline", 1,
+                                    True).wait_for_publish(2)
+            self.connected = False
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def _send(self, payload):
+        # Return False if the message could not be given to the client
+        info = self.client.publish(self.state_topic, payload, self.qos)
+        return info.rc == mqtt.MQTT_ERR_SUCCESS
+
+    def _publish_configs(self):
+        for (topic, config) in self.configs:
+            self.client.publish(topic, config, 1, True)
+        self.client.publish(self.availability_topic, "online", 1, True)
+
+    def _on_connect(self, client, userdata, flags, reason_code,
+                    properties=None):
+        if reason_code != 0:
+            print(f"MQTT connection refused: {reason_code}")
+            return
+        client.subscribe(self.status_topic, 1)
+        with self.lock:
+            self._publish_configs()
+            while self.buffer:
+                if not self._send(self.buffer[0]):
+                    return
+                self.buffer.popleft()
+            self.connected = True
+
+    def _on_disconnect(self, client, userdata, *args):
+        with self.lock:
+            if self.connected:
+                print("MQTT connection lost: reconnecting in the "
+                      "background.")
+            self.connected = False
+
+    def _on_message(self, client, userdata, message):
+        # Home Assistant sends "online" when it starts, and then needs the
+        # discovery configurations and states to be sent again
+        if (message.topic == self.status_topic
+                and message.payload == b"online"):
+            with self.lock:
+                self._publish_configs()
+                if self.connected and (self.last_payload is not None):
+                    self._send(self.last_payload)
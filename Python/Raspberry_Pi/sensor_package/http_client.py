@@ -0,0 +1,220 @@
+"""Make HTTP requests which fail quickly when a server is not responding.
+
+This file contains an HTTP client class for the examples which send data
+to other services. It keeps connections open for reuse, and keeps a
+"circuit breaker" for each server (endpoint):
+
+- After several failed requests in a row, the breaker "opens" and further
+  requests to that server fail immediately, without waiting, for a delay
+  which doubles (with some randomness) each time, up to a maximum.
+- After the delay, one request is allowed through as a test ("half-open").
+  If it succeeds, the breaker closes and requests continue as normal,
+  otherwise it opens again.
+
+The timeout of each request follows the measured response times of the
+server (like the TCP retransmission timeout), so a server which stops
+responding is detected quickly without failing when it is just slow.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import time
+import random
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """A request was not made because the server is not responding."""
+
+
+class Endpoint:
+    """The circuit breaker, timeout and statistics of one server."""
+
+    def __init__(self, name, failure_threshold, min_timeout, max_timeout,
+                 min_open_seconds, max_open_seconds):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.min_open_seconds = min_open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.open_until = 0
+        self.open_count = 0
+        self.probing = False
+        self.consecutive_failures = 0
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.last_error = None
+        # The smoothed response time and its variation, in seconds
+        self.smoothed_time = None
+        self.time_variation = None
+        self.timeout = max_timeout
+
+    def allow(self):
+        """Return the timeout for a new request, or raise CircuitOpenError."""
+        with self.lock:
+            if self.state == OPEN and time.monotonic() >= self.open_until:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return self.timeout
+            if self.state == HALF_OPEN and not self.probing:
+                # Allow one test request, with the longest timeout
+                self.probing = True
+                return self.max_timeout
+            self.rejected += 1
+            raise CircuitOpenError(f"Requests to {self.name} are paused "
+                                   f"after {self.consecutive_failures} "
+                                   f"failures")
+
+    def record_success(self, seconds):
+        """Record a response which was received in the given time."""
+        with self.lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.probing = False
+            if self.state != CLOSED:
+                self.state = CLOSED
+                self.open_count = 0
+                print(f"Connection to {self.name} restored.")
+            if self.smoothed_time is None:
+                self.smoothed_time = seconds
+                self.time_variation = seconds / 2
+            else:
+                self.time_variation = ((0.75 * self.time_variation)
+                                       + (0.25 * abs(self.smoothed_time
+                                                     - seconds)))
+                self.smoothed_time = ((0.875 * self.smoothed_time)
+                                      + (0.125 * seconds))
+            self.timeout = min(max(self.smoothed_time
+                                   + (4 * self.time_variation),
+                                   self.min_timeout), self.max_timeout)
+
+    def record_failure(self, error):
+        """Record a failed request: open the breaker if necessary."""
+        with self.lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = error
+            self.probing = False
+            if isinstance(error, requests.exceptions.Timeout):
+                # The server may have become slower
+                self.timeout = min(2 * self.timeout, self.max_timeout)
+            if ((self.state == HALF_OPEN) or (self.consecutive_failures
+                                              >= self.failure_threshold)):
+                self.open_count += 1
+                doublings = min(self.open_count - 1, 20)
+                delay = min(self.min_open_seconds * (2 ** doublings),
+                            self.max_open_seconds)
+                delay *= random.uniform(0.8, 1.0)
+                self.open_until = time.monotonic() + delay
+                if self.state != OPEN:
+                    print(f"Connection to {self.name} failed: requests "
+                          f"are paused for {delay:.0f} s.")
+                self.state = OPEN
+
+    def health(self):
+        """Get a dictionary of the state and statistics."""
+        with self.lock:
+            return {
+                'state': self.state, 'successes': self.successes,
+                'failures': self.failures, 'rejected': self.rejected,
+                'consecutive_failures': self.consecutive_failures,
+                'response_time_ms': (None if self.smoothed_time is None
+                                     else round(1000 * self.smoothed_time,
+                                                1)),
+                'timeout_s': round(self.timeout, 3),
+                'last_error': (None if self.last_error is None
+                               else repr(self.last_error))}
+
+
+class HTTPClient:
+    """Make HTTP requests through a circuit breaker for each server.
+
+    Requests raise CircuitOpenError (a requests ConnectionError) without
+    being sent while the server's breaker is open. A request fails if it
+    raises a connection error or timeout, or gets a 5xx or 429 ("too many
+    requests") response: the response is still returned in those cases.
+    """
+
+    def __init__(self, pool_size=4, failure_threshold=3, min_timeout=0.5,
+                 max_timeout=5, min_open_seconds=5, max_open_seconds=600):
+        """Create the connection pool.
+
+        pool_size: the number of connections to keep open to each server
+        failure_threshold: the number of failures in a row which opens
+                           the breaker
+        min_timeout, max_timeout: the limits of the request timeout, in
+                                  seconds
+        min_open_seconds, max_open_seconds: the limits of the time for
+                                            which the breaker stays open
+        """
+        self.settings = (failure_threshold, min_timeout, max_timeout,
+                         min_open_seconds, max_open_seconds)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def post(self, url, **kwargs):
+        """Make a POST request: see request()."""
+        return self.request("POST", url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """Make a GET request: see request()."""
+        return self.request("GET", url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        """Make a request, with the arguments of requests.request().
+
+        The timeout is chosen automatically and must not be given.
+        """
+        endpoint = self.endpoint(url)
+        timeout = endpoint.allow()
+        start = time.monotonic()
+        try:
+            response = self.session.request(method, url, timeout=timeout,
+                                            **kwargs)
+        except Exception as e:
+            endpoint.record_failure(e)
+            raise
+        if (response.status_code >= 500) or (response.status_code == 429):
+            endpoint.record_failure(requests.exceptions.HTTPError(
+                f"{response.status_code} {response.reason}"))
+        else:
+            endpoint.record_success(time.monotonic() - start)
+        return response
+
+    def endpoint(self, url):
+        """Get the Endpoint object for the server of a URL."""
+        parts = urlsplit(url)
+        name = f"{parts.scheme}://{parts.netloc}"
+        with self.lock:
+            if name not in self.endpoints:
+                self.endpoints[name] = Endpoint(name, *self.settings)
+            return self.endpoints[name]
+
+    def health(self):
+        """Get a dictionary of the health of each server, by URL."""
+        with self.lock:
+            endpoints = list(self.endpoints.values())
+        return {e.name: e.health() for e in endpoints}
+
+    def close(self):
+        """Close the open connections."""
+        self.session.close()
@@ -0,0 +1,209 @@
+"""Fast access to long histories of data from log_data_to_file.py.
+
+This file contains a class which converts a directory of data files
+(written by log_data_to_file.py, see log_files.py) into a binary cache
+file. The cache is memory-mapped, so that months of data can be opened
+immediately and without loading them all into memory. Only new or
+changed data files are read when the archive is opened again.
+
+The data can be read at a "level of detail" which suits a graph: for a
+long time range, the minimum and maximum value in each of a limited
+number of time intervals (e.g. one per pixel) are given, so that the
+peaks are still shown. These are obtained from precalculated summaries,
+so the time taken does not depend on the amount of data in the range.
+
+This file does not use the sensor hardware, so it can be used on any
+computer.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import os
+import json
+import math
+import numpy as np
+from .log_files import LOG_COLUMNS, list_log_files, read_log_file
+
+CACHE_FILE_NAME = "log_cache.dat"
+CACHE_INDEX_FILE_NAME = "log_cache.json"
+CACHE_FORMAT_VERSION = 1
+
+
+class LogArchive:
+    """Read a directory of data files through a memory-mapped cache.
+
+    Each row of the cache contains the time (seconds since the epoch)
+    followed by one value for each of LOG_COLUMNS, as 64-bit floats.
+    Values which are not in the data files (e.g. particle data, if no
+    particle sensor was used) are NaN. The cache index file lists the
+    data files which have been read, with their size and modification
+    time, so that a changed file (e.g. one which is still being written)
+    is read again.
+    """
+
+    def __init__(self, directory, cache_directory=None):
+        """Open the data files, updating the cache first if necessary.
+
+        directory: the directory containing the data files
+        cache_directory: the directory in which to keep the cache files,
+                         or None to use the data file directory
+        """
+        if cache_directory is None:
+            cache_directory = directory
+        self.cache_path = os.path.join(cache_directory, CACHE_FILE_NAME)
+        self.index_path = os.path.join(cache_directory,
+                                       CACHE_INDEX_FILE_NAME)
+        self.row_size = 1 + len(LOG_COLUMNS)
+        self._update_cache(directory)
+        if self.row_count > 0:
+            self.data = np.memmap(self.cache_path, dtype='<f8', mode='r',
+                                  shape=(self.row_count, self.row_size))
+        else:
+            self.data = np.zeros((0, self.row_size))
+        self.times = self.data[:, 0]
+        if np.any(np.diff(self.times) < 0):
+            # The clock was changed while logging: sort the data (this
+            # makes a copy in memory)
+            self.data = self.data[np.argsort(self.times, kind='stable')]
+            self.times = self.data[:, 0]
+        # The time of the first data in each interval, and the lists of
+        # minimum and maximum values for each column, for each level of
+        # detail (see summary())
+        self.summary_times = {}
+        self.summaries = {}
+
+    def __len__(self):
+        return self.row_count
+
+    def column_index(self, name):
+        """Get the cache column number of one of LOG_COLUMNS."""
+        return 1 + LOG_COLUMNS.index(name)
+
+    def time_range(self):
+        """Get the (first, last) data time, or None if there are no data."""
+        if self.row_count == 0:
+            return None
+        return (float(self.times[0]), float(self.times[-1]))
+
+    def find(self, start, end):
+        """Get the (first, end) row numbers for start <= time <= end."""
+        return (int(np.searchsorted(self.times, start, 'left')),
+                int(np.searchsorted(self.times, end, 'right')))
+
+    def rows(self, first, end):
+        """Get the rows from first to (but not including) end, as an array.
+
+        The array has one row per set of data: the time then the values.
+        """
+        return self.data[first:end]
+
+    def level_of_detail(self, column, start, end, points):
+        """Get the data of one column, reduced to suit a graph.
+
+        column: the cache column number (see column_index())
+        start, end: the time range, in seconds since the epoch
+        points: the approximate number of values wanted, e.g. the width
+                of the graph in pixels
+        Returns (times, values) arrays. If there are more than 2 * points
+        values in the time range, the range is divided into between
+        points and 2 * points intervals, and the minimum and maximum
+        value in each interval are given (with the time of the start of
+        the interval), so that the peaks are still shown.
+        """
+        (first, end) = self.find(start, end)
+        count = end - first
+        if count <= (2 * points):
+            return (np.array(self.times[first:end]),
+                    np.array(self.data[first:end, column]))
+        level = math.ceil(math.log2(count / (2 * points)))
+        (minimum, maximum) = self.summary(column, level)
+        first_interval = first >> level
+        end_interval = ((end - 1) >> level) + 1
+        interval_times = self.summary_times[level][
+            first_interval:end_interval]
+        times = np.repeat(interval_times, 2)
+        values = np.empty(times.size)
+        values[0::2] = minimum[first_interval:end_interval]
+        values[1::2] = maximum[first_interval:end_interval]
+        return (times, values)
+
+    def summary(self, column, level):
+        """Get the minimum and maximum values in intervals of 2**level rows.
+
+        Returns (minimum, maximum) arrays, with one value per interval.
+        NaN values are ignored. Summaries are calculated when first
+        needed, from the summary of the previous level, and are kept.
+        """
+        if column not in self.summaries:
+            values = np.array(self.data[:, column])
+            self.summaries[column] = [(values, values)]
+        levels = self.summaries[column]
+        while len(levels) <= level:
+            (minimum, maximum) = levels[-1]
+            if (minimum.size % 2) == 1:
+                minimum = np.append(minimum, np.nan)
+                maximum = np.append(maximum, np.nan)
+            levels.append((np.fmin(minimum[0::2], minimum[1::2]),
+                           np.fmax(maximum[0::2], maximum[1::2])))
+        if level not in self.summary_times:
+            self.summary_times[level] = np.array(
+                self.times[::(1 << level)])
+        return levels[level]
+
+    def _update_cache(self, directory):
+        # Check the cache index against the data files, then read the
+        # data files which are new or have changed (and all files after
+        # them) and add their data to the end of the cache.
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            if ((index.get('version') != CACHE_FORMAT_VERSION)
+                    or (index.get('row_size') != self.row_size)
+                    or (os.path.getsize(self.cache_path)
+                        < (8 * self.row_size
+                           * sum(f[3] for f in index['files'])))):
+                index = None
+        except (FileNotFoundError, ValueError):
+            index = None
+        cached_files = [] if index is None else index['files']
+        log_files = []
+        for (_, path) in list_log_files(directory):
+            status = os.stat(path)
+            log_files.append([os.path.basename(path), status.st_size,
+                              status.st_mtime])
+        unchanged = 0
+        while ((unchanged < min(len(cached_files), len(log_files)))
+               and (cached_files[unchanged][0:3] == log_files[unchanged])):
+            unchanged += 1
+        files = cached_files[0:unchanged]
+        self.row_count = sum(f[3] for f in files)
+        if (unchanged == len(log_files)) and (len(files)
+                                              == len(cached_files)):
+            return
+        if len(log_files) > unchanged:
+            print(f"Reading {len(log_files) - unchanged} data files...")
+        mode = 'r+b' if os.path.exists(self.cache_path) else 'w+b'
+        with open(self.cache_path, mode) as f:
+            f.truncate(8 * self.row_size * self.row_count)
+            f.seek(0, os.SEEK_END)
+            for (name, size, mtime) in log_files[unchanged:]:
+                data = list(read_log_file(os.path.join(directory, name)))
+                rows = np.full((len(data), self.row_size), np.nan)
+                for (n, (timestamp, values)) in enumerate(data):
+                    values = values[0:len(LOG_COLUMNS)]
+                    rows[n, 0] = timestamp
+                    rows[n, 1:(1 + len(values))] = values
+                f.write(rows.astype('<f8').tobytes())
+                files.append([name, size, mtime, len(data)])
+                self.row_count += len(data)
+        # Replace the index after the data are written, so that an
+        # interrupted update is started again
+        temporary_file = self.index_path + ".new"
+        with open(temporary_file, 'w') as f:
+            json.dump({'version': CACHE_FORMAT_VERSION,
+                       'row_size': self.row_size, 'files': files}, f)
+        os.replace(temporary_file, self.index_path)
@@ -0,0 +1,90 @@
+"""Functions for reading the data files written by log_data_to_file.py.
+
+The files are text files with one line per set of data: the date and
+time in six columns (year month day hour minute second), followed by
+the data columns listed in LOG_COLUMNS. The particle data columns are
+present only if a particle sensor was used.
+
+This file does not use the sensor hardware, so it can be used on any
+computer.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import os
+from datetime import datetime
+
+# The names of the data columns which follow the date and time columns
+LOG_COLUMNS = ['T', 'P_Pa', 'H_pc', 'G_ohm',
+               'AQI', 'CO2e', 'bVOC', 'AQI_accuracy',
+               'illum_lux', 'white',
+               'SPL_dBA', 'SPL_band_1', 'SPL_band_2', 'SPL_band_3',
+               'SPL_band_4', 'SPL_band_5', 'SPL_band_6',
+               'peak_amp_mPa', 'stable',
+               'duty_cycle_pc', 'concentration', 'valid']
+
+# The file name format used by sensor_functions.startNewDataFile()
+LOG_FILE_NAME_FORMAT = 'data_%Y-%m-%d_%H-%M-%S.txt'
+
+
+def list_log_files(directory):
+    """Get a list of (start time, path) for each data file, oldest first.
+
+    The start time (seconds since the epoch) is obtained from the file name.
+    """
+    files = []
+    for name in os.listdir(directory):
+        try:
+            start = datetime.strptime(name, LOG_FILE_NAME_FORMAT)
+        except ValueError:
+            continue
+        files.append((start.timestamp(), os.path.join(directory, name)))
+    files.sort()
+    return files
+
+
+def read_log_file(path):
+    """Read a data file, line by line.
+
+    Yields (timestamp, values) for each line, where timestamp is in
+    seconds since the epoch and values is a list of floats in the order
+    of LOG_COLUMNS. Incomplete or invalid lines are skipped.
+    """
+    with open(path, 'r') as f:
+        for line in f:
+            columns = line.split()
+            if len(columns) < 7:
+                continue
+            try:
+                timestamp = datetime(
+                    *[int(c) for c in columns[0:6]]).timestamp()
+                values = [float(c) for c in columns[6:]]
+            except ValueError:
+                continue
+            yield (timestamp, values)
+
+
+def read_logs(directory, start=None, end=None):
+    """Read all data files in a directory, oldest first.
+
+    Yields (timestamp, values) as for read_log_file(), for data with
+    start <= timestamp <= end (if given). Files which cannot contain
+    data in this time range are not read.
+    """
+    files = list_log_files(directory)
+    for n, (file_start, path) in enumerate(files):
+        if (end is not None) and (file_start > end):
+            break
+        if ((start is not None) and ((n + 1) < len(files))
+                and (files[n + 1][0] < start)):
+            continue
+        for (timestamp, values) in read_log_file(path):
+            if (start is not None) and (timestamp < start):
+                continue
+            if (end is not None) and (timestamp > end):
+                break
+            yield (timestamp, values)
@@ -0,0 +1,207 @@
+"""Environment data and server statistics in the OpenMetrics text format.
+
+This file contains a class which stores the latest MS430 data, together
+with counters for I2C bus errors, data read time and cycle timing, and
+presents them in the OpenMetrics format, or the older Prometheus text
+format, which are read by Prometheus-compatible collectors.
+It is used by the web servers in servers.py to provide a /metrics page.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import threading
+from . import sensor_constants as const
+
+OPENMETRICS_CONTENT_TYPE = ("application/openmetrics-text; "
+                            "version=1.0.0; charset=utf-8")
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Each gauge is described by: (metric name, help text, data dictionary
+# name, key in the data dictionary)
+GAUGES = [
+    ('ms430_temperature_celsius', 'Temperature', 'air_data', 'T_C'),
+    ('ms430_pressure_pascals', 'Air pressure', 'air_data', 'P_Pa'),
+    ('ms430_humidity_percent', 'Relative humidity', 'air_data', 'H_pc'),
+    ('ms430_gas_resistance_ohms', 'Gas sensor resistance',
+     'air_data', 'G_ohm'),
+    ('ms430_air_quality_index', 'Air quality index',
+     'air_quality_data', 'AQI'),
+    ('ms430_estimated_co2_ppm', 'Estimated CO2 concentration',
+     'air_quality_data', 'CO2e'),
+    ('ms430_breath_voc_ppm', 'Equivalent breath VOC concentration',
+     'air_quality_data', 'bVOC'),
+    ('ms430_air_quality_accuracy', 'Air quality accuracy (0 to 3)',
+     'air_quality_data', 'AQI_accuracy'),
+    ('ms430_illuminance_lux', 'Illuminance', 'light_data', 'illum_lux'),
+    ('ms430_white_light_level', 'White light level', 'light_data', 'white'),
+    ('ms430_sound_level_dba', 'A-weighted sound pressure level',
+     'sound_data', 'SPL_dBA'),
+    ('ms430_peak_sound_amplitude_mpa', 'Peak sound amplitude',
+     'sound_data', 'peak_amp_mPa'),
+    ('ms430_sound_stable', 'Microphone initialized (1) or not (0)',
+     'sound_data', 'stable'),
+    ('ms430_particle_sensor_duty_cycle_percent',
+     'Particle sensor duty cycle', 'particle_data', 'duty_cycle_pc'),
+    ('ms430_particle_concentration', 'Particle concentration',
+     'particle_data', 'concentration'),
+    ('ms430_particle_data_valid', 'Particle data valid (1) or not (0)',
+     'particle_data', 'valid')]
+
+
+class SensorMetrics:
+    """Store the latest data and statistics, for presentation as text.
+
+    The text is created only when it is requested after the data have
+    changed, and is otherwise served from a cache, so frequent requests
+    from several collectors cost very little.
+    """
+
+    def __init__(self, board_name="MS430"):
+        """Start with no data.
+
+        board_name: a label added to every value, to identify the board
+        """
+        self.lock = threading.Lock()
+        self.board_name = board_name
+        # The expected time between data, used to calculate cycle jitter
+        self.cycle_period_seconds = None
+        self.data = {}
+        self.cycles = 0
+        self.last_cycle_time = None
+        self.cycle_interval = None
+        self.cycle_jitter = None
+        self.max_cycle_jitter = 0
+        self.bus_errors = 0
+        self.read_count = 0
+        self.read_duration_sum = 0
+        self.last_read_duration = None
+        self.texts = {}
+
+    def update(self, **data):
+        """Store new data dictionaries.
+
+        The names can be: air_data, air_quality_data, light_data,
+        sound_data, particle_data (as returned by the get_*_data functions
+        in sensor_functions.py).
+        """
+        with self.lock:
+            self.data.update(data)
+            self.texts = {}
+
+    def cycle_complete(self, timestamp):
+        """Record the completion of a set of data updates.
+
+        timestamp: the time of the data, in seconds since the epoch
+        """
+        with self.lock:
+            self.cycles += 1
+            if self.last_cycle_time is not None:
+                self.cycle_interval = timestamp - self.last_cycle_time
+                if self.cycle_period_seconds is not None:
+                    self.cycle_jitter = abs(self.cycle_interval
+                                            - self.cycle_period_seconds)
+                    self.max_cycle_jitter = max(self.max_cycle_jitter,
+                                                self.cycle_jitter)
+            self.last_cycle_time = timestamp
+            self.texts = {}
+
+    def record_read_duration(self, seconds):
+        """Record the time taken to read a set of data from the MS430."""
+        with self.lock:
+            self.read_count += 1
+            self.read_duration_sum += seconds
+            self.last_read_duration = seconds
+            self.texts = {}
+
+    def record_bus_error(self):
+        """Count a failed I2C bus transfer."""
+        with self.lock:
+            self.bus_errors += 1
+            self.texts = {}
+
+    def exposition(self, openmetrics=True):
+        """Get the text as bytes, in OpenMetrics or Prometheus format.
+
+        openmetrics: True for the OpenMetrics format, or False for the
+                     Prometheus text format (version 0.0.4)
+        """
+        with self.lock:
+            if openmetrics not in self.texts:
+                self.texts[openmetrics] = bytes(
+                    ''.join(self._lines(openmetrics)), "utf8")
+            return self.texts[openmetrics]
+
+    def _lines(self, openmetrics):
+        label = f'board="{self._escape(self.board_name)}"'
+        for (name, help_text, data_name, key) in GAUGES:
+            data = self.data.get(data_name)
+            if (data is not None) and (key in data):
+                yield from self._gauge(name, help_text, label,
+                                       float(data[key]))
+        sound_data = self.data.get('sound_data')
+        if sound_data is not None:
+            yield ("# TYPE ms430_sound_band_level_db gauge\n"
+                   "# HELP ms430_sound_band_level_db Sound pressure level "
+                   "in a frequency band\n")
+            for (f, value) in zip(const.sound_band_mids_Hz,
+                                  sound_data['SPL_bands_dB']):
+                yield (f'ms430_sound_band_level_db{{{label},'
+                       f'band_center_hz="{f}"}} {float(value)}\n')
+        if self.last_cycle_time is not None:
+            yield from self._gauge('ms430_last_cycle_timestamp_seconds',
+                                   'Time of the latest data', label,
+                                   self.last_cycle_time)
+        yield from self._counter('ms430_cycles', 'Sets of data received',
+                                 label, self.cycles, openmetrics)
+        yield from self._counter('ms430_i2c_errors',
+                                 'Failed I2C bus transfers', label,
+                                 self.bus_errors, openmetrics)
+        yield ("# TYPE ms430_read_duration_seconds summary\n"
+               "# HELP ms430_read_duration_seconds Time taken to read "
+               "a set of data\n"
+               f"ms430_read_duration_seconds_count{{{label}}} "
+               f"{self.read_count}\n"
+               f"ms430_read_duration_seconds_sum{{{label}}} "
+               f"{float(self.read_duration_sum)}\n")
+        if self.last_read_duration is not None:
+            yield from self._gauge('ms430_last_read_duration_seconds',
+                                   'Time taken to read the latest data',
+                                   label, self.last_read_duration)
+        if self.cycle_interval is not None:
+            yield from self._gauge('ms430_cycle_interval_seconds',
+                                   'Time between the two latest sets of '
+                                   'data', label, self.cycle_interval)
+        if self.cycle_jitter is not None:
+            yield from self._gauge('ms430_cycle_jitter_seconds',
+                                   'Difference between the latest cycle '
+                                   'interval and the cycle period',
+                                   label, self.cycle_jitter)
+            yield from self._gauge('ms430_cycle_jitter_max_seconds',
+                                   'Largest cycle jitter', label,
+                                   self.max_cycle_jitter)
+        if openmetrics:
+            yield "# EOF\n"
+
+    @staticmethod
+    def _gauge(name, help_text, label, value):
+        yield (f"# TYPE {name} gauge\n# HELP {name} {help_text}\n"
+               f"{name}{{{label}}} {float(value)}\n")
+
+    @staticmethod
+    def _counter(name, help_text, label, value, openmetrics):
+        # The value is named with "_total". The Prometheus format also
+        # uses this name to describe the counter, but OpenMetrics does not.
+        value_name = name + '_total'
+        if not openmetrics:
+            name = value_name
+        yield (f"# TYPE {name} counter\n# HELP {name} {help_text}\n"
+               f"{value_name}{{{label}}} {value}\n")
+
+    @staticmethod
+    def _escape(text):
+        return (text.replace('\\', '\\\\').replace('"', '\\"')
+                .replace('\n', '\\n'))
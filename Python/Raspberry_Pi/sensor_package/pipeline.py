@@ -0,0 +1,224 @@
+"""Read the MS430 data once and deliver them to several outputs.
+
+This file contains a class which reads all data from the MS430 after each
+new data release, and passes each set of data (a "snapshot") to any
+number of "sinks": functions which log, display, serve or send the data.
+
+Each sink runs in its own thread, with its own queue of snapshots which
+are waiting to be handled. A slow or failed sink therefore never delays
+the reading of the sensor or the other sinks. If a sink cannot keep up,
+its queue fills and snapshots are dropped, and this is recorded in the
+sink statistics. A sink which must not lose data (e.g. a log file) can
+be given a long queue.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import time
+import queue
+import threading
+from . import sensor_functions as sensor
+from . import sensor_constants as const
+
+# What to do with a new snapshot when a sink queue is full:
+DROP_OLDEST = "drop_oldest"  # remove the oldest waiting snapshot
+DROP_NEWEST = "drop_newest"  # do not add the new snapshot
+
+
+def read_snapshot(I2C_bus):
+    """Read all data from the MS430 and return them as a dictionary.
+
+    The dictionary contains the data dictionaries (air_data, etc., with
+    particle_data set to None if there is no particle sensor), plus
+    "time": the read time in seconds since the epoch, and "acquired": the
+    time.monotonic() value at the read time.
+    """
+    snapshot = {'time': time.time(), 'acquired': time.monotonic()}
+    snapshot['air_data'] = sensor.get_air_data(I2C_bus)
+    snapshot['air_quality_data'] = sensor.get_air_quality_data(I2C_bus)
+    snapshot['light_data'] = sensor.get_light_data(I2C_bus)
+    snapshot['sound_data'] = sensor.get_sound_data(I2C_bus)
+    if sensor.PARTICLE_SENSOR != const.PARTICLE_SENSOR_OFF:
+        snapshot['particle_data'] = sensor.get_particle_data(
+            I2C_bus, sensor.PARTICLE_SENSOR)
+    else:
+        snapshot['particle_data'] = None
+    return snapshot
+
+
+class SinkWorker:
+    """Pass snapshots to a sink function, in a background thread.
+
+    The function is called as function(snapshot) for each snapshot, in
+    order. Exceptions raised by it are counted and the last one is kept,
+    and the worker continues with the next snapshot.
+    """
+
+    def __init__(self, name, function, queue_size=10, policy=DROP_OLDEST):
+        """Start the worker thread.
+
+        queue_size: the maximum number of snapshots waiting to be handled
+        policy: DROP_OLDEST or DROP_NEWEST (see the top of this file)
+        """
+        self.name = name
+        self.function = function
+        self.policy = policy
+        self.queue = queue.Queue(queue_size)
+        self.lock = threading.Lock()
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_error = None
+        # Times in seconds, from acquisition to completion (latency) and
+        # within the sink function (duration)
+        self.latency_total = 0
+        self.latency_max = 0
+        self.latency_last = None
+        self.duration_max = 0
+        self.thread = threading.Thread(target=self._run, daemon=True,
+                                       name="sink-" + name)
+        self.thread.start()
+
+    def put(self, snapshot):
+        """Add a snapshot to the queue, following the full-queue policy.
+
+        This never waits, so it does not delay the acquisition.
+        """
+        try:
+            self.queue.put_nowait(snapshot)
+            return
+        except queue.Full:
+            if self.policy != DROP_OLDEST:
+                self._count_drop()
+                return
+        try:
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self._count_drop()
+        except queue.Empty:
+            pass
+        try:
+            self.queue.put_nowait(snapshot)
+        except queue.Full:
+            self._count_drop()
+
+    def stop(self, timeout=None):
+        """Stop the worker after it has handled the waiting snapshots."""
+        try:
+            self.queue.put(None, True, timeout)
+        except queue.Full:
+            pass
+        self.thread.join(timeout)
+
+    def statistics(self):
+        """Get a dictionary of the delivery counts and times (in ms)."""
+        with self.lock:
+            return {
+                'delivered': self.delivered, 'dropped': self.dropped,
+                'errors': self.errors, 'waiting': self.queue.qsize(),
+                'latency_ms': {
+                    'mean': (round(1000 * self.latency_total
+                                   / self.delivered, 3)
+                             if self.delivered else None),
+                    'max': round(1000 * self.latency_max, 3),
+                    'last': (None if self.latency_last is None
+                             else round(1000 * self.latency_last, 3))},
+                'max_duration_ms': round(1000 * self.duration_max, 3),
+                'last_error': (None if self.last_error is None
+                               else repr(self.last_error))}
+
+    def _count_drop(self):
+        with self.lock:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            snapshot = self.queue.get()
+            if snapshot is None:
+                return
+            start = time.monotonic()
+            try:
+                self.function(snapshot)
+                error = None
+            except Exception as e:
+                error = e
+            end = time.monotonic()
+            with self.lock:
+                if error is None:
+                    self.delivered += 1
+                    latency = end - snapshot['acquired']
+                    self.latency_total += latency
+                    self.latency_max = max(self.latency_max, latency)
+                    self.latency_last = latency
+                else:
+                    self.errors += 1
+                    self.last_error = error
+                self.duration_max = max(self.duration_max, end - start)
+            self.queue.task_done()
+
+
+class Pipeline:
+    """Read the MS430 after each data release and pass the data to sinks.
+
+    Sinks are added with add_sink(), then run() reads the data until
+    stop() is called. The MS430 must already be in cycle mode.
+    """
+
+    def __init__(self):
+        self.sinks = {}
+        self.stopping = threading.Event()
+        self.cycles = 0
+        self.bus_errors = 0
+        self.read_duration_max = 0
+
+    def add_sink(self, name, function, queue_size=10, policy=DROP_OLDEST):
+        """Add a sink function which is called with each snapshot.
+
+        See SinkWorker for the meaning of the arguments.
+        """
+        self.sinks[name] = SinkWorker(name, function, queue_size, policy)
+
+    def emit(self, snapshot):
+        """Pass a snapshot to all of the sinks."""
+        for sink in self.sinks.values():
+            sink.put(snapshot)
+
+    def run(self, GPIO, I2C_bus):
+        """Read and emit the data after each data release, until stopped.
+
+        I2C bus errors are counted, and that cycle is skipped.
+        """
+        while not self.stopping.is_set():
+            # Wait for the next new data release, indicated by a falling
+            # edge on READY
+            while not GPIO.event_detected(sensor.READY_pin):
+                if self.stopping.wait(0.05):
+                    return
+            try:
+                snapshot = read_snapshot(I2C_bus)
+            except OSError:
+                self.bus_errors += 1
+                continue
+            self.read_duration_max = max(
+                self.read_duration_max,
+                time.monotonic() - snapshot['acquired'])
+            self.cycles += 1
+            self.emit(snapshot)
+
+    def stop(self, timeout=None):
+        """Stop reading, then stop each sink after its waiting snapshots."""
+        self.stopping.set()
+        for sink in self.sinks.values():
+            sink.stop(timeout)
+
+    def statistics(self):
+        """Get a dictionary of the acquisition and sink statistics."""
+        return {'cycles': self.cycles, 'bus_errors': self.bus_errors,
+                'max_read_duration_ms': round(
+                    1000 * self.read_duration_max, 3),
+                'sinks': {name: sink.statistics()
+                          for (name, sink) in self.sinks.items()}}
@@ -0,0 +1,108 @@
+"""Reduce the amount of data sent, by only sending values which change.
+
+This file contains a class which decides, for each variable in each set
+of data, whether it needs to be sent. A value is sent when it differs
+from the last sent value by at least a "deadband" amount, or when the
+variable has not been sent for a maximum time (a "heartbeat", so that the
+receiver knows that the sensor is still working). Values are not sent
+more often than a minimum interval.
+
+Environment data change slowly indoors, so this greatly reduces the
+number of messages sent to a cloud service or home automation server.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import time
+
+
+class ReportFilter:
+    """Choose which data values need to be sent.
+
+    The variables are described by a dictionary, by name, of settings
+    dictionaries with keys:
+      decimals: the number of decimal places with which the value is sent
+      absolute: (optional) the deadband as an absolute change
+      relative: (optional) the deadband as a fraction of the last sent
+                value, e.g. 0.05 for 5%
+    The default deadband is one step of the last decimal place, so a value
+    is sent whenever its text form would change. Values which are not
+    numbers (e.g. the air quality assessment) are sent when they change.
+    """
+
+    def __init__(self, fields, max_silence_seconds=3600,
+                 min_interval_seconds=0):
+        """Set up the filter; the first data are always sent.
+
+        max_silence_seconds: the longest time for which a variable is not
+                             sent, even if it does not change
+        min_interval_seconds: the shortest time between sending each
+                              variable, even if it changes
+        """
+        self.max_silence_seconds = max_silence_seconds
+        self.min_interval_seconds = min_interval_seconds
+        self.fields = {}
+        for (name, settings) in fields.items():
+            step = 10.0 ** -settings['decimals']
+            self.fields[name] = (settings['decimals'], step,
+                                 settings.get('absolute', step),
+                                 settings.get('relative'))
+        # The last sent value and time of each variable, by name
+        self.sent = {}
+        self.value_count = 0
+        self.sent_count = 0
+
+    def filter(self, values, timestamp=None):
+        """Get the values which need to be sent, from a set of data.
+
+        values: a dictionary of the data values, by variable name.
+                Variables which are not described in the fields are
+                sent when they change.
+        timestamp: the time of the data in seconds (time.monotonic() is
+                   used if not given)
+        Returns a dictionary of the values to send (empty if none).
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        to_send = {}
+        for (name, value) in values.items():
+            if self._needs_sending(name, value, timestamp):
+                to_send[name] = value
+                self.sent[name] = (value, timestamp)
+        self.value_count += len(values)
+        self.sent_count += len(to_send)
+        return to_send
+
+    def forget(self, names):
+        """Mark variables as not sent, e.g. because sending them failed.
+
+        They are then sent with the next data.
+        """
+        for name in names:
+            self.sent.pop(name, None)
+
+    def _needs_sending(self, name, value, timestamp):
+        if name not in self.sent:
+            return True
+        (last_value, last_time) = self.sent[name]
+        elapsed = timestamp - last_time
+        if elapsed >= self.max_silence_seconds:
+            return True
+        if elapsed < self.min_interval_seconds:
+            return False
+        if name not in self.fields:
+            return value != last_value
+        (decimals, step, absolute, relative) = self.fields[name]
+        try:
+            change = abs(round(value, decimals) - round(last_value, decimals))
+        except TypeError:
+            return value != last_value
+        deadband = absolute
+        if relative is not None:
+            deadband = max(relative * abs(last_value), step)
+        # Allow for rounding errors of up to half a step
+        return change >= (deadband - (step / 2))
@@ -13,10 +13,9 @@ Fahrenheit) in this file, and select the optional particle sensor.
 import sys
 from time import sleep
 from datetime import datetime
-import RPi.GPIO as GPIO
-import smbus
 import os
 from . import sensor_constants as const
+from .log_files import LOG_FILE_NAME_FORMAT
 
 #############################################################################
 
@@ -64,6 +63,10 @@ i2c_7bit_address = const.I2C_ADDR_7BIT_SB_OPEN
 
 def SensorHardwareSetup():
     """Set up the Raspberry Pi GPIO."""
+    # The hardware modules are imported here, so that the other functions
+    # in this file can be used without them (e.g. with simulator.py)
+    import RPi.GPIO as GPIO
+    import smbus
     GPIO.setwarnings(False)
     GPIO.setmode(GPIO.BOARD)
     GPIO.setup(READY_pin, GPIO.IN)
@@ -395,7 +398,7 @@ def startNewDataFile(dataFileDirectory):
     """
     filename = os.path.join(
         dataFileDirectory,
-        datetime.now().strftime('data_%Y-%m-%d_%H-%M-%S.txt'))
+        datetime.now().strftime(LOG_FILE_NAME_FORMAT))
     print("Logging data to file " + filename)
     return open(filename, 'a')
 
@@ -13,16 +13,298 @@ They also use files text_web_page.html and graph_web_page.html
 
 from http.server import BaseHTTPRequestHandler
 from collections import deque
+from urllib.parse import parse_qs
 import struct
+import threading
+import gzip
+import time
+import json
+import math
+from datetime import datetime
 import pkgutil
 import jinja2
 from pathlib import Path
 from subprocess import check_output
 from . import sensor_functions as sensor
 from . import sensor_constants as const
+from .data_buffer import DataBuffer
+from .metrics import (SensorMetrics, OPENMETRICS_CONTENT_TYPE,
+                      PROMETHEUS_CONTENT_TYPE)
+from . import log_files
 
 
-class SimpleWebpageHandler(BaseHTTPRequestHandler):
+class ResponseCache:
+    """Store an encoded response body until the data it shows change.
+
+    The body is created on the first request after each call of
+    invalidate(), by calling the supplied render function, and is then
+    stored together with a gzip-compressed copy and an ETag. This means
+    that the page is rendered and compressed at most once per data
+    update, regardless of the number of clients.
+    """
+
+    def __init__(self):
+        """Start with an empty cache."""
+        self.lock = threading.Lock()
+        self.version = 0
+        self.cached_version = None
+        # The ETag prefix changes each time the program starts, so that
+        # clients do not reuse pages cached from a previous run.
+        self.etag_prefix = format(time.time_ns(), 'x')
+        self.etag = None
+        self.body = None
+        self.gzip_body = None
+
+    def invalidate(self):
+        """Indicate that the data have changed."""
+        with self.lock:
+            self.version += 1
+
+    def get(self, render):
+        """Return (etag, body, gzip_body), rendering again if necessary."""
+        with self.lock:
+            if self.cached_version != self.version:
+                self.body = render()
+                self.gzip_body = gzip.compress(self.body, 6, mtime=0)
+                self.etag = f'"{self.etag_prefix}-{self.version}"'
+                self.cached_version = self.version
+            return (self.etag, self.body, self.gzip_body)
+
+
+class EventStream:
+    """Share server-sent events between any number of client connections.
+
+    Each event is serialized once, when it is published, and the same
+    bytes are then written to every connected client. The most recent
+    events are retained so that a client which falls behind, or which
+    reconnects, can catch up. A client which falls further behind than
+    this is told to reload all of the data instead.
+    """
+
+    def __init__(self, backlog_length=20):
+        """Start a stream with no events."""
+        self.condition = threading.Condition()
+        self.events = deque(maxlen=backlog_length)
+        self.last_id = 0
+        # Event IDs include a token which changes each time the program
+        # starts, so that IDs from a previous run are not mistaken as
+        # belonging to this one.
+        self.run_token = format(time.time_ns(), 'x')
+
+    def publish(self, data):
+        """Serialize a new event and wake all waiting clients."""
+        with self.condition:
+            self.last_id += 1
+            self.events.append((self.last_id, bytes(
+                f"id: {self.run_token}-{self.last_id}\n"
+                f"data: {data}\n\n", "utf8")))
+            self.condition.notify_all()
+
+    def start_id(self, last_event_id=None):
+        """Get the ID from which a new client connection should start.
+
+        last_event_id is the value of the client's Last-Event-ID header,
+        if any. Returns None if the client cannot be brought up to date.
+        """
+        with self.condition:
+            if last_event_id is None:
+                return self.last_id
+            (token, _, event_id) = last_event_id.partition('-')
+            if (token != self.run_token) or (not event_id.isdigit()):
+                return None
+            return int(event_id)
+
+    def events_after(self, event_id, timeout):
+        """Wait for events newer than event_id.
+
+        Returns a list of (id, serialized event) tuples, which is empty if
+        the timeout expires first, or None if some of the events needed by
+        the client have already been discarded.
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.last_id != event_id, timeout)
+            if self.last_id == event_id:
+                return []
+            if ((event_id > self.last_id)
+                    or (event_id < (self.events[0][0] - 1))):
+                return None
+            return [e for e in self.events if e[0] > event_id]
+
+
+class PersistentConnectionHandler(BaseHTTPRequestHandler):
+    """Base class for handlers which support HTTP/1.1 keep-alive.
+
+    Every response is framed with a Content-Length header so that a
+    browser can reuse the TCP connection for its next request, instead
+    of opening a new connection each time the page polls for data.
+    A connection is closed after it has been idle for "timeout" seconds,
+    or after it has served "max_requests_per_connection" requests.
+
+    The server must be able to handle each connection in a separate
+    thread (e.g. socketserver.ThreadingTCPServer), otherwise one idle
+    connection would block all other clients.
+    """
+
+    protocol_version = "HTTP/1.1"
+    timeout = 10
+    max_requests_per_connection = 100
+    chunk_size = 16384
+    disable_nagle_algorithm = True
+    # A SensorMetrics object for the /metrics page, set by subclasses
+    metrics = None
+
+    def setup(self):
+        """Prepare a new connection."""
+        super().setup()
+        self.requests_served = 0
+
+    def send_content(self, content_type, body, headers=None):
+        """Send a complete 200 response: the body is omitted for HEAD.
+
+        The body can be given as bytes, or as a list of bytes-like parts.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        if isinstance(body, list):
+            self.send_header("Content-Length", str(sum(map(len, body))))
+        else:
+            self.send_header("Content-Length", str(len(body)))
+        if headers is not None:
+            for name, value in headers.items():
+                self.send_header(name, value)
+        self._end_response_headers()
+        if self.command != 'HEAD':
+            if isinstance(body, list):
+                self.wfile.writelines(body)
+            else:
+                self.wfile.write(body)
+
+    def send_cached_content(self, cache, render, content_type, headers=None):
+        """Send a response from a ResponseCache.
+
+        A "304 Not Modified" response is sent if the client already has
+        the current version, and the compressed body is sent to clients
+        which accept gzip encoding.
+        """
+        (etag, body, gzip_body) = cache.get(render)
+        all_headers = {"ETag": etag, "Cache-Control": "no-cache",
+                       "Vary": "Accept-Encoding"}
+        if headers is not None:
+            all_headers.update(headers)
+        if self._client_has_etag(etag):
+            self.send_response(304)
+            for name, value in all_headers.items():
+                self.send_header(name, value)
+            self._end_response_headers()
+        elif self._client_accepts_gzip():
+            all_headers["Content-Encoding"] = "gzip"
+            self.send_content(content_type, gzip_body, all_headers)
+        else:
+            self.send_content(content_type, body, all_headers)
+
+    def send_chunked_content(self, content_type, lines, headers=None):
+        """Send a 200 response with a body of unknown length.
+
+        The body is given by an iterable of strings, which are sent in
+        chunks (using chunked transfer encoding) as they are produced,
+        so that the whole body is never held in memory.
+        """
+        chunked = (self.request_version != 'HTTP/1.0')
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        if headers is not None:
+            for name, value in headers.items():
+                self.send_header(name, value)
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        else:
+            # The end of the body is shown by closing the connection
+            self.send_header("Connection", "close")
+        self._end_response_headers()
+        if self.command == 'HEAD':
+            return
+        try:
+            parts = []
+            size = 0
+            for line in lines:
+                parts.append(line)
+                size += len(line)
+                if size >= self.chunk_size:
+                    self._write_chunk(''.join(parts), chunked)
+                    parts = []
+                    size = 0
+            if parts:
+                self._write_chunk(''.join(parts), chunked)
+            if chunked:
+                self.wfile.write(b"0\r\n\r\n")
+        except OSError:
+            # The client has disconnected, or a data file could not be
+            # read: the response cannot be completed.
+            self.close_connection = True
+
+    def send_metrics(self):
+        """Send the latest data and statistics for metrics collectors.
+
+        The OpenMetrics format is sent to clients which ask for it, and
+        others get the Prometheus text format.
+        """
+        openmetrics = ('application/openmetrics-text'
+                       in self.headers.get('Accept', ''))
+        content_type = (OPENMETRICS_CONTENT_TYPE if openmetrics
+                        else PROMETHEUS_CONTENT_TYPE)
+        self.send_content(content_type, self.metrics.exposition(openmetrics),
+                          {"Cache-Control": "no-cache"})
+
+    def _write_chunk(self, text, chunked):
+        data = bytes(text, "utf8")
+        if chunked:
+            self.wfile.write(b"%X\r\n%b\r\n" % (len(data), data))
+        else:
+            self.wfile.write(data)
+
+    def _end_response_headers(self):
+        self.requests_served += 1
+        if self.requests_served >= self.max_requests_per_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+
+    def _client_has_etag(self, etag):
+        tags = self.headers.get('If-None-Match')
+        if tags is None:
+            return False
+        tags = [t.strip().removeprefix('W/') for t in tags.split(',')]
+        return (etag in tags) or ('*' in tags)
+
+    def _client_accepts_gzip(self):
+        for coding in self.headers.get('Accept-Encoding', '').split(','):
+            (name, _, params) = coding.partition(';')
+            if name.strip().lower() in ('gzip', '*'):
+                (_, _, q) = params.partition('q=')
+                try:
+                    return (float(q) > 0) if q.strip() else True
+                except ValueError:
+                    return False
+        return False
+
+    def do_HEAD(self):
+        """Implement the HTTP HEAD method."""
+        self.do_GET()
+
+    def log_request(self, code='-', size='-'):
+        """Do not print successful requests; errors are still printed."""
+        pass
+
+    def log_error(self, format, *args):
+        """Print errors, except the timeout of an idle connection."""
+        # BaseHTTPRequestHandler reports the end of an idle keep-alive
+        # connection (after "timeout" seconds) as an error
+        if format.startswith("Request timed out"):
+            return
+        super().log_error(format, *args)
+
+
+class SimpleWebpageHandler(PersistentConnectionHandler):
     """Make a simple text webpage to display environment data.
 
     The webpage is HTML and CSS only and does not use javascript.
@@ -38,39 +320,52 @@ class SimpleWebpageHandler(BaseHTTPRequestHandler):
     interpreted_AQI_accuracy = None
     interpreted_AQI_value = None
     refresh_period_seconds = 3
+    readout_time_and_date = None
     template = jinja2.Environment(
             loader=jinja2.FileSystemLoader(Path(__file__).parent),
             autoescape=True).get_template("text_web_page.html")
-
-    @classmethod
-    def _get_http_headers(cls):
-        """Make headers for HTTP response with variable refresh time."""
-        return ("HTTP/1.1 200 OK\r\n"
-                "Content-type: text/html\r\n"
-                "Connection: close\r\n"
-                f"Refresh: {cls.refresh_period_seconds}\r\n\r\n")
+    page_cache = ResponseCache()
+    metrics = SensorMetrics()
 
     def do_GET(self):
         """Implement the HTTP GET method."""
-        self.wfile.write(
-            bytes(self._get_http_headers() + self.the_web_page, "utf8"))
-
-    def do_HEAD(self):
-        """Implement the HTTP HEAD method."""
-        self.wfile.write(bytes(self._get_http_headers(), "utf8"))
+        if self.path.partition('?')[0] == '/metrics':
+            self.send_metrics()
+        else:
+            self.send_cached_content(
+                self.page_cache, self._render_web_page,
+                "text/html; charset=utf-8",
+                {"Refresh": str(self.refresh_period_seconds)})
 
     @classmethod
     def assemble_web_page(cls, readout_time_and_date=None):
-        """Create the updated webpage, for serving to all clients."""
-        cls._interpret_data()
-        cls.the_web_page = cls.template.render(
+        """Update the webpage after new data have been stored.
+
+        The page is not rendered here: it is rendered on the next client
+        request, then served from the cache until the data change again.
+        """
+        cls.readout_time_and_date = readout_time_and_date
+        cls.page_cache.invalidate()
+        cls.metrics.update(
             air_data=cls.air_data, air_quality_data=cls.air_quality_data,
-            sound_data=cls.sound_data, light_data=cls.light_data,
-            particle_data=cls.particle_data,
-            interpreted_AQI_accuracy=cls.interpreted_AQI_accuracy,
-            interpreted_AQI_value=cls.interpreted_AQI_value,
-            sound_band_mids_Hz=const.sound_band_mids_Hz,
-            readout_time_and_date=readout_time_and_date)
+            light_data=cls.light_data, sound_data=cls.sound_data)
+        if cls.particle_data is not None:
+            cls.metrics.update(particle_data=cls.particle_data)
+        cls.metrics.cycle_complete(time.time())
+
+    @classmethod
+    def _render_web_page(cls):
+        if cls.page_cache.version > 0:
+            cls._interpret_data()
+            cls.the_web_page = cls.template.render(
+                air_data=cls.air_data, air_quality_data=cls.air_quality_data,
+                sound_data=cls.sound_data, light_data=cls.light_data,
+                particle_data=cls.particle_data,
+                interpreted_AQI_accuracy=cls.interpreted_AQI_accuracy,
+                interpreted_AQI_value=cls.interpreted_AQI_value,
+                sound_band_mids_Hz=const.sound_band_mids_Hz,
+                readout_time_and_date=cls.readout_time_and_date)
+        return bytes(cls.the_web_page, "utf8")
 
     @classmethod
     def _interpret_data(cls):
@@ -81,108 +376,422 @@ class SimpleWebpageHandler(BaseHTTPRequestHandler):
                 cls.air_quality_data['AQI'])
 
 
-class GraphWebpageHandler(BaseHTTPRequestHandler):
+class GraphWebpageHandler(PersistentConnectionHandler):
     """Make a web page with graphs to display environment data."""
 
     the_web_page = pkgutil.get_data(__name__, 'graph_web_page.html')
+    page_cache = ResponseCache()
     data_period_seconds = 3
-    error_response_HTTP = "HTTP/1.1 400 Bad Request\r\n\r\n"
-    data_header = ("HTTP/1.1 200 OK\r\n"
-                   "Content-type: application/octet-stream\r\n"
-                   "Connection: close\r\n\r\n")
-    page_header = ("HTTP/1.1 200 OK\r\n"
-                   "Content-type: text/html\r\n"
-                   "Connection: close\r\n\r\n")
+    # The data buffers are written by the main program while server
+    # threads read them, so all buffer access is done with this lock.
+    data_lock = threading.Lock()
+    # New data are pushed to clients which open an event stream.
+    # A comment line is sent on an otherwise idle stream, so that
+    # closed connections are detected.
+    event_stream = EventStream()
+    event_keepalive_seconds = 15
+    metrics = SensorMetrics()
+    # The buffered variables, in the order in which they are sent. Each
+    # set of data gets a sequence number, so that clients can request
+    # only the data which they do not already have.
+    variable_names = ('AQI', 'temperature', 'pressure', 'humidity', 'SPL',
+                      'illuminance', 'bVOC', 'particle')
+    new_data = {}
+    # The largest buffer length, which is limited by the 16-bit value
+    # count of the /1 response
+    max_buffer_length = 65535
+    data_protocol_version = 4
+    data_header_format = '<BBHBBIIBHdI'
+    # Clients can ask for long histories to be reduced to about the
+    # number of points which they can display (see send_data_since)
+    minimum_points = 16
+    # Data can also be exported from the files written by the
+    # log_data_to_file.py example, if their directory is given here.
+    log_file_directory = None
+    # Details of each variable for data export: the name of the log file
+    # column, the name and unit, and the number of decimal places.
+    export_details = {
+        'AQI': ('AQI', 'Air Quality Index', '', 1),
+        'temperature': ('T', 'Temperature', const.CELSIUS_SYMBOL, 1),
+        'pressure': ('P_Pa', 'Pressure', 'Pa', 0),
+        'humidity': ('H_pc', 'Humidity', '%', 1),
+        'SPL': ('SPL_dBA', 'Sound Level', 'dBA', 1),
+        'illuminance': ('illum_lux', 'Illuminance', 'lux', 2),
+        'bVOC': ('bVOC', 'Breath VOC', 'ppm', 2),
+        'particle': ('concentration', 'Particulates',
+                     const.SDS011_CONC_SYMBOL, 2)}
+    # The number of sets of data read from the buffer at a time during
+    # data export
+    export_rows_per_read = 200
 
     def do_GET(self):
         """Implement the HTTP GET method."""
-        if self.path == '/':
-            # The web page is requested
-            self.wfile.write(bytes(self.page_header, "utf8"))
-            self.wfile.write(self.the_web_page)
-        elif self.path == '/1':
+        (path, _, query) = self.path.partition('?')
+        if path == '/':
+            # The web page is requested: it never changes, so it is
+            # compressed only once and then served from the cache.
+            self.send_cached_content(
+                self.page_cache, lambda: self.the_web_page,
+                "text/html; charset=utf-8")
+        elif path == '/1':
             # A URI path of '1' indicates a request of all buffered data
             self.send_all_data()
-        elif self.path == '/2':
+        elif path == '/2':
             # A URI path of '2' indicates a request of the latest data only
             self.send_latest_data()
+        elif path == '/3':
+            # A URI path of '3' opens a stream of server-sent events,
+            # which delivers each new set of data as soon as it is read
+            self.send_event_stream()
+        elif path == '/4':
+            # A URI path of '4' requests the data which are newer than
+            # the sequence number given by the "since" query parameter,
+            # with an optional maximum number of points to send
+            query = parse_qs(query)
+            since = query.get('since', [''])[0]
+            points = query.get('points', [''])[0]
+            self.send_data_since(int(since) if since.isdigit() else None,
+                                 int(points) if points.isdigit() else None)
+        elif path == '/export':
+            # Download data as a file, with options given by the query
+            self.send_export(parse_qs(query))
+        elif path == '/metrics':
+            # Data and statistics for metrics collectors such as Prometheus
+            self.send_metrics()
         else:
             # Path not recognized: send a standard error response
-            self.wfile.write(bytes(self.error_response_HTTP, "utf8"))
-
-    def do_HEAD(self):
-        """Implement the HTTP HEAD method."""
-        if self.path == '/':
-            self.wfile.write(bytes(self.page_header, "utf8"))
-        elif self.path == '/1' or self.path == '/2':
-            self.wfile.write(bytes(self.data_header, "utf8"))
-        else:
-            self.wfile.write(bytes(self.error_response_HTTP, "utf8"))
+            self.send_error(400)
 
     def send_all_data(self):
         """Respond to client request by sending all buffered data."""
-        self.wfile.write(bytes(self.data_header, "utf8"))
-        # First send the time period, so the web page knows
-        # when to do the next request
-        self.wfile.write(struct.pack('H', self.data_period_seconds))
-        # Send particle sensor type
-        self.wfile.write(struct.pack('B', sensor.PARTICLE_SENSOR))
-        # Send choice of temperature unit
-        self.wfile.write(struct.pack('B', int(sensor.USE_FAHRENHEIT)))
-        # Send the length of the data buffers (the number of values
-        # of each variable)
-        self.wfile.write(struct.pack('H', len(self.temperature)))
-        # Send the data in the specific order:
-        for p in [self.AQI, self.temperature, self.pressure, self.humidity,
-                  self.SPL, self.illuminance, self.bVOC, self.particle]:
-            self.wfile.write(struct.pack(str(len(p)) + 'f', *p))
+        self.send_content("application/octet-stream",
+                          self._data_response())
 
     def send_latest_data(self):
         """Respond to client request by sending only the most recent data."""
-        self.wfile.write(bytes(self.data_header, "utf8"))
-        # Send the most recent values, if buffers are not empty
-        if self.temperature:
-            data = [self.AQI[-1], self.temperature[-1], self.pressure[-1],
-                    self.humidity[-1], self.SPL[-1], self.illuminance[-1],
-                    self.bVOC[-1]]
-            if self.particle:
-                data.append(self.particle[-1])
-            self.wfile.write(struct.pack(str(len(data)) + 'f', *data))
+        with self.data_lock:
+            data = self.data.latest()[0:self._served_variable_count()]
+        self.send_content("application/octet-stream",
+                          struct.pack(str(len(data)) + 'f', *data))
+
+    def send_data_since(self, since, points=None):
+        """Respond to client request by sending data newer than "since".
+
+        The server sends all data if "since" is None, or if it no longer
+        has all of the newer data (e.g. after a restart). If all data are
+        sent and "points" is given, data which would have more than this
+        number of points are downsampled: each bucket of consecutive data
+        is replaced by the minimum and maximum of each variable (see
+        data_buffer.BucketSummary). The bucket size is a power of two, so
+        that few different summaries are kept up to date. The response
+        starts with a header (format "data_header_format", all values
+        little-endian) containing:
+            protocol version (data_protocol_version) and header length
+            time period between data, in seconds
+            particle sensor type and choice of temperature unit
+            number of values of each variable ("count")
+            sequence number of the last data
+            flag which is 1 if the response contains all buffered data
+            time unit in milliseconds and time base (seconds since the
+            epoch, as a double)
+            bucket size: the number of sets of data reduced to each pair
+            of points, or 1 if the data were not downsampled
+        This is followed by "count" timestamps, each a uint32 number of
+        time units since the time base, then "count" float32 values of
+        each variable in the order given by variable_names.
+        """
+        with self.data_lock:
+            (source, count, complete) = (self.data, self.data.count, 1)
+            if ((since is not None)
+                    and (since >= (self.data.first_sequence() - 1))
+                    and (since <= self.data.last_sequence)):
+                (count, complete) = (self.data.last_sequence - since, 0)
+            bucket_size = 1
+            if complete and (points is not None):
+                points = max(points, self.minimum_points)
+                while (bucket_size * points) < (2 * count):
+                    bucket_size *= 2
+                if bucket_size > 1:
+                    source = self.data.summary(bucket_size)
+                    count = source.count()
+            header = struct.pack(
+                self.data_header_format, self.data_protocol_version,
+                struct.calcsize(self.data_header_format),
+                self.data_period_seconds, sensor.PARTICLE_SENSOR,
+                int(sensor.USE_FAHRENHEIT), count, self.data.last_sequence,
+                complete, self.data.time_resolution_ms,
+                self.data.time_base or 0, bucket_size)
+            body = b''.join([header] + source.time_slices(count)
+                            + self._value_slices(count, source))
+        self.send_content("application/octet-stream", body)
+
+    def _data_response(self):
+        # Make the response body for send_all_data()
+        with self.data_lock:
+            # First send the time period, so the web page knows
+            # when to do the next request, then the particle sensor
+            # type, the choice of temperature unit and the number of
+            # values of each variable
+            header = struct.pack('<HBBH', self.data_period_seconds,
+                                 sensor.PARTICLE_SENSOR,
+                                 int(sensor.USE_FAHRENHEIT), self.data.count)
+            return b''.join([header] + self._value_slices(self.data.count,
+                                                          self.data))
+
+    def _value_slices(self, count, source):
+        # Get the newest "count" values of each variable, in the order
+        # given by variable_names, as slices of the data buffer or
+        # summary. These are not copied, so they must be copied (joined)
+        # before data_lock is released: otherwise new data could replace
+        # the oldest values while a slow client receives them.
+        body = []
+        for i in range(self._served_variable_count()):
+            body.extend(source.slices(i, count))
+        return body
+
+    def send_export(self, query):
+        """Respond with data as a CSV (comma separated values) or NDJSON file.
+
+        The options are given as query parameters, which are all optional:
+            format: "csv" (the default) or "ndjson" (one JSON object per line)
+            source: "buffer" (the default) for the data in the buffer,
+                    or "logs" for the data files in log_file_directory
+            fields: comma-separated variable names from variable_names
+                    (the default is all variables)
+            start, end: the time range, each as seconds since the epoch
+                        or as an ISO 8601 date and time
+        The data are read and sent in chunks, so the memory used does not
+        depend on the amount of data.
+        """
+        try:
+            file_format = query.get('format', ['csv'])[0]
+            if file_format not in ('csv', 'ndjson'):
+                raise ValueError("Unknown format")
+            fields = self._export_fields(query.get('fields', [None])[0])
+            start = self._parse_time(query.get('start', [None])[0])
+            end = self._parse_time(query.get('end', [None])[0])
+            source = query.get('source', ['buffer'])[0]
+            if source == 'buffer':
+                rows = self._buffer_rows(fields, start, end)
+            elif (source == 'logs') and (self.log_file_directory is not None):
+                rows = self._log_file_rows(fields, start, end)
+            else:
+                raise ValueError("Unknown data source")
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        if file_format == 'csv':
+            self.send_chunked_content(
+                "text/csv; charset=utf-8", self._csv_lines(fields, rows),
+                {"Content-Disposition": 'attachment; filename="data.csv"'})
+        else:
+            self.send_chunked_content(
+                "application/x-ndjson", self._ndjson_lines(fields, rows),
+                {"Content-Disposition":
+                 'attachment; filename="data.ndjson"'})
+
+    def _export_fields(self, fields):
+        available = self.variable_names[0:self._served_variable_count()]
+        if fields is None:
+            return list(available)
+        fields = fields.split(',')
+        for field in fields:
+            if field not in available:
+                raise ValueError(f"Unknown field: {field}")
+        return fields
+
+    @staticmethod
+    def _parse_time(value):
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return datetime.fromisoformat(value).timestamp()
+
+    def _buffer_rows(self, fields, start, end):
+        # Yield (timestamp, values) from the buffer, reading a few sets of
+        # data at a time so that the buffer is not locked for long. Data
+        # which are replaced in the buffer during the export are skipped.
+        indices = [self.variable_names.index(f) for f in fields]
+        with self.data_lock:
+            sequence = self.data.first_sequence()
+            last_sequence = self.data.last_sequence
+        while sequence <= last_sequence:
+            rows = []
+            with self.data_lock:
+                sequence = max(sequence, self.data.first_sequence())
+                for _ in range(self.export_rows_per_read):
+                    row = self.data.row(sequence)
+                    if (row is None) or (sequence > last_sequence):
+                        break
+                    rows.append(row)
+                    sequence += 1
+            if not rows:
+                break
+            for (timestamp, values) in rows:
+                if (start is not None) and (timestamp < start):
+                    continue
+                if (end is not None) and (timestamp > end):
+                    return
+                yield (timestamp, [values[i] for i in indices])
+
+    def _log_file_rows(self, fields, start, end):
+        # Yield (timestamp, values) from the log files
+        columns = [log_files.LOG_COLUMNS.index(self.export_details[f][0])
+                   for f in fields]
+        for (timestamp, values) in log_files.read_logs(
+                self.log_file_directory, start, end):
+            yield (timestamp, [values[c] if c < len(values) else math.nan
+                               for c in columns])
+
+    def _export_title(self, field):
+        (_, name, unit, _) = self.export_details[field]
+        if field == 'temperature' and sensor.USE_FAHRENHEIT:
+            unit = const.FAHRENHEIT_SYMBOL
+        elif (field == 'particle'
+              and sensor.PARTICLE_SENSOR == const.PARTICLE_SENSOR_PPD42):
+            unit = 'ppL'
+        return name if unit == '' else f"{name} / {unit}"
+
+    def _csv_lines(self, fields, rows):
+        # The first line is a UTF-8 byte order mark and the column titles
+        yield ('\uFEFF"Time and Date"'
+               + ''.join(f',"{self._export_title(f)}"' for f in fields)
+               + '\r\n')
+        decimal_places = [self.export_details[f][3] for f in fields]
+        for (timestamp, values) in rows:
+            yield (f'"{datetime.fromtimestamp(timestamp):%Y-%m-%d %H:%M:%S}"'
+                   + ''.join(',' + ('' if math.isnan(v) else f'{v:.{dp}f}')
+                             for (v, dp) in zip(values, decimal_places))
+                   + '\r\n')
+
+    def _ndjson_lines(self, fields, rows):
+        decimal_places = [self.export_details[f][3] for f in fields]
+        for (timestamp, values) in rows:
+            data = {'time': timestamp}
+            for (f, v, dp) in zip(fields, values, decimal_places):
+                if math.isnan(v):
+                    data[f] = None
+                else:
+                    data[f] = round(v, dp) if dp > 0 else round(v)
+            yield json.dumps(data) + '\n'
+
+    def send_event_stream(self):
+        """Send each new set of data to the client as it becomes available.
+
+        This continues until the client disconnects. A client which
+        reconnects is sent any events it missed, or a "resync" event
+        if it must reload all data using the '/1' request.
+        """
+        event_id = self.event_stream.start_id(
+            self.headers.get('Last-Event-ID'))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        try:
+            self.wfile.write(b"retry: 2000\n\n")
+            while True:
+                if event_id is None:
+                    self.wfile.write(b"event: resync\ndata:\n\n")
+                    return
+                events = self.event_stream.events_after(
+                    event_id, self.event_keepalive_seconds)
+                if events is None:
+                    event_id = None
+                elif not events:
+                    self.wfile.write(b": keep-alive\n\n")
+                else:
+                    event_id = events[-1][0]
+                    self.wfile.write(b''.join(e[1] for e in events))
+        except OSError:
+            # The client has disconnected
+            pass
+
+    @classmethod
+    def data_update_complete(cls, timestamp=None):
+        """Store the new data and send them to clients.
+
+        This must be called after each set of update_*_data() calls: the
+        data are not added to the buffer until then.
+        timestamp: the time at which the data were read, in seconds since
+                   the epoch; the current time is used if not given.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        with cls.data_lock:
+            if not cls.new_data:
+                return
+            # A variable which was not updated is stored as "not a number"
+            values = [cls.new_data.get(name, math.nan)
+                      for name in cls.variable_names]
+            cls.data.append(values, timestamp)
+            cls.new_data = {}
+            sequence = cls.data.last_sequence
+            values = values[0:cls._served_variable_count()]
+        cls.metrics.cycle_complete(timestamp)
+        cls.event_stream.publish(json.dumps(
+            {'sequence': sequence, 'time': timestamp,
+             'values': [None if math.isnan(v) else v for v in values]}))
 
     @classmethod
-    def set_buffer_length(cls, buffer_length):
-        """Create a FIFO data buffer for each variable."""
-        cls.temperature = deque(maxlen=buffer_length)
-        cls.pressure = deque(maxlen=buffer_length)
-        cls.humidity = deque(maxlen=buffer_length)
-        cls.AQI = deque(maxlen=buffer_length)
-        cls.bVOC = deque(maxlen=buffer_length)
-        cls.SPL = deque(maxlen=buffer_length)
-        cls.illuminance = deque(maxlen=buffer_length)
-        cls.particle = deque(maxlen=buffer_length)
+    def _served_variable_count(cls):
+        # Particle data are sent only if a particle sensor is used
+        if sensor.PARTICLE_SENSOR == const.PARTICLE_SENSOR_OFF:
+            return len(cls.variable_names) - 1
+        return len(cls.variable_names)
+
+    @classmethod
+    def set_buffer_length(cls, buffer_length, history_file=None):
+        """Create a FIFO data buffer for the variables.
+
+        If a history file is given, the buffer is kept in this file and
+        any data which it already contains are used. Raises ValueError if
+        the length is more than max_buffer_length.
+        """
+        if not (1 <= buffer_length <= cls.max_buffer_length):
+            raise ValueError("The buffer length must be from 1 to "
+                             f"{cls.max_buffer_length}")
+        with cls.data_lock:
+            cls.data = DataBuffer(len(cls.variable_names), buffer_length,
+                                  file_path=history_file)
 
     @classmethod
     def update_air_data(cls, air_data):
-        cls.temperature.append(air_data['T'])
-        cls.pressure.append(air_data['P_Pa'])
-        cls.humidity.append(air_data['H_pc'])
+        cls.metrics.update(air_data=air_data)
+        with cls.data_lock:
+            cls.new_data.update(temperature=air_data['T'],
+                                pressure=air_data['P_Pa'],
+                                humidity=air_data['H_pc'])
 
     @classmethod
     def update_air_quality_data(cls, air_quality_data):
-        cls.AQI.append(air_quality_data['AQI'])
-        cls.bVOC.append(air_quality_data['bVOC'])
+        cls.metrics.update(air_quality_data=air_quality_data)
+        with cls.data_lock:
+            cls.new_data.update(AQI=air_quality_data['AQI'],
+                                bVOC=air_quality_data['bVOC'])
 
     @classmethod
     def update_light_data(cls, light_data):
-        cls.illuminance.append(light_data['illum_lux'])
+        cls.metrics.update(light_data=light_data)
+        with cls.data_lock:
+            cls.new_data['illuminance'] = light_data['illum_lux']
 
     @classmethod
     def update_sound_data(cls, sound_data):
-        cls.SPL.append(sound_data['SPL_dBA'])
+        cls.metrics.update(sound_data=sound_data)
+        with cls.data_lock:
+            cls.new_data['SPL'] = sound_data['SPL_dBA']
 
     @classmethod
     def update_particle_data(cls, particle_data):
-        cls.particle.append(particle_data['concentration'])
+        cls.metrics.update(particle_data=particle_data)
+        with cls.data_lock:
+            cls.new_data['particle'] = particle_data['concentration']
 
 
 def get_IP_addresses():
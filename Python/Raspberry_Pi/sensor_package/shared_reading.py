@@ -0,0 +1,148 @@
+"""Share the newest MS430 data with other programs through shared memory.
+
+This file contains a class which writes each new set of data into a
+shared memory segment, and a class which reads it from any program on
+the same computer. Reading does not use the sensor, a socket or any
+system call, so programs can check the current values as often as they
+like (e.g. many times per second) at almost no cost.
+
+The segment contains an 8-byte counter followed by the data, as a
+fixed-size record (see snapshot_format.py). The writer and readers use
+a "sequence lock": the writer makes the counter odd before changing the
+record and even afterwards, and a reader only accepts a record if the
+counter was even and unchanged while it was copied. The counter is also
+twice the sequence number in the record, which detects any copy which
+mixes two sets of data. Readers never block the writer.
+
+This file does not use the sensor hardware, so the reader can be used
+on any computer.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import struct
+from multiprocessing import shared_memory, resource_tracker
+from .snapshot_format import RECORD, pack_snapshot, unpack_snapshot
+
+# The segment name used if no other is chosen
+DEFAULT_SEGMENT_NAME = "ms430_latest"
+
+COUNTER = struct.Struct('<Q')
+SEGMENT_SIZE = COUNTER.size + RECORD.size
+
+
+class SharedReadingWriter:
+    """Write each new set of data to the shared memory segment.
+
+    Only one writer may use a segment. write() can be used as a pipeline
+    sink function.
+    """
+
+    def __init__(self, name=DEFAULT_SEGMENT_NAME):
+        """Create the segment, or reuse one left by a previous writer."""
+        try:
+            self.memory = shared_memory.SharedMemory(name, True,
+                                                     SEGMENT_SIZE)
+        except FileExistsError:
+            self.memory = shared_memory.SharedMemory(name)
+            if self.memory.size < SEGMENT_SIZE:
+                self.memory.close()
+                raise RuntimeError(f"Shared memory {name} is too small")
+        self.buffer = self.memory.buf
+        (counter,) = COUNTER.unpack_from(self.buffer)
+        # Continue the sequence of a previous writer, so that readers see
+        # the new data as new
+        self.sequence = counter // 2
+
+    def write(self, snapshot):
+        """Replace the shared data with a snapshot."""
+        self.sequence += 1
+        record = pack_snapshot(self.sequence, snapshot)
+        COUNTER.pack_into(self.buffer, 0, (2 * self.sequence) - 1)
+        self.buffer[COUNTER.size:SEGMENT_SIZE] = record
+        COUNTER.pack_into(self.buffer, 0, 2 * self.sequence)
+
+    def close(self, remove=True):
+        """Stop using the segment, and remove it unless remove is False."""
+        self.memory.close()
+        if remove:
+            self.memory.unlink()
+
+
+class SharedReadingReader:
+    """Read the newest data from the shared memory segment."""
+
+    def __init__(self, name=DEFAULT_SEGMENT_NAME, retries=1000):
+        """Open the segment.
+
+        retries: the number of times to try again if the data change
+                 while being copied
+        Raises FileNotFoundError if there is no writer.
+        """
+        self.memory = _attach(name)
+        self.buffer = self.memory.buf
+        self.retries = retries
+        self.counter = 0
+        self.data = None
+
+    def read(self):
+        """Get the newest data, or None if none have been written yet.
+
+        The data are a dictionary, as given by unpack_snapshot() (see
+        snapshot_format.py). The same dictionary is returned until new
+        data are written, so it must not be changed. If the data are
+        being written, the previous data are returned.
+        """
+        for _ in range(self.retries):
+            (counter,) = COUNTER.unpack_from(self.buffer)
+            if counter == self.counter:
+                return self.data
+            if counter & 1:
+                # Being written
+                continue
+            record = bytes(self.buffer[COUNTER.size:SEGMENT_SIZE])
+            if COUNTER.unpack_from(self.buffer)[0] != counter:
+                continue
+            try:
+                data = unpack_snapshot(record)
+            except ValueError:
+                continue
+            if (2 * data['sequence']) != counter:
+                continue
+            self.counter = counter
+            self.data = data
+            break
+        return self.data
+
+    def sequence(self):
+        """Get the sequence number of the newest data (0 if none)."""
+        return COUNTER.unpack_from(self.buffer)[0] // 2
+
+    def close(self):
+        """Stop using the segment."""
+        self.memory.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+def _attach(name):
+    # Open an existing segment without letting this process remove it
+    # when it exits (which Python before 3.13 does for any segment)
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        pass
+    memory = shared_memory.SharedMemory(name)
+    try:
+        resource_tracker.unregister(memory._name, "shared_memory")
+    except Exception:
+        pass
+    return memory
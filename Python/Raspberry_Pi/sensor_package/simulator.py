@@ -0,0 +1,124 @@
+"""A simulated MS430 for use without the sensor hardware.
+
+This file contains a class which can be used in place of the I2C bus
+object (from SensorHardwareSetup) by the get_*_data functions in
+sensor_functions.py. It returns realistic, slowly varying environment
+data in the same byte format as the MS430, so the examples and servers
+can be developed, tested and benchmarked on any computer.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import math
+import random
+import time
+from . import sensor_constants as const
+
+
+class SimulatedI2CBus:
+    """Provide the I2C bus functions used with the MS430, with made-up data.
+
+    The data follow slow daily-like cycles with random noise, and change
+    with the time since the object was created. A fixed random seed gives
+    the same data on each run.
+    """
+
+    def __init__(self, seed=0, period_seconds=600):
+        """Start the simulation.
+
+        seed: the random number generator seed
+        period_seconds: the time taken for the slow data cycles to repeat
+        """
+        self.random = random.Random(seed)
+        self.period_seconds = period_seconds
+        self.start_time = time.monotonic()
+        self.registers = {}
+        self.last_command = None
+        self.read_functions = {
+            const.AIR_DATA_READ: self._air_data,
+            const.AIR_QUALITY_DATA_READ: self._air_quality_data,
+            const.LIGHT_DATA_READ: self._light_data,
+            const.SOUND_DATA_READ: self._sound_data,
+            const.PARTICLE_DATA_READ: self._particle_data}
+
+    def write_byte(self, i2c_address, command):
+        """Accept a command, e.g. CYCLE_MODE_CMD."""
+        self.last_command = command
+
+    def write_i2c_block_data(self, i2c_address, register, data):
+        """Store the setting written to a register."""
+        self.registers[register] = list(data)
+
+    def read_i2c_block_data(self, i2c_address, register, length):
+        """Get a list of bytes for one of the *_DATA_READ registers."""
+        if register not in self.read_functions:
+            raise OSError(f"Register {register:#x} is not simulated")
+        data = self.read_functions[register]()
+        if len(data) != length:
+            raise OSError(f"Register {register:#x} has {len(data)} bytes")
+        return data
+
+    def _cycle(self, phase=0):
+        # A value from -1 to 1 which varies slowly with time
+        t = time.monotonic() - self.start_time
+        return math.sin((2 * math.pi * t / self.period_seconds) + phase)
+
+    def _noise(self, size):
+        return self.random.uniform(-size, size)
+
+    def _air_data(self):
+        T_C = 21 + (3 * self._cycle()) + self._noise(0.1)
+        sign = const.TEMPERATURE_SIGN_MASK if (T_C < 0) else 0
+        T_bytes = self._fixed_point(abs(T_C), 1, 10)
+        P_Pa = round(101325 + (500 * self._cycle(1)) + self._noise(5))
+        H_pc = 45 + (10 * self._cycle(2)) + self._noise(0.5)
+        G_ohm = round(50000 + (20000 * self._cycle(3)) + self._noise(500))
+        return ([T_bytes[0] | sign, T_bytes[1]] + self._integer(P_Pa, 4)
+                + self._fixed_point(H_pc, 1, 10) + self._integer(G_ohm, 4))
+
+    def _air_quality_data(self):
+        AQI = 60 + (40 * self._cycle(3)) + self._noise(2)
+        CO2e = 600 + (200 * self._cycle(3)) + self._noise(10)
+        bVOC = 0.8 + (0.5 * self._cycle(3)) + self._noise(0.05)
+        return (self._fixed_point(AQI, 2, 10) + self._fixed_point(CO2e, 2, 10)
+                + self._fixed_point(bVOC, 2, 100) + [3])
+
+    def _light_data(self):
+        illum_lux = 200 + (180 * self._cycle(4)) + self._noise(1)
+        white = round(illum_lux * 5)
+        return self._fixed_point(illum_lux, 2, 100) + self._integer(white, 2)
+
+    def _sound_data(self):
+        SPL_dBA = 45 + (10 * self._cycle(5)) + self._noise(3)
+        bands = [SPL_dBA - (2 * abs(b - 2)) + self._noise(1)
+                 for b in range(const.SOUND_FREQ_BANDS)]
+        band_bytes = [self._fixed_point(b, 1, 10) for b in bands]
+        peak_amp_mPa = 10 ** (SPL_dBA / 40) + self._noise(0.5)
+        return (self._fixed_point(SPL_dBA, 1, 10)
+                + [b[0] for b in band_bytes] + [b[1] for b in band_bytes]
+                + self._fixed_point(peak_amp_mPa, 2, 100) + [1])
+
+    def _particle_data(self):
+        duty_cycle_pc = 2 + self._cycle(6) + self._noise(0.1)
+        concentration = 8 + (6 * self._cycle(6)) + self._noise(0.5)
+        return (self._fixed_point(duty_cycle_pc, 1, 100)
+                + self._fixed_point(concentration, 2, 100) + [1])
+
+    @classmethod
+    def _fixed_point(cls, value, integer_bytes, fraction_scale):
+        # Split a positive value into its little-endian integer part and
+        # one byte for the fractional part (e.g. tenths)
+        value = max(0, value)
+        integer = math.floor(value)
+        fraction = min(round((value - integer) * fraction_scale),
+                       fraction_scale - 1)
+        return cls._integer(integer, integer_bytes) + [fraction]
+
+    @staticmethod
+    def _integer(value, byte_count):
+        value = min(max(0, value), (1 << (8 * byte_count)) - 1)
+        return [(value >> (8 * n)) & 0xFF for n in range(byte_count)]
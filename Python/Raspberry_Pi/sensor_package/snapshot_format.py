@@ -0,0 +1,85 @@
+"""A compact binary form of the MS430 data snapshots.
+
+This file converts a snapshot (see read_snapshot() in pipeline.py) into
+a fixed-size record, and back. The record contains a sequence number,
+the read time and one 32-bit float for each of LOG_COLUMNS (see
+log_files.py), so it can be sent to other processes (see daemon.py)
+without the cost of text formats such as JSON.
+
+This file does not use the sensor hardware, so it can be used on any
+computer.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import math
+import struct
+from .log_files import LOG_COLUMNS
+
+# The names of the values in each record, in order
+VALUE_NAMES = LOG_COLUMNS
+
+FORMAT_VERSION = 1
+RECORD_MAGIC = b'MS43'
+
+# The record layout (little-endian): magic bytes, format version, flags,
+# 2 unused bytes, sequence number, read time (seconds since the epoch),
+# then the values
+RECORD = struct.Struct('<4sBBHQd' + str(len(VALUE_NAMES)) + 'f')
+
+# The flags bit which is set if the particle data are present
+FLAG_PARTICLE_DATA = 0x01
+
+PARTICLE_VALUE_NAMES = ['duty_cycle_pc', 'concentration', 'valid']
+
+
+def snapshot_values(snapshot):
+    """Get a list of the snapshot values, in the order of VALUE_NAMES.
+
+    The particle values are NaN if there is no particle sensor.
+    """
+    air_data = snapshot['air_data']
+    air_quality_data = snapshot['air_quality_data']
+    light_data = snapshot['light_data']
+    sound_data = snapshot['sound_data']
+    particle_data = snapshot['particle_data']
+    values = [air_data['T'], air_data['P_Pa'], air_data['H_pc'],
+              air_data['G_ohm'], air_quality_data['AQI'],
+              air_quality_data['CO2e'], air_quality_data['bVOC'],
+              air_quality_data['AQI_accuracy'], light_data['illum_lux'],
+              light_data['white'], sound_data['SPL_dBA']]
+    values += list(sound_data['SPL_bands_dB'])
+    values += [sound_data['peak_amp_mPa'], sound_data['stable']]
+    if particle_data is None:
+        values += [math.nan] * len(PARTICLE_VALUE_NAMES)
+    else:
+        values += [particle_data[name] for name in PARTICLE_VALUE_NAMES]
+    return values
+
+
+def pack_snapshot(sequence, snapshot):
+    """Get the record of a snapshot, as bytes."""
+    flags = 0 if snapshot['particle_data'] is None else FLAG_PARTICLE_DATA
+    return RECORD.pack(RECORD_MAGIC, FORMAT_VERSION, flags, 0, sequence,
+                       snapshot['time'], *snapshot_values(snapshot))
+
+
+def unpack_snapshot(record, offset=0):
+    """Get the data from a record (bytes or any buffer) at an offset.
+
+    Returns a dictionary with the "sequence" number, the read "time" and
+    a dictionary of "values" by name (see VALUE_NAMES), which only has
+    the particle values if they are present.
+    """
+    (magic, version, flags, _, sequence, read_time,
+     *values) = RECORD.unpack_from(record, offset)
+    if (magic != RECORD_MAGIC) or (version != FORMAT_VERSION):
+        raise ValueError("Not a snapshot record of a known format")
+    if not (flags & FLAG_PARTICLE_DATA):
+        values = values[0:-len(PARTICLE_VALUE_NAMES)]
+    return {'sequence': sequence, 'time': read_time,
+            'values': dict(zip(VALUE_NAMES, values))}
@@ -0,0 +1,303 @@
+"""Local stand-ins for the network services used by the examples.
+
+This file contains simple local servers which behave like the parts of
+other services used by the examples, so that the data publishing code
+can be tried and tested without those services. They can simulate slow
+responses and failures.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import json
+import time
+import struct
+import threading
+import socket
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class HomeAssistantStandIn:
+    """Accept entity state posts like the Home Assistant REST API.
+
+    The latest state posted for each entity ID is stored in "states".
+    Each response can be delayed by "delay" seconds, and posts for the
+    entity IDs in "failing_entities" get an error response.
+    """
+
+    def __init__(self, access_token, port=0, delay=0, failing_entities=()):
+        """Start the server on the local host.
+
+        port: the TCP port, or 0 to use any free port (see self.port)
+        """
+        self.access_token = access_token
+        self.delay = delay
+        self.failing_entities = set(failing_entities)
+        self.states = {}
+        self.post_count = 0
+        self.connection_count = 0
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stand_in.lock:
+                    stand_in.connection_count += 1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                stand_in._handle_post(self, body)
+
+            def log_request(self, code='-', size='-'):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+
+    def stop(self):
+        """Stop the server."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handle_post(self, request, body):
+        time.sleep(self.delay)
+        entity_id = request.path.removeprefix('/api/states/')
+        if (not request.path.startswith('/api/states/')
+                or request.headers.get('Authorization')
+                != "Bearer " + self.access_token):
+            self._respond(request, 401, {"message": "Unauthorized"})
+        elif entity_id in self.failing_entities:
+            self._respond(request, 500, {"message": "Simulated failure"})
+        else:
+            state = json.loads(body)
+            with self.lock:
+                self.post_count += 1
+                self.states[entity_id] = state
+            self._respond(request, 200, dict(state, entity_id=entity_id))
+
+    @staticmethod
+    def _respond(request, status, content):
+        body = json.dumps(content).encode('utf-8')
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+
+class MQTTBrokerStandIn:
+    """A minimal MQTT 3.1.1 broker, for use with a few local clients.
+
+    It supports QoS 0, 1 and 2, retained messages, subscriptions (with
+    + and # wildcards) and last will messages, but no sessions: nothing
+    is kept for a client after it disconnects. Every message received is
+    added to "messages" as (topic, payload, qos, retain), and "retained"
+    holds the retained payloads by topic.
+    """
+
+    def __init__(self, port=0):
+        """Start the broker on the local host.
+
+        port: the TCP port, or 0 to use any free port (see self.port)
+        """
+        self.messages = []
+        self.retained = {}
+        self.connection_count = 0
+        self.clients = set()
+        self.lock = threading.Lock()
+        stand_in = self
+
+        class Handler(socketserver.StreamRequestHandler):
+
+            def handle(self):
+                stand_in._handle_client(self)
+
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", port),
+                                                      Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+
+    def publish(self, topic, payload, retain=False):
+        """Publish a message from the broker, e.g. to simulate a client."""
+        self._deliver(topic, payload, 0, retain)
+
+    def drop_connections(self):
+        """Close all client connections, to simulate a network failure.
+
+        The last will messages of the clients are published.
+        """
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def stop(self):
+        """Stop the broker."""
+        self.drop_connections()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handle_client(self, client):
+        client.subscriptions = []
+        client.send_lock = threading.Lock()
+        will = None
+        try:
+            (packet_type, flags, body) = self._read_packet(client.rfile)
+            if packet_type != 1:
+                return
+            will = self._connect(client, body)
+            with self.lock:
+                self.connection_count += 1
+                self.clients.add(client)
+            while True:
+                (packet_type, flags, body) = self._read_packet(client.rfile)
+                if packet_type == 3:
+                    self._receive_publish(client, flags, body)
+                elif packet_type == 6:
+                    # PUBREL: complete a QoS 2 exchange
+                    self._send(client, 0x70, body[:2])
+                elif packet_type == 8:
+                    self._subscribe(client, body)
+                elif packet_type == 12:
+                    self._send(client, 0xD0, b'')
+                elif packet_type == 14:
+                    will = None
+                    return
+        except (OSError, ValueError, IndexError, struct.error):
+            pass
+        finally:
+            with self.lock:
+                self.clients.discard(client)
+            if will is not None:
+                self._deliver(*will)
+
+    def _connect(self, client, body):
+        # Return the last will message, or None
+        (name, position) = self._read_string(body, 0)
+        (flags,) = struct.unpack_from('>B', body, position + 1)
+        position += 4
+        (client_id, position) = self._read_string(body, position)
+        will = None
+        if flags & 0x04:
+            (will_topic, position) = self._read_string(body, position)
+            (will_payload, position) = self._read_string(body, position,
+                                                         False)
+            will = (will_topic, will_payload, (flags >> 3) & 3,
+                    bool(flags & 0x20))
+        self._send(client, 0x20, b'\x00\x00')
+        return will
+
+    def _receive_publish(self, client, flags, body):
+        qos = (flags >> 1) & 3
+        (topic, position) = self._read_string(body, 0)
+        if qos > 0:
+            packet_id = body[position:position + 2]
+            position += 2
+        self._deliver(topic, body[position:], qos, bool(flags & 1))
+        if qos == 1:
+            self._send(client, 0x40, packet_id)
+        elif qos == 2:
+            self._send(client, 0x50, packet_id)
+
+    def _subscribe(self, client, body):
+        position = 2
+        topic_filters = []
+        while position < len(body):
+            (topic_filter, position) = self._read_string(body, position)
+            topic_filters.append(topic_filter)
+            position += 1
+        client.subscriptions.extend(topic_filters)
+        self._send(client, 0x90, body[:2] + bytes(len(topic_filters)))
+        with self.lock:
+            retained = list(self.retained.items())
+        for (topic, payload) in retained:
+            if any(self._matches(f, topic) for f in topic_filters):
+                self._send_publish(client, topic, payload, True)
+
+    def _deliver(self, topic, payload, qos, retain):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        with self.lock:
+            self.messages.append((topic, payload, qos, retain))
+            if retain:
+                if payload:
+                    self.retained[topic] = payload
+                else:
+                    self.retained.pop(topic, None)
+            clients = list(self.clients)
+        # Messages are forwarded with QoS 0
+        for client in clients:
+            if any(self._matches(f, topic) for f in client.subscriptions):
+                try:
+                    self._send_publish(client, topic, payload, False)
+                except OSError:
+                    pass
+
+    def _send_publish(self, client, topic, payload, retain):
+        topic = topic.encode('utf-8')
+        self._send(client, 0x31 if retain else 0x30,
+                   struct.pack('>H', len(topic)) + topic + payload)
+
+    @staticmethod
+    def _matches(topic_filter, topic):
+        filter_levels = topic_filter.split('/')
+        levels = topic.split('/')
+        for (n, level) in enumerate(filter_levels):
+            if level == '#':
+                return True
+            if (n >= len(levels)) or (level not in ('+', levels[n])):
+                return False
+        return len(levels) == len(filter_levels)
+
+    @staticmethod
+    def _send(client, first_byte, body):
+        length = len(body)
+        header = bytearray([first_byte])
+        while True:
+            (length, byte) = divmod(length, 128)
+            header.append(byte | (0x80 if length > 0 else 0))
+            if length == 0:
+                break
+        with client.send_lock:
+            client.wfile.write(bytes(header) + body)
+
+    @staticmethod
+    def _read_packet(rfile):
+        first_byte = rfile.read(1)
+        if not first_byte:
+            raise ValueError("Connection closed")
+        (length, multiplier) = (0, 1)
+        while True:
+            byte = rfile.read(1)[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not (byte & 0x80):
+                break
+        body = rfile.read(length)
+        if len(body) != length:
+            raise ValueError("Connection closed")
+        return (first_byte[0] >> 4, first_byte[0] & 0x0F, body)
+
+    @staticmethod
+    def _read_string(body, position, decode=True):
+        (length,) = struct.unpack_from('>H', body, position)
+        value = body[position + 2:position + 2 + length]
+        if decode:
+            value = value.decode('utf-8')
+        return (value, position + 2 + length)
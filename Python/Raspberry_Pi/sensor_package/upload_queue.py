@@ -0,0 +1,164 @@
+"""A durable queue of data waiting to be uploaded, with a background uploader.
+
+This file contains a queue class which keeps data in an SQLite database
+file until they have been sent, so that no data are lost when the
+network (or the program) stops for a while, and a class which sends
+the queued data from a background thread. Data are sent oldest first,
+in batches, and failed uploads are retried with increasing delays.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import json
+import random
+import sqlite3
+import threading
+
+
+class UploadQueue:
+    """Store data (any JSON-compatible values) in a file until uploaded.
+
+    The queue holds at most "max_items" items: when it is full, the
+    oldest items are removed to make room for new ones. Items stay in
+    the queue until remove() is called, so an item is not lost if the
+    program stops while it is being sent.
+    """
+
+    def __init__(self, file_path, max_items=100000):
+        """Open the queue file, creating it if necessary."""
+        self.max_items = max_items
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(file_path,
+                                          check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY "
+                "AUTOINCREMENT, time REAL NOT NULL, item TEXT NOT NULL)")
+        self.evicted = 0
+
+    def put(self, item, timestamp):
+        """Add an item to the end of the queue.
+
+        timestamp: the time of the data, in seconds since the epoch
+        """
+        with self.lock, self.connection:
+            row_id = self.connection.execute(
+                "INSERT INTO queue (time, item) VALUES (?, ?)",
+                (timestamp, json.dumps(item))).lastrowid
+            self.evicted += self.connection.execute(
+                "DELETE FROM queue WHERE id <= ?",
+                (row_id - self.max_items,)).rowcount
+
+    def get_batch(self, max_count):
+        """Get a list of up to max_count of the oldest items.
+
+        Each list element is (item ID, timestamp, item). The items are not
+        removed from the queue.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, time, item FROM queue ORDER BY id LIMIT ?",
+                (max_count,)).fetchall()
+        return [(row_id, t, json.loads(item)) for (row_id, t, item) in rows]
+
+    def remove(self, last_id):
+        """Remove all items up to and including the given item ID."""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM queue WHERE id <= ?",
+                                    (last_id,))
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM queue").fetchone()[0]
+
+
+class BackgroundUploader:
+    """Send the items in an UploadQueue from a background thread.
+
+    The items are passed, in batches of up to "batch_size", to the
+    function send_batch(batch) where batch is a list of (timestamp, item).
+    This function must raise an exception if the upload fails. After a
+    failure, the batch is retried after a delay which doubles after each
+    further failure, up to "max_retry_delay" seconds. Otherwise, batches
+    are sent one after another until the queue is empty, so a backlog is
+    uploaded at full speed when the connection returns.
+    """
+
+    def __init__(self, queue, send_batch, batch_size=50,
+                 min_retry_delay=5, max_retry_delay=600,
+                 min_batch_interval=0):
+        """Start the uploader thread.
+
+        min_batch_interval: the minimum time in seconds between uploads,
+                            for services with a rate limit
+        """
+        self.queue = queue
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.min_retry_delay = min_retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.min_batch_interval = min_batch_interval
+        self.new_data = threading.Event()
+        self.stopping = threading.Event()
+        self.failures = 0
+        self.last_error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, item, timestamp):
+        """Add an item to the queue and wake the uploader."""
+        self.queue.put(item, timestamp)
+        self.new_data.set()
+
+    def stop(self, timeout=None):
+        """Stop the uploader thread; queued items remain in the queue."""
+        self.stopping.set()
+        self.new_data.set()
+        self.thread.join(timeout)
+
+    def _run(self):
+        while not self.stopping.is_set():
+            self.new_data.clear()
+            batch = self.queue.get_batch(self.batch_size)
+            if not batch:
+                self.new_data.wait()
+                continue
+            try:
+                self.send_batch([(t, item) for (_, t, item) in batch])
+            except Exception as e:
+                self.failures += 1
+                self.last_error = e
+                self._on_failure(e, len(self.queue))
+                self.stopping.wait(self._retry_delay())
+                continue
+            self.queue.remove(batch[-1][0])
+            if self.failures > 0:
+                self.failures = 0
+                self._on_recovery(len(self.queue))
+            if self.min_batch_interval > 0:
+                self.stopping.wait(self.min_batch_interval)
+
+    def _retry_delay(self):
+        # Exponential backoff with random jitter, so that many devices
+        # do not all retry at the same time
+        doublings = min(self.failures - 1, 20)
+        delay = min(self.min_retry_delay * (2 ** doublings),
+                    self.max_retry_delay)
+        return delay * random.uniform(0.8, 1.0)
+
+    def _on_failure(self, error, waiting):
+        print("Upload failed with the following error:")
+        print(repr(error))
+        print(f"{waiting} sets of data are waiting; the upload will be "
+              f"retried in the background.")
+
+    def _on_recovery(self, waiting):
+        print(f"Upload succeeded after failures: {waiting} sets of data "
+              f"are still waiting.")
@@ -0,0 +1,314 @@
+"""Load test and benchmark of the web servers, using a simulated MS430.
+
+This program runs the text web page server (as in web_server.py) or the
+graph web page server (as in graph_web_server.py) with data from a
+simulated sensor, so it does not need the sensor hardware and can run
+on any computer. Many simultaneous clients then request pages and data
+from the server for a fixed time, using keep-alive connections like
+browsers do.
+
+The results are printed and saved to a JSON file, including: request
+throughput, latency percentiles for each URI path, and the processor
+use and memory size of the server. A previous results file can be
+given as a baseline, and this program then exits with an error status
+if the performance has become worse, so it can be used to check each
+change to the server code.
+
+The clients run in separate processes, so that their processor use is
+not included in the server measurements.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import time
+import json
+import sys
+import platform
+import threading
+import socketserver
+import http.client
+import multiprocessing
+from datetime import datetime
+from pathlib import Path
+from subprocess import check_output, CalledProcessError
+import psutil
+import sensor_package.servers as server
+import sensor_package.sensor_functions as sensor
+import sensor_package.sensor_constants as const
+from sensor_package.simulator import SimulatedI2CBus
+
+#########################################################
+# USER-EDITABLE SETTINGS
+
+# Choose the server to test: "graph" or "text"
+server_type = "graph"
+
+# The URI paths requested by each client, in turn. Use None for the
+# defaults: '/', '/1' and '/2' for the graph server, or '/' for the text
+# server (which serves the same page for all paths except /metrics).
+paths = None
+
+# The number of client processes, and of simultaneous connections made
+# by each process
+client_processes = 2
+connections_per_process = 8
+
+# The time for which results are recorded, after a warm-up time in which
+# the clients make requests but the results are not used
+duration_seconds = 10
+warmup_seconds = 2
+
+# The time between sets of simulated data. This is much shorter than the
+# real cycle periods, to test the server while data are being updated.
+simulated_cycle_seconds = 0.5
+
+# The graph server buffer length: the buffer is filled with simulated data
+# before the test, so that full-size responses are sent for path '/1'
+buffer_length = 200
+
+# Results are saved to this file
+results_file = "benchmark_results.json"
+
+# Give a previous results file here to compare with the new results. The
+# program exits with status 1 if the throughput has decreased, or the
+# 99th percentile latency has increased, by more than allowed_change_pc.
+baseline_file = None
+allowed_change_pc = 10
+
+# END OF USER-EDITABLE SETTINGS
+#########################################################
+
+
+def read_simulated_data(handler, I2C_bus, timestamp):
+    """Pass a set of data from the simulated MS430 to the server."""
+    air_data = sensor.get_air_data(I2C_bus)
+    air_quality_data = sensor.get_air_quality_data(I2C_bus)
+    light_data = sensor.get_light_data(I2C_bus)
+    sound_data = sensor.get_sound_data(I2C_bus)
+    if handler is server.GraphWebpageHandler:
+        handler.update_air_data(air_data)
+        handler.update_air_quality_data(air_quality_data)
+        handler.update_light_data(light_data)
+        handler.update_sound_data(sound_data)
+        handler.data_update_complete(timestamp)
+    else:
+        handler.air_data = air_data
+        handler.air_quality_data = air_quality_data
+        handler.light_data = light_data
+        handler.sound_data = sound_data
+        handler.assemble_web_page(
+            f'{datetime.fromtimestamp(timestamp):%H:%M:%S %Y-%m-%d}')
+
+
+def simulate_sensor(handler, stop):
+    """Provide new data to the server periodically, until stopped."""
+    I2C_bus = SimulatedI2CBus()
+    while not stop.wait(simulated_cycle_seconds):
+        read_simulated_data(handler, I2C_bus, time.time())
+
+
+def run_client(port, client_paths, start_time, end_time, results):
+    """Make requests on one connection until end_time.
+
+    The latency and size of each response which starts after start_time
+    are added to results (a dictionary of lists, by path).
+    """
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    n = 0
+    while time.time() < end_time:
+        path = client_paths[n % len(client_paths)]
+        n += 1
+        recorded = time.time() >= start_time
+        try:
+            t = time.perf_counter()
+            connection.request('GET', path)
+            response = connection.getresponse()
+            body = response.read()
+            latency = time.perf_counter() - t
+            ok = (response.status == 200)
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            ok = False
+        if recorded:
+            if ok:
+                results[path].append((latency, len(body)))
+            else:
+                results['errors'].append(path)
+
+
+def run_client_process(port, client_paths, start_time, end_time, queue):
+    """Run several client connections in threads, then report the results."""
+    results = {path: [] for path in client_paths}
+    results['errors'] = []
+    threads = [threading.Thread(target=run_client,
+                                args=(port, client_paths, start_time,
+                                      end_time, results))
+               for _ in range(connections_per_process)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    queue.put(results)
+
+
+def latency_statistics(latencies):
+    """Get latency statistics in milliseconds, from a list in seconds."""
+    if not latencies:
+        return None
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        # The nearest-rank method
+        index = max(0, round(p * len(latencies) / 100) - 1)
+        return round(latencies[index] * 1000, 3)
+
+    return {'mean': round(sum(latencies) * 1000 / len(latencies), 3),
+            'p50': percentile(50), 'p90': percentile(90),
+            'p99': percentile(99), 'max': percentile(100)}
+
+
+def git_commit():
+    """Get the current git commit of this code, or None."""
+    try:
+        return check_output(['git', 'rev-parse', 'HEAD'],
+                            cwd=Path(__file__).parent,
+                            text=True).strip()
+    except (OSError, CalledProcessError):
+        return None
+
+
+def compare_with_baseline(results):
+    """Print a comparison with the baseline, and return True if worse."""
+    with open(baseline_file, 'r') as f:
+        baseline = json.load(f)
+    worse = False
+    throughput_change = 100 * ((results['throughput_per_second']
+                                / baseline['throughput_per_second']) - 1)
+    p99_change = 100 * ((results['latency_ms']['p99']
+                         / baseline['latency_ms']['p99']) - 1)
+    print(f"Compared with {baseline_file} (commit {baseline['commit']}):")
+    print(f"   throughput {throughput_change:+.1f} %, "
+          f"99th percentile latency {p99_change:+.1f} %")
+    if throughput_change < -allowed_change_pc:
+        print("Throughput has decreased by more than the allowed change.")
+        worse = True
+    if p99_change > allowed_change_pc:
+        print("Latency has increased by more than the allowed change.")
+        worse = True
+    return worse
+
+
+def main():
+    if server_type == "graph":
+        handler = server.GraphWebpageHandler
+        handler.set_buffer_length(buffer_length)
+        client_paths = paths or ['/', '/1', '/2']
+    else:
+        handler = server.SimpleWebpageHandler
+        client_paths = paths or ['/']
+    sensor.PARTICLE_SENSOR = const.PARTICLE_SENSOR_OFF
+
+    # Fill the data buffer, with one second between the data
+    I2C_bus = SimulatedI2CBus()
+    now = time.time()
+    for n in range(buffer_length):
+        read_simulated_data(handler, I2C_bus, now - buffer_length + n)
+
+    the_server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), handler)
+    the_server.daemon_threads = True
+    port = the_server.server_address[1]
+    threading.Thread(target=the_server.serve_forever, daemon=True).start()
+    stop = threading.Event()
+    threading.Thread(target=simulate_sensor, args=(handler, stop),
+                     daemon=True).start()
+
+    print(f"Testing the {server_type} server for {duration_seconds} s, "
+          f"with {client_processes * connections_per_process} connections "
+          f"requesting: {', '.join(client_paths)}")
+    start_time = time.time() + warmup_seconds
+    end_time = start_time + duration_seconds
+    queue = multiprocessing.Queue()
+    processes = [multiprocessing.Process(
+                    target=run_client_process,
+                    args=(port, client_paths, start_time, end_time, queue))
+                 for _ in range(client_processes)]
+    for process in processes:
+        process.start()
+
+    # Measure the processor use and memory size of this (server) process
+    this_process = psutil.Process()
+    time.sleep(max(0, start_time - time.time()))
+    cpu_start = this_process.cpu_times()
+    rss_values = [this_process.memory_info().rss]
+    while time.time() < end_time:
+        time.sleep(0.1)
+        rss_values.append(this_process.memory_info().rss)
+    cpu_end = this_process.cpu_times()
+
+    client_results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+    stop.set()
+    the_server.shutdown()
+
+    all_latencies = []
+    path_results = {}
+    errors = sum(len(r['errors']) for r in client_results)
+    total_bytes = 0
+    for path in client_paths:
+        responses = [x for r in client_results for x in r[path]]
+        latencies = [x[0] for x in responses]
+        all_latencies.extend(latencies)
+        total_bytes += sum(x[1] for x in responses)
+        path_results[path] = {
+            'requests': len(responses),
+            'throughput_per_second': round(len(responses)
+                                           / duration_seconds, 1),
+            'latency_ms': latency_statistics(latencies)}
+    cpu_seconds = ((cpu_end.user - cpu_start.user)
+                   + (cpu_end.system - cpu_start.system))
+    results = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {
+            'server_type': server_type, 'paths': client_paths,
+            'connections': client_processes * connections_per_process,
+            'duration_seconds': duration_seconds,
+            'simulated_cycle_seconds': simulated_cycle_seconds,
+            'buffer_length': buffer_length},
+        'requests': len(all_latencies),
+        'errors': errors,
+        'throughput_per_second': round(len(all_latencies)
+                                       / duration_seconds, 1),
+        'bytes_per_second': round(total_bytes / duration_seconds),
+        'latency_ms': latency_statistics(all_latencies),
+        'paths': path_results,
+        'server_cpu_percent': round(100 * cpu_seconds / duration_seconds, 1),
+        'server_rss_MB': {
+            'start': round(rss_values[0] / 1e6, 1),
+            'max': round(max(rss_values) / 1e6, 1),
+            'end': round(rss_values[-1] / 1e6, 1)}}
+
+    with open(results_file, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"{results['requests']} requests ({results['errors']} errors), "
+          f"{results['throughput_per_second']} per second")
+    for path, r in path_results.items():
+        if r['latency_ms'] is not None:
+            print(f"   {path}: {r['requests']} requests, latency (ms): "
+                  + ", ".join(f"{k} {v}" for k, v in r['latency_ms'].items()))
+    print(f"Server processor use: {results['server_cpu_percent']} % "
+          f"(of one core), memory: {results['server_rss_MB']['max']} MB")
+    print(f"Results saved to {results_file}")
+    if (baseline_file is not None) and compare_with_baseline(results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
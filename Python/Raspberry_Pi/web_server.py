@@ -73,6 +73,12 @@ elif (cycle_period == const.CYCLE_PERIOD_100_S):
 else:  # CYCLE_PERIOD_300_S
     server.SimpleWebpageHandler.refresh_period_seconds = 50
 
+# The cycle period is used to measure the timing jitter of the data,
+# which is shown on the /metrics page
+server.SimpleWebpageHandler.metrics.cycle_period_seconds = {
+    const.CYCLE_PERIOD_3_S: 3, const.CYCLE_PERIOD_100_S: 100,
+    const.CYCLE_PERIOD_300_S: 300}[cycle_period]
+
 # Choose the TCP port number for the web page.
 port = 8080
 # The port can be any unused number from 1-65535 but values below 1024
@@ -93,7 +99,11 @@ else:
           "run the command ifconfig in a terminal.")
 print("Press ctrl-c to exit at any time.")
 
-the_server = socketserver.TCPServer(("", port), server.SimpleWebpageHandler)
+# Each client connection is handled in its own thread, so that browsers
+# can keep their connections open between requests.
+the_server = socketserver.ThreadingTCPServer(
+    ("", port), server.SimpleWebpageHandler)
+the_server.daemon_threads = True
 the_server.timeout = 0.1
 
 # Enter cycle mode to start periodic data output
@@ -107,32 +117,41 @@ while True:
         the_server.handle_request()
         time.sleep(0.05)
 
-    # Now read all data from the MS430 and pass to the web page
-
-    # Air data
-    server.SimpleWebpageHandler.air_data = sensor.get_air_data(I2C_bus)
-
-    # Air quality data
-    # The initial self-calibration of the air quality data may take several
-    # minutes to complete. During this time the accuracy parameter is zero
-    # and the data values are not valid.
-    server.SimpleWebpageHandler.air_quality_data = sensor.get_air_quality_data(I2C_bus)
-
-    # Light data
-    server.SimpleWebpageHandler.light_data = sensor.get_light_data(I2C_bus)
-
-    # Sound data
-    server.SimpleWebpageHandler.sound_data = sensor.get_sound_data(I2C_bus)
-
-    # Particle data
-    # This requires the connection of a particulate sensor (invalid
-    # values will be obtained if this sensor is not present).
-    # Also note that, due to the low pass filtering used, the
-    # particle data become valid after an initial initialization
-    # period of approximately one minute.
-    if sensor.PARTICLE_SENSOR != const.PARTICLE_SENSOR_OFF:
-        server.SimpleWebpageHandler.particle_data = sensor.get_particle_data(
-            I2C_bus, sensor.PARTICLE_SENSOR)
+    # Now read all data from the MS430 and pass to the web page.
+    # The read time and any I2C bus errors are recorded for the
+    # /metrics page.
+    read_start = time.monotonic()
+    try:
+        # Air data
+        server.SimpleWebpageHandler.air_data = sensor.get_air_data(I2C_bus)
+
+        # Air quality data
+        # The initial self-calibration of the air quality data may take
+        # several minutes to complete. During this time the accuracy
+        # parameter is zero and the data values are not valid.
+        server.SimpleWebpageHandler.air_quality_data = (
+            sensor.get_air_quality_data(I2C_bus))
+
+        # Light data
+        server.SimpleWebpageHandler.light_data = sensor.get_light_data(I2C_bus)
+
+        # Sound data
+        server.SimpleWebpageHandler.sound_data = sensor.get_sound_data(I2C_bus)
+
+        # Particle data
+        # This requires the connection of a particulate sensor (invalid
+        # values will be obtained if this sensor is not present).
+        # Also note that, due to the low pass filtering used, the
+        # particle data become valid after an initial initialization
+        # period of approximately one minute.
+        if sensor.PARTICLE_SENSOR != const.PARTICLE_SENSOR_OFF:
+            server.SimpleWebpageHandler.particle_data = (
+                sensor.get_particle_data(I2C_bus, sensor.PARTICLE_SENSOR))
+    except OSError:
+        server.SimpleWebpageHandler.metrics.record_bus_error()
+        continue
+    server.SimpleWebpageHandler.metrics.record_read_duration(
+        time.monotonic() - read_start)
 
     # Create the updated web page ready for client requests, passing
     # the current date and time for displaying with the data
@@ -129,33 +129,24 @@ class GraphViewerI2C(GraphViewer):
         self.putDataInBuffer(air_data, air_quality_data,
                              light_data, sound_data, particle_data)
 
-    def appendData(self, start_index, data):
-        """Add new data to the data buffer."""
-        for i, value in enumerate(data):
-            self.data_buffer[start_index + i].append(value)
-        return (start_index + len(data))
-
     def putDataInBuffer(self, air_data, air_quality_data, light_data,
                         sound_data, particle_data):
         """Store the data and also the time/date."""
-        i = 0
-        i = self.appendData(
-                i, [air_data['T'], air_data['P_Pa'],
-                    air_data['H_pc'], air_data['G_ohm']])
+        values = [air_data['T'], air_data['P_Pa'],
+                  air_data['H_pc'], air_data['G_ohm']]
         if (self.cycle_mode):
-            i = self.appendData(i, [air_quality_data['AQI'],
-                                    air_quality_data['CO2e'],
-                                    air_quality_data['bVOC'],
-                                    air_quality_data['AQI_accuracy']])
-        i = self.appendData(i, [light_data['illum_lux'], light_data['white']])
-        i = self.appendData(i, [sound_data['SPL_dBA']]
-                            + [sound_data['SPL_bands_dB'][i] for i in
-                            range(0, self.sound_band_number)]
-                            + [sound_data['peak_amp_mPa']])
+            values += [air_quality_data['AQI'], air_quality_data['CO2e'],
+                       air_quality_data['bVOC'],
+                       air_quality_data['AQI_accuracy']]
+        values += [light_data['illum_lux'], light_data['white']]
+        values += ([sound_data['SPL_dBA']]
+                   + [sound_data['SPL_bands_dB'][i] for i in
+                      range(0, self.sound_band_number)]
+                   + [sound_data['peak_amp_mPa']])
         if sensor.PARTICLE_SENSOR != const.PARTICLE_SENSOR_OFF:
-            i = self.appendData(
-                    i, [particle_data['duty_cycle_pc'],
-                        particle_data['concentration']])
+            values += [particle_data['duty_cycle_pc'],
+                       particle_data['concentration']]
+        self.data_buffer.append(values)
         self.time_data.append(datetime.now().timestamp())
 
 
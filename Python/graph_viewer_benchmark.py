@@ -0,0 +1,292 @@
+"""Benchmark of the graph viewer display, without a screen.
+
+This program measures the time taken to update and draw the graph viewer
+(see GraphViewer.py), using Qt's "offscreen" platform so that it runs on
+any computer, including a Linux server with no display. Data are added
+at a chosen rate, either simulated (random) data or data replayed from
+the files written by log_data_to_file.py, and the display is updated at
+the usual interval.
+
+Each test case has a data rate and a data buffer length. The buffers are
+filled before each test, so that full-size graphs are drawn. The time of
+each display update (including drawing), the processor use and the
+memory size are printed and saved to a JSON file. A previous results
+file can be given as a baseline, and this program then exits with an
+error status if the performance has become worse, so it can be used to
+check each change to the graph viewer code.
+
+This needs the psutil package, in addition to those for the graph
+viewer.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import os
+import sys
+import time
+import json
+import platform
+from datetime import datetime
+from pathlib import Path
+from subprocess import check_output, CalledProcessError
+import numpy as np
+import psutil
+# Use the offscreen platform unless another is chosen. This must be set
+# before Qt is imported.
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+from GraphViewer import GraphViewer  # noqa: E402
+import Raspberry_Pi.sensor_package.sensor_constants as const  # noqa: E402
+from Raspberry_Pi.sensor_package.log_archive import LogArchive  # noqa: E402
+
+#########################################################
+# USER-EDITABLE SETTINGS
+
+# The data: None for simulated data, or a directory of data files from
+# log_data_to_file.py, which are replayed (repeatedly, if necessary)
+data_file_directory = None
+
+# The test cases: each is (data rate, buffer length), where the data rate
+# is the number of sets of data added per second
+test_cases = [(1, 500), (50, 500), (50, 10000), (50, 100000)]
+
+# The number of data sources shown on each graph (see
+# graph_viewer_multiple.py), and the number of rows and columns of graphs
+series_count = 1
+graphs_vertical = 2
+graphs_horizontal = 2
+
+# The window size, in pixels
+window_width = 1280
+window_height = 800
+
+# The time for which results are recorded for each test case, after a
+# warm-up time in which the results are not used
+duration_seconds = 5
+warmup_seconds = 1
+
+# Results are saved to this file
+results_file = "graph_benchmark_results.json"
+
+# Give a previous results file here to compare with the new results. The
+# program exits with status 1 if the 99th percentile update time of any
+# test case has increased by more than allowed_change_pc.
+baseline_file = None
+allowed_change_pc = 10
+
+# END OF USER-EDITABLE SETTINGS
+#########################################################
+
+
+class BenchmarkViewer(GraphViewer):
+    """A graph viewer which displays simulated or replayed data."""
+
+    def __init__(self, buffer_length, data_rate, archive):
+        """Set up the graphs and fill the data buffers."""
+        super().__init__(buffer_length, const.PARTICLE_SENSOR_OFF, False,
+                         graphs_vertical, graphs_horizontal,
+                         None if series_count == 1 else
+                         [f"Source {i + 1}" for i in range(series_count)])
+        self.data_rate = data_rate
+        self.archive = archive
+        self.random = np.random.default_rng(1)
+        self.setDataRequired(True, False, True)
+        if archive is not None:
+            # The data file columns are in the same order as the variable
+            # names (see graph_viewer_log.py)
+            self.columns = [1 + i for i in self.data_name_index]
+            self.next_row = 0
+        self.latest_values = np.full(
+            (self.series_count, len(self.data_name_index)), 50.0)
+        self.added = 0
+        self.start_time = time.time()
+        self.addData(buffer_length, self.start_time - (buffer_length
+                                                       / data_rate))
+
+    def getDataFunction(self):
+        """Add the data which are due at the chosen data rate.
+
+        Returns True if new data were added, else returns False.
+        """
+        due = int((time.time() - self.start_time) * self.data_rate)
+        if due <= 0:
+            return False
+        self.start_time += due / self.data_rate
+        self.addData(due, self.start_time - (due / self.data_rate))
+        return True
+
+    def addData(self, count, first_time):
+        """Add sets of data to every series, starting at first_time."""
+        times = first_time + (np.arange(count) / self.data_rate)
+        for series in range(self.series_count):
+            if self.archive is None:
+                # A random walk from the previous values
+                values = (self.latest_values[series][:, np.newaxis]
+                          + np.cumsum(self.random.normal(
+                              size=(len(self.data_name_index), count)),
+                              axis=1))
+                self.latest_values[series] = values[:, -1]
+            else:
+                rows = (self.next_row + np.arange(count)) % len(self.archive)
+                self.next_row = (self.next_row + count) % len(self.archive)
+                values = np.nan_to_num(
+                    self.archive.rows(0, len(self.archive))[rows][
+                        :, self.columns].T)
+            self.data_buffers[series].extend(values)
+            self.time_buffers[series].extend(times)
+        self.added += count
+
+
+def time_statistics(times):
+    """Get time statistics in milliseconds, from a list in seconds."""
+    if not times:
+        return None
+    times = sorted(times)
+
+    def percentile(p):
+        # The nearest-rank method
+        index = max(0, round(p * len(times) / 100) - 1)
+        return round(times[index] * 1000, 3)
+
+    return {'mean': round(sum(times) * 1000 / len(times), 3),
+            'p50': percentile(50), 'p90': percentile(90),
+            'p99': percentile(99), 'max': percentile(100)}
+
+
+def run_test_case(app, data_rate, buffer_length, archive):
+    """Update the display for a fixed time and return the results."""
+    viewer = BenchmarkViewer(buffer_length, data_rate, archive)
+    viewer.resize(window_width, window_height)
+    viewer.show()
+    app.processEvents()
+    this_process = psutil.Process()
+    period = viewer.update_time_period_ms / 1000
+    start_time = time.perf_counter() + warmup_seconds
+    end_time = start_time + duration_seconds
+    update_times = []
+    late_updates = 0
+    rss_values = []
+    cpu_start = None
+    next_update = time.perf_counter()
+    while True:
+        now = time.perf_counter()
+        if now >= end_time:
+            break
+        if (cpu_start is None) and (now >= start_time):
+            cpu_start = this_process.cpu_times()
+            rss_values.append(this_process.memory_info().rss)
+            added_start = viewer.added
+        # Check for data and redraw the graphs, as the update timer does,
+        # then process the events, which includes drawing
+        viewer.updateLoop()
+        app.processEvents()
+        update_time = time.perf_counter() - now
+        if now >= start_time:
+            update_times.append(update_time)
+            if update_time > period:
+                late_updates += 1
+            if (len(update_times) % 50) == 0:
+                rss_values.append(this_process.memory_info().rss)
+        next_update += period
+        time.sleep(max(0, next_update - time.perf_counter()))
+    cpu_end = this_process.cpu_times()
+    rss_values.append(this_process.memory_info().rss)
+    added = viewer.added - added_start
+    viewer.close()
+    viewer.deleteLater()
+    app.processEvents()
+    cpu_seconds = ((cpu_end.user - cpu_start.user)
+                   + (cpu_end.system - cpu_start.system))
+    return {
+        'data_rate': data_rate, 'buffer_length': buffer_length,
+        'updates': len(update_times),
+        'updates_per_second': round(len(update_times) / duration_seconds,
+                                    1),
+        'late_updates': late_updates,
+        'data_added': added,
+        'update_ms': time_statistics(update_times),
+        'cpu_percent': round(100 * cpu_seconds / duration_seconds, 1),
+        'rss_MB': {'start': round(rss_values[0] / 1e6, 1),
+                   'max': round(max(rss_values) / 1e6, 1),
+                   'end': round(rss_values[-1] / 1e6, 1)}}
+
+
+def git_commit():
+    """Get the current git commit of this code, or None."""
+    try:
+        return check_output(['git', 'rev-parse', 'HEAD'],
+                            cwd=Path(__file__).parent,
+                            text=True).strip()
+    except (OSError, CalledProcessError):
+        return None
+
+
+def compare_with_baseline(results):
+    """Print a comparison with the baseline, and return True if worse."""
+    with open(baseline_file, 'r') as f:
+        baseline = json.load(f)
+    baseline_cases = {(case['data_rate'], case['buffer_length']): case
+                      for case in baseline['test_cases']}
+    worse = False
+    print(f"Compared with {baseline_file} (commit {baseline['commit']}):")
+    for case in results['test_cases']:
+        key = (case['data_rate'], case['buffer_length'])
+        if key not in baseline_cases:
+            continue
+        p99_change = 100 * ((case['update_ms']['p99']
+                             / baseline_cases[key]['update_ms']['p99']) - 1)
+        print(f"   {key[0]} data/s, buffer {key[1]}: 99th percentile "
+              f"update time {p99_change:+.1f} %")
+        if p99_change > allowed_change_pc:
+            print("   The update time has increased by more than the "
+                  "allowed change.")
+            worse = True
+    return worse
+
+
+def main():
+    archive = None
+    if data_file_directory is not None:
+        archive = LogArchive(data_file_directory)
+        if len(archive) == 0:
+            raise RuntimeError("No data files found in "
+                               + data_file_directory)
+    app = QApplication([])
+    case_results = []
+    for (data_rate, buffer_length) in test_cases:
+        print(f"Testing {data_rate} data/s with buffer length "
+              f"{buffer_length}, for {duration_seconds} s")
+        case = run_test_case(app, data_rate, buffer_length, archive)
+        case_results.append(case)
+        print(f"   {case['updates_per_second']} updates per second "
+              f"({case['late_updates']} late), update time (ms): "
+              + ", ".join(f"{k} {v}" for k, v in case['update_ms'].items()))
+        print(f"   processor use: {case['cpu_percent']} % (of one core), "
+              f"memory: {case['rss_MB']['max']} MB")
+    results = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'qt_platform': QApplication.platformName(),
+        'settings': {
+            'data': ("simulated" if data_file_directory is None
+                     else data_file_directory),
+            'series_count': series_count,
+            'graphs': [graphs_vertical, graphs_horizontal],
+            'window_size': [window_width, window_height],
+            'duration_seconds': duration_seconds},
+        'test_cases': case_results}
+    with open(results_file, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {results_file}")
+    if (baseline_file is not None) and compare_with_baseline(results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""Display MS430 data from the files written by log_data_to_file.py.
+
+This example runs on multiple operating systems (including Windows
+and Linux). It displays the same graphs as "graph_viewer_serial.py" and
+"graph_viewer_I2C.py", but the data are read from a directory of data
+files which were saved by the Raspberry Pi example "log_data_to_file.py"
+(or multiple_outputs.py).
+
+There are two modes:
+
+Browse: all of the data are shown, and any time range can be viewed by
+dragging and zooming (with the mouse wheel) on each graph. When a long
+time range is shown, each graph shows the minimum and maximum values in
+each small time interval, so that short peaks are still visible.
+
+Playback: the data from a chosen time range are replayed as if they
+were being measured, at a chosen speed.
+
+The data files are converted into a cache file, which is kept in the
+same directory, when this program is first run. This may take some time
+if there are many files, but afterwards only new data files are read.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+from datetime import datetime
+from PyQt5.QtWidgets import QApplication
+from GraphViewer import GraphViewer
+from DataSources import LogPlaybackSource
+import Raspberry_Pi.sensor_package.sensor_constants as const
+
+#########################################################
+# USER-EDITABLE SETTINGS
+
+# The directory containing the data files
+data_file_directory = "/home/pi/Desktop"
+
+# Choose browse mode (playback = False) or playback mode (playback = True)
+playback = False
+
+# Playback settings: the date and time at which to start and end, as
+# text like "2023-06-01 12:00", or None for the first/last data. The
+# speed is the number of seconds of data to replay per second.
+playback_start = None
+playback_end = None
+playback_speed = 100
+
+# Maximum number of values of each variable to display in playback mode:
+data_buffer_length = 500
+
+# Specify the particle sensor model (PPD42/SDS011/none) and temperature
+# units (Celsius/Fahrenheit) which were used when logging the data:
+particle_sensor_type = const.PARTICLE_SENSOR_OFF
+use_fahrenheit = False  # else uses Celsius
+
+# END OF USER-EDITABLE SETTINGS
+#########################################################
+
+
+class GraphViewerLog(GraphViewer):
+    """Display of MS430 data from data files, to browse or play back."""
+
+    def __init__(self, buffer_length, directory, playback, start=None,
+                 end=None, speed=1):
+        """Open the data files and choose the data to display.
+
+        playback: False to browse all data, or True to replay the data
+                  from start to end (datetime strings, or None)
+        speed: the number of seconds of data to replay per second
+        """
+        # The playback source reads the data files, and replays them in a
+        # background thread (see DataSources.py)
+        self.source = LogPlaybackSource(directory, start, end, speed)
+        self.archive = self.source.archive
+        self.playback = playback
+        # In browse mode, the graphs show data from the archive (see
+        # lineData()) and the buffer only holds the newest data
+        super().__init__(buffer_length if playback else 1,
+                         particle_sensor_type, use_fahrenheit)
+        self.setDataRequired(*self.source.data_required)
+        self.columns = self.source.columns
+        (first_time, last_time) = self.archive.time_range()
+        if playback:
+            self.finished_shown = False
+            self.source.start()
+        else:
+            self.view_changed = True
+            self.storeRows(len(self.archive) - 1, len(self.archive))
+            for item in self.plot_items:
+                item.sigXRangeChanged.connect(self.viewChanged)
+                self.showAllData(item)
+            self.setWindowTitle(
+                'Logged data from '
+                + datetime.fromtimestamp(first_time).strftime('%Y-%m-%d')
+                + ' to '
+                + datetime.fromtimestamp(last_time).strftime('%Y-%m-%d'))
+
+    def getDataFunction(self):
+        """Replay new data, or check for a change of the displayed times.
+
+        Returns True if the graphs need to be redrawn, else returns False.
+        """
+        if not self.playback:
+            if not self.view_changed:
+                return False
+            self.view_changed = False
+            # Redraw all graphs
+            self.drawn_data_count = [None] * len(self.drawn_data_count)
+            return True
+        finished = self.source.finished
+        batches = self.source.takeData()
+        for (times, values) in batches:
+            self.data_buffer.extend(values.T)
+            self.time_data.extend(times)
+        if (batches or (finished and not self.finished_shown)) and (
+                len(self.time_data) > 0):
+            self.finished_shown = finished
+            title = ('Playback of logged data: ' + datetime.fromtimestamp(
+                self.time_data.latest()[0]).strftime('%Y-%m-%d %H:%M:%S'))
+            if finished:
+                title += ' (finished)'
+            self.setWindowTitle(title)
+        return len(batches) > 0
+
+    def storeRows(self, first, end):
+        """Add rows of data from the archive to the data buffer."""
+        rows = self.archive.rows(first, end)
+        self.data_buffer.extend(rows[:, self.columns].T)
+        self.time_data.extend(rows[:, 0])
+
+    def lineData(self, plot_index, variable_index, series=0):
+        """Get the data to draw, in browse mode at a suitable detail level."""
+        if self.playback:
+            return super().lineData(plot_index, variable_index, series)
+        item = self.plot_items[plot_index]
+        (start, end) = item.viewRange()[0]
+        # Also get the data on either side of the visible time range, so
+        # that they are shown immediately when dragging the graph
+        width = end - start
+        points = max(int(item.getViewBox().width()), 100)
+        return self.archive.level_of_detail(
+            self.columns[variable_index], start - width, end + width,
+            3 * points)
+
+    def viewChanged(self):
+        """Record that a graph's time range has changed (browse mode)."""
+        self.view_changed = True
+
+    def showAllData(self, item):
+        """Show the full time range of the data on a graph."""
+        item.enableAutoRange(axis='x', enable=False)
+        item.setXRange(*self.archive.time_range(), padding=0.02)
+
+    def adjustAxes(self, item):
+        """Format the line graph axis settings."""
+        super().adjustAxes(item)
+        if not self.playback:
+            self.showAllData(item)
+
+    def closeEvent(self, event):
+        """Stop the playback."""
+        self.source.stop()
+        super().closeEvent(event)
+
+
+if __name__ == '__main__':
+    theApp = QApplication([])
+    gv = GraphViewerLog(data_buffer_length, data_file_directory, playback,
+                        playback_start, playback_end, playback_speed)
+    gv.start()
+    theApp.exec_()
@@ -0,0 +1,175 @@
+"""Real-time display of MS430 data from several sources on the same graphs.
+
+This example runs on multiple operating systems (including Windows and
+Linux). It displays the same graphs as "graph_viewer_serial.py", but
+with data from several sources shown together, in different colors, so
+that they can be compared. Each source can be:
+
+- a microcontroller board (e.g. Arduino, ESP8266) with an MS430, over
+  USB serial, as in "graph_viewer_serial.py";
+- a directory of data files from "log_data_to_file.py", replayed as in
+  "graph_viewer_log.py";
+- an MS430 connected to the Raspberry Pi I2C bus (Raspberry Pi only,
+  and only one such source), as in "graph_viewer_I2C.py".
+
+Each source is read in its own background thread, and has its own data
+buffer. All line graphs show the same time range, and the number of
+graphs can be chosen.
+"""
+
+#  Copyright 2020-2023 Metriful Ltd.
+#  Licensed under the MIT License - for further details see LICENSE.txt
+
+#  For code examples, datasheet and user guide, visit
+#  https://github.com/metriful/sensor
+
+import time
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+from GraphViewer import GraphViewer, dataNameIndex
+from DataSources import SerialSource, LogPlaybackSource, I2CSource
+import Raspberry_Pi.sensor_package.sensor_constants as const
+
+#########################################################
+# USER-EDITABLE SETTINGS
+
+# The data sources, each with a name to display. The type of each is
+# "serial" (with the serial port name), "log" (with the data file
+# directory, and optional start, end and speed as in graph_viewer_log.py)
+# or "I2C" (Raspberry Pi only).
+sources = [
+    dict(type="serial", name="Living room", port="/dev/ttyACM0"),
+    dict(type="serial", name="Bedroom", port="/dev/ttyACM1"),
+    # dict(type="log", name="Last week", directory="/home/pi/Desktop",
+    #      start="2023-06-01 00:00", speed=1),
+    # dict(type="I2C", name="Raspberry Pi"),
+]
+
+# The number of rows and columns of graphs:
+graphs_vertical = 2
+graphs_horizontal = 3
+
+# Maximum number of values of each variable to store and display, for
+# each source:
+data_buffer_length = 500
+
+# Specify the particle sensor model (PPD42/SDS011/none) and temperature
+# units (Celsius/Fahrenheit) used by the sources:
+particle_sensor_type = const.PARTICLE_SENSOR_OFF
+use_fahrenheit = False  # else uses Celsius
+
+# END OF USER-EDITABLE SETTINGS
+#########################################################
+
+
+def createSource(settings):
+    """Create a data source object from a dictionary of settings."""
+    if settings['type'] == "serial":
+        return SerialSource(settings['port'], settings['name'])
+    elif settings['type'] == "log":
+        return LogPlaybackSource(
+            settings['directory'], settings.get('start'),
+            settings.get('end'), settings.get('speed', 1), settings['name'])
+    elif settings['type'] == "I2C":
+        return I2CSource(settings['name'])
+    raise ValueError("Data source type not recognized")
+
+
+class GraphViewerMultiple(GraphViewer):
+    """Real-time display of MS430 data from several sources."""
+
+    def __init__(self, buffer_length, sources, graphs_vertical,
+                 graphs_horizontal):
+        """Start reading data from each source (see DataSources.py)."""
+        super().__init__(buffer_length, particle_sensor_type,
+                         use_fahrenheit, graphs_vertical, graphs_horizontal,
+                         [source.name for source in sources])
+        self.sources = sources
+        # The graphs are set up when the variables of all sources are
+        # known, or after this time if some sources have not sent data
+        self.startup_wait_seconds = 10
+        self.start_time = time.monotonic()
+        self.started = False
+        # For each source: the data buffer positions of its variables, and
+        # the positions in its data, once known
+        self.buffer_positions = [None] * len(sources)
+        self.source_positions = [None] * len(sources)
+        for source in sources:
+            source.start()
+
+    def getDataFunction(self):
+        """Store the new data from all sources.
+
+        Returns True if new data were obtained, else returns False.
+        """
+        if (not self.started) and (not self.setUpVariables()):
+            return False
+        new_data = False
+        for (series, source) in enumerate(self.sources):
+            if source.data_required is None:
+                continue
+            try:
+                batches = source.takeData()
+            except Exception as e:
+                self.setWindowTitle(f'Error from {source.name}: {e}')
+                continue
+            for (times, values) in batches:
+                self.storeData(series, times, values)
+                new_data = True
+        return new_data
+
+    def setUpVariables(self):
+        """Display all variables which are available from any source.
+
+        Returns True if this has been done, or False if waiting for the
+        first data from the sources.
+        """
+        required = [source.data_required for source in self.sources
+                    if source.data_required is not None]
+        if (not required) or ((len(required) < len(self.sources)) and (
+                (time.monotonic() - self.start_time)
+                < self.startup_wait_seconds)):
+            return False
+        self.setDataRequired(*[any(r[k] for r in required)
+                               for k in range(3)])
+        self.setWindowTitle('Indoor Environment Data')
+        self.started = True
+        return True
+
+    def storeData(self, series, times, values):
+        """Add data from a source, with NaN for variables it does not have."""
+        if self.buffer_positions[series] is None:
+            variables = dataNameIndex(*self.sources[series].data_required)
+            positions = [(self.data_name_index.index(v), n)
+                         for (n, v) in enumerate(variables)
+                         if v in self.data_name_index]
+            self.buffer_positions[series] = [p[0] for p in positions]
+            self.source_positions[series] = [p[1] for p in positions]
+        data = np.full((len(self.data_name_index), len(times)), np.nan)
+        data[self.buffer_positions[series]] = (
+            values[:, self.source_positions[series]].T)
+        self.data_buffers[series].extend(data)
+        self.time_buffers[series].extend(times)
+
+    def lineData(self, plot_index, variable_index, series=0):
+        """Get the (time, value) arrays to draw on a line graph."""
+        if ((self.buffer_positions[series] is None)
+                or (variable_index not in self.buffer_positions[series])):
+            # The source does not have this variable
+            return (np.zeros(0), np.zeros(0))
+        return super().lineData(plot_index, variable_index, series)
+
+    def closeEvent(self, event):
+        """Stop reading data from the sources."""
+        for source in self.sources:
+            source.stop()
+        super().closeEvent(event)
+
+
+if __name__ == '__main__':
+    theApp = QApplication([])
+    gv = GraphViewerMultiple(data_buffer_length,
+                             [createSource(s) for s in sources],
+                             graphs_vertical, graphs_horizontal)
+    gv.start()
+    theApp.exec_()
@@ -31,10 +31,9 @@ parameter below.
 #  For code examples, datasheet and user guide, visit
 #  https://github.com/metriful/sensor
 
-import serial
-from datetime import datetime
 from PyQt5.QtWidgets import QApplication
 from GraphViewer import GraphViewer
+from DataSources import SerialSource
 import Raspberry_Pi.sensor_package.sensor_constants as const
 
 #########################################################
@@ -59,60 +58,46 @@ use_fahrenheit = False  # else uses Celsius
 
 
 class GraphViewerSerial(GraphViewer):
-    """Real-time display of MS430 data, from a host device over USB serial."""
+    """Real-time display of MS430 data, from a host device over USB serial.
+
+    The serial port is read by a background thread (see DataSources.py),
+    which converts each line of text into a row of numbers. The GUI takes
+    all waiting rows at each update, and redraws the graphs once, however
+    many rows have arrived.
+    """
 
     def __init__(self, buffer_length, serial_port):
         """Set up the serial interface to the MS430 host."""
         super().__init__(buffer_length, particle_sensor_type, use_fahrenheit)
-        self.serial_port = serial.Serial(
-            port=serial_port,
-            baudrate=9600,
-            parity=serial.PARITY_NONE,
-            stopbits=serial.STOPBITS_ONE,
-            bytesize=serial.EIGHTBITS,
-            timeout=0.02)
-        self.initial_discard_lines = 2
-        self.startup_line_count = 0
+        self.source = SerialSource(serial_port)
         self.startup = True
+        self.source.start()
 
-    def serialStartupCompleted(self, data_strings):
-        """Check that the number of values received is correct."""
-        if not self.startup:
-            return True
-        if self.startup_line_count < self.initial_discard_lines:
-            self.startup_line_count += 1
+    def getDataFunction(self):
+        """Store all new rows of serial data from the reader thread.
+
+        Returns True if new data were obtained, else returns False.
+        """
+        try:
+            batches = self.source.takeData()
+        except Exception as e:
+            self.setWindowTitle('Serial port error: ' + str(e))
             return False
-        self.startup = False
-        if len(data_strings) == 15:
-            self.setDataRequired(False, False, True)
-        elif len(data_strings) == 18:
-            self.setDataRequired(False, True, True)
-        elif len(data_strings) == 19:
-            self.setDataRequired(True, False, True)
-        elif len(data_strings) == 22:
-            self.setDataRequired(True, True, True)
-        else:
-            raise RuntimeError('Unexpected number of data columns')
-        self.setWindowTitle('Indoor Environment Data')
+        if not batches:
+            return False
+        if self.startup:
+            self.startup = False
+            self.setDataRequired(*self.source.data_required)
+            self.setWindowTitle('Indoor Environment Data')
+        for (times, values) in batches:
+            self.data_buffer.extend(values.T)
+            self.time_data.extend(times)
         return True
 
-    def getDataFunction(self):
-        """Check for new serial data."""
-        response = self.serial_port.readline()
-        if (not ((response is None) or (len(response) == 0))):
-            try:
-                data_strings = response.decode('utf-8').split()
-                if self.serialStartupCompleted(data_strings):
-                    if (len(data_strings) == len(self.data_name_index)):
-                        # Convert strings to numbers and store the data
-                        float_data = [float(s) for s in data_strings]
-                        for i in range(len(self.data_name_index)):
-                            self.data_buffer[i].append(float_data[i])
-                        self.time_data.append(datetime.now().timestamp())
-                        return True
-            except Exception:
-                pass
-        return False  # no new data
+    def closeEvent(self, event):
+        """Stop the reader thread and close the serial port."""
+        self.source.stop()
+        super().closeEvent(event)
 
 
 if __name__ == '__main__':